@@ -0,0 +1,242 @@
+# history backfill for newly tracked wallets - pages getSignaturesForAddress backwards at low priority,
+# checkpointing in mongo after every page so a restart carries on where it stopped
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database.db import db
+from decode_pool import decode_pool
+from metrics import metrics
+from rate_governor import BACKFILL
+from tracing import tracer
+
+BACKFILL_DEPTH = int(os.getenv('BACKFILL_DEPTH', 1000)) # signatures to go back per wallet, 0 = no limit
+BACKFILL_DAYS = float(os.getenv('BACKFILL_DAYS', 0)) # stop at transactions older than this, 0 = no limit
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', 4)) # getTransaction calls in flight per job
+BACKFILL_PAGE_SIZE = 100 # signatures per page (the rpc max is 1000)
+BACKFILL_CLAIM_SECONDS = 120 # a job's claim is renewed every page, then it's up for grabs again
+BACKFILL_MAX_ATTEMPTS = 5 # failed pages in a row before a job is given up on
+BACKFILL_IDLE_SECONDS = 5 # sleep when there's nothing to do
+
+BACKFILL_TXS = metrics.counter(
+    "solspear_backfill_transactions_total", "historical transactions handled by the backfill", ("result",)
+)
+
+
+def created_at(job):
+    """unix seconds the job was enqueued (mongo hands back naive utc)"""
+    return job["created_at"].replace(tzinfo=timezone.utc).timestamp()
+
+
+class BackfillJobs:
+    """backfill_jobs collection: one doc per address, pending -> running -> done/failed"""
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+
+    @property
+    def collection(self):
+        return db.db.backfill_jobs
+
+    async def enqueue(self, addresses):
+        """start a backfill for each address that hasn't had one (re-tracking doesn't start over)"""
+        now = datetime.now(timezone.utc)
+        for address in addresses:
+            try:
+                await self.collection.update_one(
+                    {"_id": address},
+                    {"$setOnInsert": {
+                        "status": "pending",
+                        "before": None, # oldest signature done so far, paging continues below it
+                        "fetched": 0,
+                        "stored": 0,
+                        "attempts": 0,
+                        "claimed_until": now,
+                        "created_at": now
+                    }},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                pass # two commands raced, one job is enough
+
+    async def claim(self):
+        """take the oldest job nobody is working on, None if there isn't one"""
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {"status": {"$in": ["pending", "running"]}, "claimed_until": {"$lte": now}},
+            {"$set": {
+                "status": "running",
+                "claimed_by": self.worker_id,
+                "claimed_until": now + timedelta(seconds=BACKFILL_CLAIM_SECONDS)
+            }},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def checkpoint(self, job, **fields):
+        """save progress and renew the claim, False if someone else has the job now"""
+        now = datetime.now(timezone.utc)
+        result = await self.collection.update_one(
+            {"_id": job["_id"], "claimed_by": self.worker_id},
+            {"$set": {**fields, "claimed_until": now + timedelta(seconds=BACKFILL_CLAIM_SECONDS), "updated_at": now}}
+        )
+        return result.matched_count == 1
+
+    async def finish(self, job, status="done", error=None):
+        await self.collection.update_one(
+            {"_id": job["_id"], "claimed_by": self.worker_id},
+            {"$set": {"status": status, "error": error, "finished_at": datetime.now(timezone.utc)}}
+        )
+
+    async def retry_later(self, job, seconds, error=None):
+        """hand the job back for later, failed once it's out of attempts"""
+        # counted in mongo, the job doc we claimed with is stale once a page has been checkpointed
+        updated = await self.collection.find_one_and_update(
+            {"_id": job["_id"], "claimed_by": self.worker_id},
+            {"$inc": {"attempts": 1}, "$set": {
+                "error": error,
+                "claimed_until": datetime.now(timezone.utc) + timedelta(seconds=seconds)
+            }},
+            projection={"attempts": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated and updated["attempts"] >= BACKFILL_MAX_ATTEMPTS:
+            await self.finish(job, "failed", error)
+
+
+class Backfiller:
+    """works through backfill jobs one at a time, every rpc call at BACKFILL priority"""
+
+    def __init__(self, solana, can_write=None, jobs=None):
+        self.solana = solana # rpc_pool.PooledClient
+        self.can_write = can_write or (lambda: True)
+        self.jobs = jobs or backfill_jobs
+
+    async def run(self):
+        while True:
+            try:
+                job = await self.jobs.claim() if self.can_write() else None
+                if job is None:
+                    await asyncio.sleep(BACKFILL_IDLE_SECONDS)
+                    continue
+                with tracer.span("backfill", wallet=job["_id"][:8]):
+                    await self.run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"error in backfill: {e}")
+                await asyncio.sleep(BACKFILL_IDLE_SECONDS)
+
+    async def run_job(self, job):
+        address = job["_id"]
+        before = job.get("before")
+        from_tip = job.get("from_tip", False)
+        if before is None and not from_tip:
+            # start below whatever live polling stored first, so history never gets ahead of the cursor
+            newest = await db.get_last_transaction(address)
+            if newest:
+                before = newest["signature"]
+            else:
+                # nothing stored yet (no activity, or ingestion that doesn't store an anchor), start at the
+                # newest signature instead. sticky, our own rows would look like an anchor on a retry
+                from_tip = True
+        # from the tip, anything since the wallet was tracked is left to live ingestion so it still alerts
+        newer_than = created_at(job) if from_tip else None
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=BACKFILL_DAYS)).timestamp() if BACKFILL_DAYS else None
+        fetched, stored = job.get("fetched", 0), job.get("stored", 0)
+
+        while self.can_write():
+            limit = BACKFILL_PAGE_SIZE
+            if BACKFILL_DEPTH:
+                limit = min(limit, BACKFILL_DEPTH - fetched)
+                if limit <= 0:
+                    break
+            try:
+                response = await self.solana.get_signatures_for_address(
+                    address, before=before, limit=limit, priority=BACKFILL
+                )
+            except Exception as e:
+                await self.jobs.retry_later(job, 30, error=str(e))
+                return
+            page = list(response.value or [])
+            done = len(page) < limit
+            last = str(page[-1].signature) if page else before
+            if newer_than is not None:
+                page = [tx for tx in page if tx.block_time is None or tx.block_time <= newer_than]
+            if cutoff is not None:
+                in_range = [tx for tx in page if tx.block_time is None or tx.block_time >= cutoff]
+                done = done or len(in_range) < len(page)
+                page = in_range
+            if page:
+                page_stored, failed = await self.store_page(address, page)
+                stored += page_stored
+                if failed:
+                    # keep the checkpoint above this page, the retry only refetches what isn't stored yet
+                    await self.jobs.checkpoint(job, stored=stored, from_tip=from_tip)
+                    await self.jobs.retry_later(job, 30, error=f"{failed} of {len(page)} transactions failed to fetch")
+                    return
+                fetched += len(page)
+            before = last
+            # progress only moves once the page is stored, a crash redoes at most one page
+            if not await self.jobs.checkpoint(
+                job, before=before, fetched=fetched, stored=stored, attempts=0, from_tip=from_tip
+            ):
+                return # claim expired and someone else picked it up
+            if done:
+                break
+        else:
+            return # lost the leader lease, the claim runs out and the next leader resumes
+
+        await self.jobs.finish(job)
+        print(f"backfill done for {address}: {fetched} signatures, {stored} stored")
+
+    async def store_page(self, address, page):
+        """fetch + decode one page of signatures and store the ones involving the wallet -> (stored, failed)"""
+        signatures = [str(tx.signature) for tx in page]
+        have = await db.existing_signatures(address, signatures)
+        todo = [tx for tx in page if str(tx.signature) not in have]
+        if not todo:
+            return 0, 0
+
+        semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+        async def fetch(tx):
+            async with semaphore:
+                try:
+                    return await self.solana.get_transaction_raw(
+                        tx.signature, max_supported_transaction_version=0, encoding="json", priority=BACKFILL
+                    )
+                except Exception as e:
+                    print(f"backfill: error fetching {tx.signature}: {e}")
+                    return None
+        raws = await asyncio.gather(*(fetch(tx) for tx in todo))
+
+        fetched = [(tx, raw) for tx, raw in zip(todo, raws) if raw is not None]
+        BACKFILL_TXS.inc(len(todo) - len(fetched), result="error")
+        decoded = await decode_pool.decode([(raw, address) for _, raw in fetched])
+
+        count = 0
+        for (tx, _), (tx_type, skip_reason, flows) in zip(fetched, decoded):
+            if tx_type is None:
+                BACKFILL_TXS.inc(result="skipped")
+                continue
+            stored = await db.insert_transaction({
+                "wallet_address": address,
+                "signature": str(tx.signature),
+                "slot": tx.slot,
+                "block_time": tx.block_time,
+                "err": tx.err is not None,
+                "memo": None,
+                "tx_type": tx_type,
+                "flows": flows,
+                "processed": True, # history, nobody gets alerted about it
+                "backfill": True
+            })
+            count += 1 if stored else 0
+        BACKFILL_TXS.inc(count, result="stored")
+        return count, len(todo) - len(fetched)
+
+
+# create single instance of the job store
+backfill_jobs = BackfillJobs()
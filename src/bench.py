@@ -0,0 +1,301 @@
+# micro-benchmarks for the decode / swap-parsing hot paths, compared against a baseline kept in the repo
+#
+#   python src/bench.py                                   # run, compare to bench_data/baseline.json, exit 1 on regression
+#   python src/bench.py --save                            # record the current numbers as the baseline (commit it)
+#   python src/bench.py --fixtures-from spike.ndjson      # rebuild fixtures from a RECORD_TO capture
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, 'bench_data', 'fixtures.json')
+BASELINE = os.path.join(HERE, 'bench_data', 'baseline.json')
+
+BENCH_TOLERANCE = float(os.getenv('BENCH_TOLERANCE', 0.25)) # slow down / extra allocation allowed before failing
+MIN_TIME = 0.1 # seconds per timing round
+ROUNDS = 11 # median of
+ALLOC_SLACK = 256 # bytes of allocation noise we never fail on
+
+# fixed mix of the same kind of work the hot paths do (json, dict lookups, string ops). it's timed right
+# next to every benchmark round and the gate compares ops per calibration op, so a busy or throttled
+# machine slows both sides of the ratio instead of failing the gate
+CALIBRATION_DOC = json.dumps({
+    "keys": [f"{i:044d}" for i in range(24)],
+    "balances": list(range(24)),
+    "logs": [f"Program log: Instruction: Transfer {i}" for i in range(12)]
+})
+
+
+def calibration():
+    data = json.loads(CALIBRATION_DOC)
+    index = {key: i for i, key in enumerate(data["keys"])}
+    total = sum(data["balances"][index[key]] for key in data["keys"] if key.endswith(("1", "3", "5")))
+    return total + sum(1 for line in data["logs"] if "Transfer" in line.split(": ")[-1])
+
+
+def load_fixtures(path=FIXTURES):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_benchmarks(fixtures):
+    """[(name, op, is_async)] - one op processes one fixture (or one fixture set for the tiny helpers)"""
+    from v2_bot import WalletMonitor
+    from decode_pool import decode_transaction, classify_transaction, account_keys
+    from metadata_router import metadata_router
+
+    monitor = WalletMonitor()
+    metadata_router.providers = [] # never hit the network from a benchmark
+    # warm the metadata cache for every address the parsers could look up, we time parsing not http
+    for logs in fixtures["logs"].values():
+        for address in monitor.extract_token_addresses(logs):
+            monitor.token_metadata_cache[address] = {"symbol": address[:4], "decimals": 6}
+
+    benchmarks = []
+    for name, logs in fixtures["logs"].items():
+        benchmarks.append((f"extract_token_addresses[{name}]", lambda logs=logs: monitor.extract_token_addresses(logs), False))
+    for name, logs in fixtures["logs"].items():
+        benchmarks.append((f"parse_swap_details[{name}]", lambda logs=logs: monitor.parse_swap_details(logs), True))
+
+    amounts = fixtures["amounts"]
+    def parse_amounts():
+        for swap_info in amounts:
+            monitor.parse_swap_amounts(swap_info)
+    benchmarks.append((f"parse_swap_amounts[x{len(amounts)}]", parse_amounts, False))
+    # the error path on its own, so the happy path numbers aren't mostly exception handling
+    invalid = fixtures.get("amounts_invalid") or []
+    if invalid:
+        def parse_invalid_amounts():
+            for swap_info in invalid:
+                monitor.parse_swap_amounts(swap_info)
+        benchmarks.append((f"parse_swap_amounts_invalid[x{len(invalid)}]", parse_invalid_amounts, False))
+
+    pubkeys = fixtures["pubkeys"]
+    def validate_pubkeys():
+        for address in pubkeys:
+            monitor.is_valid_pubkey(address)
+    benchmarks.append((f"is_valid_pubkey[x{len(pubkeys)}]", validate_pubkeys, False))
+
+    # the per-transaction work check_transactions does: decode the rpc response, then filter it
+    for tx in fixtures["transactions"]:
+        raw, address = tx["response"], tx["address"]
+        result = json.loads(raw)["result"]
+        meta, keys = result.get("meta"), account_keys(result)
+        benchmarks.append((
+            f"decode_transaction[{tx['name']}]",
+            lambda raw=raw, address=address: decode_transaction(raw, address), False
+        ))
+        benchmarks.append((
+            f"classify_transaction[{tx['name']}]",
+            lambda meta=meta, keys=keys, address=address: classify_transaction(meta, keys, address), False
+        ))
+    return benchmarks
+
+
+def time_op(op, is_async, loop):
+    """(ops/sec, ops per calibration op), medians over ROUNDS rounds of about MIN_TIME each"""
+    async def run_async(n):
+        started = time.perf_counter()
+        for _ in range(n):
+            await op()
+        return time.perf_counter() - started
+
+    def run_sync(n):
+        started = time.perf_counter()
+        for _ in range(n):
+            op()
+        return time.perf_counter() - started
+
+    def calibrated_count(run):
+        """calls that make a round take about MIN_TIME"""
+        n = 1
+        while run(n) < MIN_TIME / 10:
+            n *= 10
+        return max(1, int(n * MIN_TIME / max(run(n), 1e-9)))
+
+    def run_calibration(n):
+        started = time.perf_counter()
+        for _ in range(n):
+            calibration()
+        return time.perf_counter() - started
+
+    run = (lambda n: loop.run_until_complete(run_async(n))) if is_async else run_sync
+    n, n_cal = calibrated_count(run), calibrated_count(run_calibration)
+    rates, scores = [], []
+    for _ in range(ROUNDS):
+        rate = n / run(n)
+        scores.append(rate / (n_cal / run_calibration(n_cal)))
+        rates.append(rate)
+    median = lambda values: sorted(values)[len(values) // 2]
+    return median(rates), median(scores)
+
+
+def peak_alloc(op, is_async, loop, samples=5):
+    """median peak bytes allocated during one call (tracemalloc, so only python-level allocations)"""
+    async def measure_async():
+        sizes = []
+        for _ in range(samples):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await op()
+            sizes.append(tracemalloc.get_traced_memory()[1] - before)
+        return sizes
+
+    def measure_sync():
+        sizes = []
+        for _ in range(samples):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            op()
+            sizes.append(tracemalloc.get_traced_memory()[1] - before)
+        return sizes
+
+    tracemalloc.start()
+    try:
+        sizes = loop.run_until_complete(measure_async()) if is_async else measure_sync()
+    finally:
+        tracemalloc.stop()
+    return sorted(sizes)[len(sizes) // 2]
+
+
+def run_benchmarks(fixtures, only=None):
+    loop = asyncio.new_event_loop()
+    results = {}
+    logging.disable(logging.CRITICAL) # time the code, not writing error lines to stderr
+    try:
+        for name, op, is_async in build_benchmarks(fixtures):
+            if only and only not in name:
+                continue
+            ops, score = time_op(op, is_async, loop)
+            results[name] = {
+                "ops_per_sec": round(ops, 1),
+                "score": round(score, 5), # ops per calibration op, what the gate compares
+                "peak_bytes": peak_alloc(op, is_async, loop),
+            }
+    finally:
+        logging.disable(logging.NOTSET)
+        loop.close()
+    return results
+
+
+def compare(results, baseline, tolerance=BENCH_TOLERANCE):
+    """print the table, return the names that regressed past the tolerance"""
+    base = baseline.get("results", {}) if baseline else {}
+    regressions = []
+    print(f"{'benchmark':<48}{'ops/s':>14}{'peak B':>10}{'score':>10}{'base':>10}{'change':>9}  status")
+    for name, result in results.items():
+        ops, score, peak = result["ops_per_sec"], result["score"], result["peak_bytes"]
+        if name not in base or "score" not in base[name]:
+            print(f"{name:<48}{ops:>14,.0f}{peak:>10,}{score:>10.4g}{'-':>10}{'-':>9}  new")
+            continue
+        base_score, base_peak = base[name]["score"], base[name]["peak_bytes"]
+        change = score / base_score - 1 if base_score else 0.0
+        status = "ok"
+        if score < base_score * (1 - tolerance):
+            status = "SLOWER"
+        elif peak > base_peak * (1 + tolerance) and peak - base_peak > ALLOC_SLACK:
+            status = f"ALLOCS ({base_peak:,} B before)"
+        if status != "ok":
+            regressions.append(name)
+        print(f"{name:<48}{ops:>14,.0f}{peak:>10,}{score:>10.4g}{base_score:>10.4g}{change:>+9.0%}  {status}")
+    return regressions
+
+
+def environment():
+    return {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system()}
+
+
+def fixtures_from_capture(capture, path=FIXTURES, per_kind=3):
+    """swap the log and transaction fixtures for real ones from a RECORD_TO capture"""
+    from recorder import load
+    fixtures = load_fixtures(path)
+    logs = {}
+    counts = {"jupiter": 0, "raydium": 0, "other": 0}
+    transactions = []
+    pubkeys = set()
+    for record in load(capture):
+        if record["kind"] == "ws":
+            try:
+                data = json.loads(record["frame"])
+            except json.JSONDecodeError:
+                continue
+            if data.get("method") != "logsNotification":
+                continue
+            frame_logs = data["params"]["result"]["value"].get("logs") or []
+            text = " ".join(frame_logs)
+            kind = "jupiter" if "JUP6LkbZbjS1jKKwapdHNy74zcZ3tLUZoi5QNyVTaV4" in text else "raydium" if "SwapEvent" in text else "other"
+            if counts[kind] < per_kind:
+                counts[kind] += 1
+                logs[f"capture_{kind}_{counts[kind]}"] = frame_logs
+        elif record["kind"] == "rpc" and record["method"] == "getTransaction" and len(transactions) < per_kind * 2:
+            result = json.loads(record["response"]).get("result")
+            if not result:
+                continue
+            keys = result["transaction"]["message"]["accountKeys"]
+            pubkeys.update(keys[:4])
+            transactions.append({"name": f"capture_{len(transactions) + 1}", "address": keys[0], "response": record["response"]})
+
+    if logs:
+        fixtures["logs"] = logs
+    if transactions:
+        fixtures["transactions"] = transactions
+    if pubkeys:
+        # keep the invalid samples, the valid ones come from the capture
+        invalid = [k for k in fixtures["pubkeys"] if not 32 <= len(k) <= 44]
+        fixtures["pubkeys"] = sorted(pubkeys)[:8] + invalid
+    fixtures["_note"] = f"recorded from {os.path.basename(capture)}"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixtures, f, indent=1)
+        f.write("\n")
+    print(f"wrote {len(logs)} log and {len(transactions)} transaction fixtures to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hot path micro-benchmarks with a regression gate")
+    parser.add_argument("--save", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--only", help="only run benchmarks whose name contains this")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE)
+    parser.add_argument("--fixtures-from", metavar="CAPTURE", help="rebuild fixtures from a RECORD_TO capture and exit")
+    args = parser.parse_args()
+
+    if args.fixtures_from:
+        fixtures_from_capture(args.fixtures_from)
+        return
+
+    results = run_benchmarks(load_fixtures(), args.only)
+    baseline = None
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != environment():
+            print(f"note: baseline was recorded on {baseline.get('environment')}, this is {environment()}")
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        merged = dict(baseline.get("results", {})) if baseline and args.only else {}
+        merged.update(results)
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": merged}, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print(f"baseline saved to {BASELINE}")
+        return
+    if baseline is None:
+        print("\nno baseline to compare against, run with --save and commit bench_data/baseline.json")
+        sys.exit(1)
+    missing = [name for name in results if "score" not in baseline.get("results", {}).get(name, {})]
+    if missing:
+        print(f"\n{len(missing)} benchmark(s) have no baseline yet, run with --save to add them")
+        sys.exit(1)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# block-scan ingestion - follows every slot once and matches transactions against all tracked wallets
+# rpc cost is per slot instead of per wallet, so it's the better engine for big watchlists
+import asyncio
+import base64
+import logging
+import os
+from base58 import b58decode, b58encode
+from datetime import datetime, timezone
+from database.db import db
+from rpc_pool import rpc_pool, RpcError, last_endpoint
+from decode_pool import token_flows
+from metrics import metrics
+
+BLOCK_SCAN_CONCURRENCY = int(os.getenv('BLOCK_SCAN_CONCURRENCY', 4)) # getBlock calls in flight at once
+BLOCK_SCAN_MAX_LAG = int(os.getenv('BLOCK_SCAN_MAX_LAG', 150)) # if we fall further behind than this, skip ahead
+BLOCK_SCAN_REWIND_SLOTS = 20 # on (re)start also go back at least this far, in case the last save was a bit behind
+BLOCK_SCAN_SAVE_SECONDS = 2 # how often the scan position is saved to bot_state, a restart resumes from it
+BLOCK_SCAN_STATE_ID = "block_scanner" # bot_state doc holding the position
+BLOCK_SCAN_RETRY_SECONDS = int(os.getenv('BLOCK_SCAN_RETRY_SECONDS', 60)) # keep retrying a failed slot this long
+WALLET_REFRESH_SECONDS = 30 # how often the tracked wallet set is reloaded from mongo
+
+# getBlock errors for slots that were skipped or pruned, nothing to scan there
+SKIPPED_SLOT_ERRORS = {-32007, -32009}
+# "block not available" - usually just not there yet at confirmed, so it's retried like any other failure
+BLOCK_NOT_AVAILABLE = -32004
+
+MISSED_SLOTS = metrics.counter(
+    "solspear_block_scan_missed_slots_total", "slots the block scanner gave up on", ("reason",)
+)
+
+
+def _read_compact_u16(data, offset):
+    """decode solana's compact-u16 length prefix, returns (value, new offset)"""
+    value = 0
+    for shift in (0, 7, 14):
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            break
+    return value, offset
+
+
+def static_account_keys(raw_tx):
+    """pull the raw 32-byte static account keys out of a serialized (legacy or v0) transaction"""
+    num_sigs, offset = _read_compact_u16(raw_tx, 0)
+    offset += 64 * num_sigs
+    if raw_tx[offset] & 0x80: # versioned message prefix
+        offset += 1
+    offset += 3 # message header
+    num_keys, offset = _read_compact_u16(raw_tx, offset)
+    return [raw_tx[offset + 32 * i: offset + 32 * (i + 1)] for i in range(num_keys)]
+
+
+def first_signature(raw_tx):
+    """the transaction's signature (the first one), base58 encoded"""
+    _, offset = _read_compact_u16(raw_tx, 0)
+    return b58encode(raw_tx[offset:offset + 64]).decode()
+
+
+class BlockScanner:
+    def __init__(self, on_match, pool=rpc_pool, is_active=None, on_gap=None):
+        # on_match(wallet_doc, tx_data, tx_type, endpoint) is awaited for every transaction touching a tracked wallet
+        self.on_match = on_match
+        # optional on_gap(slots), called with slots that won't be scanned (gave up retrying, skipped ahead,
+        # or too far behind the saved position after a restart)
+        self.on_gap = on_gap
+        # optional check, while it's False we only keep the wallet set warm (standby replica)
+        self.is_active = is_active or (lambda: True)
+        self.pool = pool
+        self.tracked_raw = {} # raw 32-byte pubkey -> list of tracked_wallets docs
+        self.tracked_b58 = {} # same, keyed by base58 for address-table (loaded) addresses
+        self.last_slot = None
+        self.last_saved = 0.0 # monotonic time the position was last saved
+        self.retry = {} # slot -> monotonic time it first failed, retried every pass until BLOCK_SCAN_RETRY_SECONDS
+        self.stopping = False # set on shutdown, the slots being scanned finish and run() returns
+
+    async def refresh_wallets(self):
+        """reload the tracked wallet set from mongo"""
+        raw, b58 = {}, {}
+        async for wallet in db.db.tracked_wallets.find({"channel_id": {"$exists": True}}):
+            try:
+                key = b58decode(wallet['wallet_address'])
+            except Exception:
+                continue
+            raw.setdefault(key, []).append(wallet)
+            b58.setdefault(wallet['wallet_address'], []).append(wallet)
+        self.tracked_raw, self.tracked_b58 = raw, b58
+
+    async def get_slot(self):
+        return await self.pool.request("getSlot", [{"commitment": "confirmed"}])
+
+    async def get_block(self, slot):
+        """fetch a block with base64 transactions, or None if the slot was skipped"""
+        try:
+            return await self.pool.request("getBlock", [slot, {
+                "encoding": "base64",
+                "transactionDetails": "full",
+                "maxSupportedTransactionVersion": 0,
+                "rewards": False,
+                "commitment": "confirmed"
+            }])
+        except RpcError as e:
+            if e.code in SKIPPED_SLOT_ERRORS:
+                return None
+            raise
+
+    def match_block(self, slot, block):
+        """yield (wallet_doc, tx_data, tx_type) for every transaction in the block touching a tracked wallet"""
+        tracked_raw, tracked_b58 = self.tracked_raw, self.tracked_b58
+        block_time = block.get("blockTime")
+        for entry in block.get("transactions") or []:
+            raw_tx = base64.b64decode(entry["transaction"][0])
+            meta = entry.get("meta") or {}
+
+            # hash lookups on raw bytes, no base58 work for the 99.9% of transactions we don't care about
+            static_keys = static_account_keys(raw_tx)
+            matched = {key: tracked_raw[key] for key in static_keys if key in tracked_raw}
+            loaded = meta.get("loadedAddresses") or {}
+            loaded_keys = (loaded.get("writable") or []) + (loaded.get("readonly") or [])
+            for address in loaded_keys:
+                if address in tracked_b58:
+                    matched[address] = tracked_b58[address]
+            if not matched:
+                continue
+
+            inner = meta.get("innerInstructions") or []
+            pre, post = meta.get("preBalances") or [], meta.get("postBalances") or []
+            # Skip if it's a tiny system program transfer
+            if not inner and pre and post and abs(pre[0] - post[0]) < 10000:
+                continue
+            tx_type = "Swap/Transfer" if inner else "Transaction"
+
+            signature = first_signature(raw_tx)
+            detected_at = datetime.now(timezone.utc)
+            keys = [b58encode(key).decode() for key in static_keys] + loaded_keys
+            for wallets in matched.values():
+                flows = token_flows(meta, keys, wallets[0]['wallet_address'])
+                for wallet in wallets:
+                    yield wallet, {
+                        "wallet_address": wallet['wallet_address'],
+                        "signature": signature,
+                        "slot": slot,
+                        "block_time": block_time,
+                        "detected_at": detected_at,
+                        "err": meta.get("err") is not None,
+                        "memo": None,
+                        "tx_type": tx_type,
+                        "flows": flows,
+                        "processed": False
+                    }, tx_type
+
+    async def _scan_slot(self, slot, semaphore):
+        """scan one slot, False if it has to be tried again"""
+        async with semaphore:
+            try:
+                block = await self.get_block(slot)
+            except Exception as e:
+                if getattr(e, "code", None) != BLOCK_NOT_AVAILABLE and slot not in self.retry:
+                    logging.error(f"error fetching block {slot}: {e}") # once, it's retried every pass
+                return False
+        if not block:
+            return True
+        endpoint = last_endpoint.get()
+        scanned = True
+        for wallet, tx_data, tx_type in self.match_block(slot, block):
+            try:
+                await self.on_match(wallet, tx_data, tx_type, endpoint)
+            except Exception as e:
+                # rescanning repeats the matches that did go through, the outbox drops those alerts
+                logging.error(f"error handling match {tx_data['signature']}: {e}")
+                scanned = False
+        return scanned
+
+    async def load_position(self):
+        """last saved scan position (every slot up to it was scanned or given up on), None if never saved"""
+        doc = await db.db.bot_state.find_one({"_id": BLOCK_SCAN_STATE_ID})
+        return (doc or {}).get("last_slot")
+
+    async def save_position(self):
+        """persist where a restart or the next leader should carry on, failed slots included"""
+        position = min(self.retry) - 1 if self.retry else self.last_slot
+        await db.db.bot_state.update_one(
+            {"_id": BLOCK_SCAN_STATE_ID},
+            {"$set": {"last_slot": position, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        self.last_saved = asyncio.get_running_loop().time()
+
+    async def resume(self, tip):
+        """where to start after a restart or takeover: the saved position, anything too old to catch up is a gap"""
+        start = tip - BLOCK_SCAN_REWIND_SLOTS
+        saved = await self.load_position()
+        if saved is None:
+            return start # first run, nothing to resume
+        if tip - saved > BLOCK_SCAN_MAX_LAG:
+            logging.warning(f"block scanner resuming {tip - saved} slots behind, skipping ahead")
+            self._missed(range(saved + 1, start + 1), "restart")
+            return start
+        return min(saved, start)
+
+    def _missed(self, slots, reason):
+        """slots we're not going to scan, logged and handed to on_gap so they can be caught up another way"""
+        if not slots:
+            return
+        MISSED_SLOTS.inc(len(slots), reason=reason)
+        logging.error(f"block scanner missed {len(slots)} slots ({reason}), {slots[0]}-{slots[-1]}")
+        if self.on_gap:
+            try:
+                self.on_gap(slots)
+            except Exception as e:
+                logging.error(f"error handling block scan gap: {e}")
+
+    async def scan(self, slots, semaphore):
+        """scan slots, failed ones go into the retry set, ones that kept failing too long are given up on"""
+        results = await asyncio.gather(*(self._scan_slot(slot, semaphore) for slot in slots))
+        now = asyncio.get_running_loop().time()
+        for slot, scanned in zip(slots, results):
+            if scanned:
+                self.retry.pop(slot, None)
+            else:
+                self.retry.setdefault(slot, now)
+        expired = sorted(slot for slot, failed_at in self.retry.items() if now - failed_at > BLOCK_SCAN_RETRY_SECONDS)
+        for slot in expired:
+            del self.retry[slot]
+        self._missed(expired, "retries")
+
+    async def run(self, poll_interval=0.4):
+        """follow confirmed slots until stopping is set"""
+        semaphore = asyncio.Semaphore(BLOCK_SCAN_CONCURRENCY)
+        last_refresh = 0
+        loop = asyncio.get_running_loop()
+        while not self.stopping:
+            try:
+                if loop.time() - last_refresh > WALLET_REFRESH_SECONDS:
+                    await self.refresh_wallets()
+                    last_refresh = loop.time()
+
+                if not self.is_active():
+                    # standby, whoever leads now resumes from the saved position
+                    self.last_slot = None
+                    self.retry.clear()
+                    await asyncio.sleep(poll_interval)
+                    continue
+
+                tip = await self.get_slot()
+                if self.last_slot is None:
+                    self.last_slot = await self.resume(tip)
+                elif tip - self.last_slot > BLOCK_SCAN_MAX_LAG:
+                    logging.warning(f"block scanner {tip - self.last_slot} slots behind, skipping ahead")
+                    self._missed(range(self.last_slot + 1, tip), "lag")
+                    self.last_slot = tip - 1
+                # new slots plus the ones that failed before, last_slot only tracks what's been tried
+                slots = sorted(self.retry) + list(range(self.last_slot + 1, tip + 1))
+                if slots:
+                    await self.scan(slots, semaphore)
+                    self.last_slot = max(self.last_slot, tip)
+                if loop.time() - self.last_saved > BLOCK_SCAN_SAVE_SECONDS:
+                    await self.save_position()
+            except Exception as e:
+                logging.error(f"error in block scanner: {e}")
+            await asyncio.sleep(poll_interval)
+
+        # clean shutdown, the next start picks up exactly here
+        if self.last_slot is not None and self.is_active():
+            try:
+                await self.save_position()
+            except Exception as e:
+                logging.error(f"error saving block scanner position: {e}")
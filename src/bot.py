@@ -4,17 +4,39 @@ from discord.ext import commands
 import os
 from dotenv import load_dotenv
 from database.db import db  # import our database connection
+from database.outbox import outbox  # durable queue for discord notifications
+from command_sync import CommandSyncer  # hash-gated slash command syncing
+from block_scanner import BlockScanner  # slot-following ingestion for large watchlists
+from poller import WalletPoller  # per-wallet polling ingestion
+from database.leases import LeaderLease  # so only one replica runs ingestion
 from base58 import b58decode  # for validating solana addresses
 from discord.ext import tasks  # for creating background tasks
-from solana.rpc.api import Client  # solana blockchain api client
-from solders.pubkey import Pubkey  # for converting wallet address strings to Pubkey objects
-from solders.signature import Signature  # for converting signature strings to Signature objects
+from rpc_pool import rpc_pool, PooledClient  # solana rpc endpoint pool
+from metrics import metrics, POLL_TICK_SECONDS, POLL_STAGE_SECONDS  # prometheus-style /metrics endpoint
+from latency import latency_tracker  # block time -> discord delivery latency
+from tracing import tracer, SamplingProfiler  # spans + on-demand profiler for admins
+from decode_pool import decode_pool  # optional process pool for transaction decoding
+from backfill import Backfiller, backfill_jobs  # history for newly tracked wallets
+from history import HistoryView  # /history pages
+from event_stream import event_stream  # local sse/ndjson feed of the same alerts
+from shutdown import SHUTDOWN_DEADLINE, within, on_stop_signal  # draining on the way down
+from digest import digester, digest_settings, build_digest_embed, DIGEST_WINDOW_SECONDS, DIGEST_THRESHOLD, DIGEST_MAX_WINDOW, DIGEST_LARGE_SOL  # batched alerts for busy wallets
 import asyncio
+import io
+import re
+import threading
+import socket
+import time
+import uuid
 from datetime import datetime, timezone
 
 # load environment variables from .env file
 load_dotenv()
 
+# "poll" = check each tracked wallet every tick, "blockscan" = scan every block for tracked wallets,
+# "workers" = sharded worker.py processes do the ingestion
+INGESTION_MODE = os.getenv('INGESTION_MODE', 'poll')
+
 class SolSpearBot(commands.Bot):
     def __init__(self):
         # set up all intents we need
@@ -23,157 +45,260 @@ class SolSpearBot(commands.Bot):
         intents.guilds = True  # needed for guild/server related commands
         super().__init__(command_prefix='!', intents=intents)
         
-        # initialize solana client for blockchain interactions
-        self.solana = Client("https://api.mainnet-beta.solana.com")
+        # initialize solana client for blockchain interactions, spread over the configured rpc endpoints
+        self.solana = PooledClient(rpc_pool)
+
+        # only the replica holding this lease runs ingestion, the others stay on warm standby
+        self.leader = LeaderLease("ingestion", f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}")
+        self.leader.on_change = self.on_leader_change
+
+        # polls tracked wallets for new transactions
+        self.poller = WalletPoller(self.solana, can_write=lambda: self.leader.is_leader)
+
+        # skips command syncs when nothing changed
+        self.command_syncer = CommandSyncer(self)
 
     async def setup_hook(self):
         # connect to database before bot starts
         print('connecting to database...')
         await db.connect()
         print('connected to database!')
+
+        # expose /metrics locally, and the event stream if EVENT_STREAM_PORT is set
+        await metrics.serve()
+        event_stream.restore()
+        await event_stream.serve()
+
+        # SIGTERM (docker stop, systemd) gets the same graceful close as ctrl-c
+        on_stop_signal(lambda: asyncio.create_task(self.close()))
         
-        # force sync slash commands globally
-        print('syncing commands globally...')
+        # sync slash commands globally, only if the command tree changed since last boot
         try:
-            await self.tree.sync()
-            print(f'synced {len(self.tree.get_commands())} commands!')
+            if await self.command_syncer.sync_if_changed():
+                print(f'synced {len(self.tree.get_commands())} commands!')
+            else:
+                print('commands unchanged, skipping global sync')
             print('available commands:')
             for cmd in self.tree.get_commands():
                 print(f'- /{cmd.name}: {cmd.description}')
         except Exception as e:
             print(f'failed to sync commands: {e}')
 
-        # start transaction monitoring
-        self.check_transactions.start()
+        # start transaction monitoring, either polling per wallet or scanning every block
+        # ("workers" leaves ingestion to separate worker.py processes, this process only delivers)
+        if INGESTION_MODE == "workers":
+            print('ingestion handled by worker processes')
+        elif INGESTION_MODE == "blockscan":
+            self.leader.start()
+            self.block_scanner = BlockScanner(
+                self.handle_block_match, is_active=lambda: self.leader.is_leader, on_gap=self.on_block_gap
+            )
+            self.block_scan_task = asyncio.create_task(self.block_scanner.run())
+        else:
+            self.leader.start()
+            self.check_transactions.start()
+        if INGESTION_MODE != "workers":
+            # history for new wallets, low priority and only on the leader
+            self.backfiller = Backfiller(self.solana, can_write=lambda: self.leader.is_leader)
+            self.backfill_task = asyncio.create_task(self.backfiller.run())
+        # start delivering notifications, picks up anything left in the outbox from before a restart
+        self.deliver_notifications.start()
 
     @tasks.loop(seconds=10) #check for new transactions every 10 seconds
     async def check_transactions(self):
         try:
             # get all wallets we're currently tracking
-            tracked_wallets = await db.db.tracked_wallets.find({}).to_list(length=None)
-
-            for wallet in tracked_wallets:
-                wallet_pubkey = Pubkey.from_string(wallet['wallet_address'])
-                
-                # get last processed signature for this wallet
-                last_sig = await db.db.transactions.find_one(
-                    {"wallet_address": wallet['wallet_address']},
-                    sort=[("slot", -1)]  # Sort by slot instead of timestamp
-                )
+            with POLL_STAGE_SECONDS.time(stage="mongo_read"):
+                tracked_wallets = await db.db.tracked_wallets.find({}).to_list(length=None)
 
-                # For first time tracking, just get the latest transaction
-                if not last_sig:
-                    response = self.solana.get_signatures_for_address(
-                        wallet_pubkey,
-                        limit=1  # only get most recent
-                    )
-                    
-                    if response and hasattr(response, 'value') and response.value:
-                        tx = response.value[0]  # Most recent transaction
-                        tx_data = {
-                            "wallet_address": wallet['wallet_address'],
-                            "signature": str(tx.signature),
-                            "slot": tx.slot,
-                            "err": tx.err is not None,
-                            "processed": False
-                        }
-                        await db.db.transactions.insert_one(tx_data)
-                    continue
+            if not self.leader.is_leader:
+                # standby: keep wallets and cursors warm so a takeover starts polling right away
+                await self.poller.warm(tracked_wallets)
+                return
+            with POLL_TICK_SECONDS.time(), tracer.span("check_transactions", wallets=len(tracked_wallets)):
+                await self.poller.poll(tracked_wallets)
 
-                # For subsequent checks, get only new transactions
-                try:
-                    response = self.solana.get_signatures_for_address(
-                        wallet_pubkey,
-                        until=Signature.from_string(last_sig['signature']),  # Use until instead of before
-                        limit=5  # reduced limit to minimize spam
-                    )
-                except Exception as e:
-                    print(f"Error getting signatures: {e}")
-                    continue
+        except Exception as e:
+            print(f"error in transaction monitoring: {e}")
 
-                if not response or not hasattr(response, 'value') or not response.value:
-                    continue
+    async def on_leader_change(self, is_leader):
+        """start polling straight away when we take over instead of waiting for the next tick"""
+        if is_leader and self.check_transactions.is_running():
+            self.check_transactions.restart()
+
+    async def handle_block_match(self, wallet, tx_data, tx_type, endpoint=None):
+        """downstream handling for transactions found by the block scanner"""
+        if not self.leader.is_leader:
+            return # lease lapsed mid-block, the new leader rescans it
+        await outbox.enqueue_alert(wallet, tx_data, tx_type, path="blockscan", endpoint=endpoint)
+        await db.insert_transaction(tx_data)
+
+    def on_block_gap(self, slots):
+        """the block scanner gave up on some slots, a poll pass over every wallet picks up what was in them"""
+        self.gap_pending = True
+        if not getattr(self, 'gap_task', None) or self.gap_task.done():
+            self.gap_task = asyncio.create_task(self.catch_up_gaps())
+
+    async def catch_up_gaps(self):
+        # gaps found while a pass is running get one more pass
+        while getattr(self, 'gap_pending', False) and self.leader.is_leader:
+            self.gap_pending = False
+            try:
+                tracked_wallets = await db.db.tracked_wallets.find({"channel_id": {"$exists": True}}).to_list(length=None)
+                await self.poller.warm(tracked_wallets) # the scanner stored newer txs than the poller has seen
+                with tracer.span("block_gap_catch_up", wallets=len(tracked_wallets)):
+                    await self.poller.poll(tracked_wallets)
+            except Exception as e:
+                print(f"error catching up missed slots: {e}")
 
-                # Process transactions (they're already in newest-first order)
-                for tx in response.value:  # Remove reversed() since we want newest first
+    @check_transactions.before_loop
+    async def before_check_transactions(self):
+        #wait for bot to be ready before monitoring starts
+        await self.wait_until_ready()
+
+    @tasks.loop(seconds=2) #deliver queued notifications every 2 seconds
+    async def deliver_notifications(self):
+        try:
+            # keep draining while there's a backlog
+            while batch := await outbox.claim_batch():
+                delivered, failed, held = [], [], {}
+                for notification in batch:
+                    # stream consumers get every event straight away, digest or not
+                    event_stream.publish_notification(notification)
+                    channel = self.get_channel(int(notification['channel_id']))
+                    if not channel:
+                        # channel is gone, nothing left to deliver to
+                        delivered.append(notification)
+                        continue
+                    # busy wallets in digest channels get batched into one message per window
+                    hold = await digester.route(notification)
+                    if hold:
+                        held.setdefault(hold, []).append(notification)
+                        continue
                     try:
-                        # Get full transaction details with version support
-                        tx_details = self.solana.get_transaction(
-                            tx.signature,
-                            max_supported_transaction_version=0,
-                            encoding="json"  # Changed from jsonParsed to json
-                        )
-                        
-                        if not tx_details or not tx_details.value:
-                            print(f"Skipping transaction {tx.signature}: No transaction details")
-                            continue
-
-                        # Get transaction info
-                        tx_value = tx_details.value
-                        
-                        # Check if transaction has the required data
-                        if not hasattr(tx_value, 'transaction'):
-                            print(f"Skipping transaction {tx.signature}: No transaction data")
-                            continue
-
-                        # Extract account keys and check if our wallet is involved
-                        if hasattr(tx_value, 'meta') and tx_value.meta:
-                            account_keys = [str(key) for key in tx_value.transaction.message.account_keys]
-                            if wallet['wallet_address'] not in account_keys:
-                                continue
-                            
-                            # Skip if it's a tiny system program transfer
-                            if (
-                                len(tx_value.meta.inner_instructions or []) == 0  # No inner instructions (simple transfer)
-                                and hasattr(tx_value.meta, 'pre_balances')  # Has balance info
-                                and hasattr(tx_value.meta, 'post_balances')  # Has balance info
-                                and abs(tx_value.meta.pre_balances[0] - tx_value.meta.post_balances[0]) < 10000  # Less than 0.00001 SOL
-                            ):
-                                continue
-
-                        # prepare transaction data
-                        tx_data = {
-                            "wallet_address": wallet['wallet_address'],
-                            "signature": str(tx.signature),
-                            "slot": tx.slot,
-                            "err": tx.err is not None,
-                            "memo": None,
-                            "processed": False
-                        }
-                        
-                        # save transaction to db
-                        await db.db.transactions.insert_one(tx_data)
-                        
-                        # send notification to the wallet's private channel
-                        channel = self.get_channel(int(wallet['channel_id']))
-                        if channel:
-                            # Determine if it's a swap/transfer based on error status
-                            tx_type = "Transaction"
-                            if hasattr(tx_value, 'meta') and tx_value.meta:
-                                if len(tx_value.meta.inner_instructions or []) > 0:
-                                    tx_type = "Swap/Transfer"
-
-                            await channel.send(
-                                f"🔔 New {tx_type} detected!\n"
-                                f"Signature: `{tx_data['signature']}`\n"
-                                f"Status: {'✅ Success' if not tx_data['err'] else '❌ Failed'}\n"
-                                f"View transaction: https://solscan.io/tx/{tx_data['signature']}"
-                            )
-                            
+                        with POLL_STAGE_SECONDS.time(stage="send"), tracer.span("discord.send", channel=channel.id):
+                            await channel.send(notification['content'])
+                        delivered.append(notification)
                     except Exception as e:
-                        print(f"Error processing transaction {tx.signature}: {str(e)}")
-                        continue
+                        print(f"error delivering notification {notification['_id']}: {e}")
+                        failed.append(notification)
+
+                for (digest_key, flush_at), notifications in held.items():
+                    await outbox.hold_for_digest(notifications, digest_key, flush_at)
+                await self.finish_delivery(delivered, failed)
+                if failed:
+                    break # let the failed ones back off before trying again
+
+            await self.flush_digests()
+            digester.forget_idle()
 
         except Exception as e:
-            print(f"error in transaction monitoring: {e}")
-    
-    @check_transactions.before_loop
-    async def before_check_transactions(self):
-        #wait for bot to be ready before monitoring starts
+            print(f"error delivering notifications: {e}")
+
+    async def flush_digests(self):
+        """send one embed per wallet for every digest whose window has closed"""
+        while batch := await outbox.claim_due_digests():
+            digests = {}
+            for notification in batch:
+                digests.setdefault(notification['digest_key'], []).append(notification)
+
+            delivered, failed = [], []
+            for notifications in digests.values():
+                channel = self.get_channel(int(notifications[0]['channel_id']))
+                if not channel:
+                    delivered.extend(notifications)
+                    continue
+                try:
+                    embed = build_digest_embed(notifications[0]['wallet_address'], notifications)
+                    with POLL_STAGE_SECONDS.time(stage="send"), tracer.span("discord.send", channel=channel.id, digest=len(notifications)):
+                        await channel.send(embed=embed)
+                    delivered.extend(notifications)
+                except Exception as e:
+                    print(f"error delivering digest {notifications[0]['digest_key']}: {e}")
+                    failed.extend(notifications)
+
+            await self.finish_delivery(delivered, failed, digest=True)
+            if failed:
+                break
+
+    async def finish_delivery(self, delivered, failed, digest=False):
+        """ack/release a pass, record latency and flag the stored transactions as notified"""
+        await outbox.ack(delivered)
+        await outbox.release(failed)
+
+        # block time -> detection -> delivery latency for everything that went out. digests sit out their
+        # window on purpose, so they get their own stage instead of dragging deliver p95/p99 up
+        delivered_at = datetime.now(timezone.utc)
+        stage = "digest" if digest else "deliver"
+        for notification in delivered:
+            latency_tracker.record_event(notification, delivered_at=delivered_at, deliver_stage=stage)
+
+        # one update per wallet
+        by_wallet = {}
+        for notification in delivered:
+            if notification.get('signature'):
+                by_wallet.setdefault(notification['wallet_address'], []).append(notification['signature'])
+        for wallet_address, signatures in by_wallet.items():
+            await db.mark_processed(wallet_address, signatures)
+
+    @deliver_notifications.before_loop
+    async def before_deliver_notifications(self):
         await self.wait_until_ready()
 
+    async def backfill_guild_ids(self):
+        """wallets tracked before fair-share polling have no guild_id, fill it in from their channel"""
+        try:
+            missing = await db.db.tracked_wallets.find(
+                {"guild_id": {"$exists": False}, "channel_id": {"$exists": True}},
+                projection={"channel_id": 1}
+            ).to_list(length=None)
+            by_guild = {}
+            for wallet in missing:
+                channel = self.get_channel(int(wallet['channel_id']))
+                if channel and getattr(channel, 'guild', None):
+                    by_guild.setdefault(str(channel.guild.id), []).append(wallet['_id'])
+            for guild_id, ids in by_guild.items():
+                await db.db.tracked_wallets.update_many({"_id": {"$in": ids}}, {"$set": {"guild_id": guild_id}})
+            if by_guild:
+                print(f"backfilled guild_id on {sum(len(ids) for ids in by_guild.values())} tracked wallets")
+        except Exception as e:
+            print(f"error backfilling guild ids: {e}")
+
     async def close(self):
-        # cleanup when bot shuts down
+        # cleanup when bot shuts down: stop taking in new work, finish what's in flight (bounded by
+        # SHUTDOWN_DEADLINE), snapshot what's worth keeping, then tear everything down
+        if getattr(self, 'shutting_down', False):
+            return await super().close()
+        self.shutting_down = True
+        deadline = time.monotonic() + SHUTDOWN_DEADLINE
+
+        # stop intake, a poll tick that's running gets to finish so its alerts are queued and its cursors stored
+        self.check_transactions.stop()
+        if getattr(self, 'backfill_task', None):
+            self.backfill_task.cancel() # checkpointed per page
+        if getattr(self, 'gap_task', None):
+            self.gap_task.cancel() # the next leader rewinds and rescans
+        if self.check_transactions.get_task():
+            await within(deadline, self.check_transactions.get_task(), "finishing the poll tick")
+        if getattr(self, 'block_scan_task', None):
+            self.block_scanner.stopping = True # slots in flight finish
+            await within(deadline, self.block_scan_task, "finishing the block scan")
+
+        # then deliver whatever is queued while we still have the gateway
+        self.deliver_notifications.stop()
+        if self.deliver_notifications.get_task():
+            await within(deadline, self.deliver_notifications.get_task(), "finishing the delivery pass")
+        await within(deadline, self.deliver_notifications(), "delivering queued notifications")
+
+        event_stream.save()
+        try:
+            await self.leader.release() # let a standby take over right away
+        except Exception as e:
+            print(f"error releasing leader lease: {e}")
+        await rpc_pool.close()
+        decode_pool.close()
+        await metrics.stop()
+        await event_stream.stop()
         await db.close()
         await super().close()
 
@@ -185,13 +310,9 @@ bot = SolSpearBot()
 @bot.event
 async def on_ready():
     print(f'{bot.user} has connected to Discord!')
-    # force sync commands for each guild
-    for guild in bot.guilds:
-        try:
-            await bot.tree.sync(guild=guild)
-            print(f'synced commands for guild: {guild.name}')
-        except Exception as e:
-            print(f'failed to sync commands for guild {guild.name}: {e}')
+    # sync guild commands in the background, only for guilds whose commands changed
+    bot.command_syncer.sync_guilds_in_background(bot.guilds)
+    asyncio.create_task(bot.backfill_guild_ids())
 
 
 #slash command to create a private channel for the user
@@ -332,6 +453,7 @@ async def track_wallet(interaction: discord.Interaction, wallet_address: str):
                 {
                     "$set": {
                         "channel_id": str(channel.id),
+                        "guild_id": str(interaction.guild.id),
                         "created_at": discord.utils.utcnow().isoformat()
                     }
                 }
@@ -342,10 +464,14 @@ async def track_wallet(interaction: discord.Interaction, wallet_address: str):
                 "user_id": str(interaction.user.id),
                 "wallet_address": wallet_address,
                 "channel_id": str(channel.id),
+                "guild_id": str(interaction.guild.id), # tenant for fair-share polling
                 "created_at": discord.utils.utcnow().isoformat(),
                 "threshold": [] #for future threshold alerts, come back to this later
             })
 
+        # pull in its history in the background
+        await backfill_jobs.enqueue([wallet_address])
+
         # send success message
         await interaction.response.send_message(
             f"now tracking wallet {wallet_address}! check {channel.mention} for updates",
@@ -366,6 +492,299 @@ async def track_wallet(interaction: discord.Interaction, wallet_address: str):
             pass
 
 
+#bulk import, for onboarding a whole list of wallets at once
+BULK_TRACK_MAX = 1000 # most wallets accepted in one import (shared_channel imports, one channel each is capped by the guild)
+BULK_PROGRESS_EVERY = 10 # save tracking docs + update the progress message every n channels created
+GUILD_CHANNEL_LIMIT = 500 # discord's cap on channels (categories included) per guild
+INTERACTION_TOKEN_SECONDS = 14 * 60 # followups stop working 15 min after the command, keep a margin
+
+@bot.tree.command(name='trackbulk', description='track a list of solana wallets at once')
+@app_commands.describe(
+    wallets='wallet addresses separated by spaces, commas or new lines',
+    file='a .txt or .csv file with wallet addresses',
+    shared_channel='post every wallet in this import to one shared channel'
+)
+async def track_wallets_bulk(
+    interaction: discord.Interaction,
+    wallets: str = None,
+    file: discord.Attachment = None,
+    shared_channel: bool = False
+):
+    # channel creation can take a while, defer so discord doesn't time us out
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    token_expires = time.monotonic() + INTERACTION_TOKEN_SECONDS
+
+    async def reply(content):
+        """followup while the interaction token still works, a dm after that"""
+        try:
+            if time.monotonic() < token_expires:
+                await interaction.followup.send(content, ephemeral=True)
+            else:
+                await interaction.user.send(content)
+        except discord.HTTPException as e:
+            print(f"couldn't report bulk import to {interaction.user.id}: {e}")
+
+    pending = [] # channels made for wallets whose tracking docs aren't saved yet
+    tracked = [] # wallets saved so far, these stay tracked even if a later batch fails
+    try:
+        # gather raw text from the argument and/or the attachment
+        raw = wallets or ""
+        if file:
+            raw += "\n" + (await file.read()).decode("utf-8", errors="ignore")
+
+        # split on anything that can't be part of a base58 address, keep order and drop duplicates
+        candidates = list(dict.fromkeys(t for t in re.split(r'[^1-9A-HJ-NP-Za-km-z]+', raw) if t))
+        if not candidates:
+            await reply("no wallet addresses found, pass them as text or attach a file")
+            return
+        if len(candidates) > BULK_TRACK_MAX:
+            await reply(f"thats too many wallets, max is {BULK_TRACK_MAX} per import")
+            return
+
+        # validate everything in one pass
+        valid, invalid = [], []
+        for address in candidates:
+            try:
+                (valid if len(b58decode(address)) == 32 else invalid).append(address)
+            except Exception:
+                invalid.append(address)
+
+        # one query for everything this user already tracks from the list
+        user_id = str(interaction.user.id)
+        guild_id = str(interaction.guild.id)
+        existing = await db.db.tracked_wallets.find(
+            {"user_id": user_id, "wallet_address": {"$in": valid}},
+            projection={"wallet_address": 1, "channel_id": 1}
+        ).to_list(length=None)
+        already_tracked = {w["wallet_address"] for w in existing if w.get("channel_id")}
+        channelless = {w["wallet_address"] for w in existing if not w.get("channel_id")} # channel was deleted
+        to_track = [a for a in valid if a not in already_tracked]
+
+        if not to_track:
+            await reply(f"nothing new to track ({len(already_tracked)} already tracked, {len(invalid)} invalid)")
+            return
+
+        # one channel per wallet has to fit in what's left of the guild's channel cap
+        room = GUILD_CHANNEL_LIMIT - len(interaction.guild.channels)
+        needed = 1 if shared_channel else len(to_track)
+        if needed > room:
+            await reply(
+                f"this server only has room for {max(room, 0)} more channels and the import needs {needed}, "
+                "import fewer wallets or use shared_channel"
+            )
+            return
+
+        overwrites = {
+            interaction.guild.default_role: discord.PermissionOverwrite(read_messages=False),
+            interaction.guild.me: discord.PermissionOverwrite(read_messages=True),
+            interaction.user: discord.PermissionOverwrite(read_messages=True),
+        }
+
+        async def save(batch):
+            """store tracking docs for wallets whose channel exists, so a later failure can't undo them"""
+            now = discord.utils.utcnow().isoformat()
+            new_docs = [
+                {
+                    "user_id": user_id,
+                    "wallet_address": address,
+                    "channel_id": str(channel.id),
+                    "guild_id": guild_id,
+                    "created_at": now,
+                    "threshold": []
+                }
+                for address, channel in batch if address not in channelless
+            ]
+            if new_docs:
+                await db.db.tracked_wallets.insert_many(new_docs, ordered=False)
+            for address, channel in batch:
+                if address in channelless:
+                    await db.db.tracked_wallets.update_one(
+                        {"user_id": user_id, "wallet_address": address},
+                        {"$set": {"channel_id": str(channel.id), "guild_id": guild_id, "created_at": now}}
+                    )
+            addresses = [address for address, _ in batch]
+            await backfill_jobs.enqueue(addresses)
+            tracked.extend(addresses)
+            pending.clear()
+
+        shared = None
+        if shared_channel:
+            shared = await interaction.guild.create_text_channel(
+                name=f"wallet-bulk-{interaction.user.name}",
+                overwrites=overwrites,
+                reason=f"shared wallet tracking channel for {len(to_track)} wallets"
+            )
+            pending.extend((address, shared) for address in to_track)
+            await save(list(pending))
+        else:
+            progress = await interaction.followup.send(f"creating channels... 0/{len(to_track)}", ephemeral=True, wait=True)
+            for i, address in enumerate(to_track, 1):
+                channel = await interaction.guild.create_text_channel(
+                    name=f"wallet-{address[:4]}-{address[-4:]}",
+                    overwrites=overwrites,
+                    reason=f"wallet tracking channel for {address}"
+                )
+                pending.append((address, channel))
+                if i % BULK_PROGRESS_EVERY == 0 or i == len(to_track):
+                    await save(list(pending))
+                    if time.monotonic() < token_expires: # editing needs the interaction token too
+                        await progress.edit(content=f"creating channels... {i}/{len(to_track)}")
+
+        summary = f"now tracking {len(tracked)} wallets"
+        if shared:
+            summary += f" in {shared.mention}"
+        if already_tracked:
+            summary += f", skipped {len(already_tracked)} already tracked"
+        if invalid:
+            summary += f", skipped {len(invalid)} invalid: " + ", ".join(f"`{a}`" for a in invalid[:10])
+            if len(invalid) > 10:
+                summary += " ..."
+        await reply(summary)
+
+    except Exception as e:
+        print(f"error bulk tracking wallets: {e}")
+        message = "oops something went wrong while importing your wallets, please try again later"
+        if tracked:
+            message += f" ({len(tracked)} were already set up and are being tracked, run it again to pick up the rest)"
+        await reply(message)
+        # clean up channels from the batch that never got saved, saved ones are tracked and stay
+        for channel in {channel.id: channel for _, channel in pending}.values():
+            try:
+                await channel.delete()
+            except:
+                pass
+
+
+#paged history of a tracked wallet, straight from what we've stored
+@bot.tree.command(name='history', description='recent activity of a wallet you track')
+async def wallet_history(interaction: discord.Interaction, wallet_address: str):
+    try:
+        tracked = await db.db.tracked_wallets.find_one(
+            {"user_id": str(interaction.user.id), "wallet_address": wallet_address},
+            projection={"_id": 1}
+        )
+        if not tracked:
+            await interaction.response.send_message(
+                "you're not tracking that wallet, use /track first",
+                ephemeral=True
+            )
+            return
+
+        view = HistoryView(wallet_address, interaction.user.id)
+        embed = await view.load()
+        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+
+    except Exception as e:
+        print(f"error loading wallet history: {e}")
+        await interaction.response.send_message(
+            "oops something went wrong loading that history, please try again later",
+            ephemeral=True
+        )
+
+
+#admin only: alert latency percentiles per ingestion path and rpc endpoint
+@bot.tree.command(name='latency', description='alert latency from block time to discord (admin only)')
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def alert_latency(interaction: discord.Interaction):
+    rows = latency_tracker.summary()
+    if not rows:
+        await interaction.response.send_message("no alerts delivered since startup yet", ephemeral=True)
+        return
+
+    lines = [f"{'path':<10} {'endpoint':<32} {'stage':<8} {'n':>5} {'p50':>7} {'p95':>7} {'p99':>7}"]
+    for path, endpoint, stage, count, p50, p95, p99 in rows:
+        endpoint = endpoint.split("//")[-1][:32] # host is enough
+        lines.append(f"{path:<10} {endpoint:<32} {stage:<8} {count:>5} {p50:>6.2f}s {p95:>6.2f}s {p99:>6.2f}s")
+    await interaction.response.send_message("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+
+#admin only: slowest recent spans from the tracer
+@bot.tree.command(name='traces', description='slowest recent traced operations (admin only)')
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def slow_traces(interaction: discord.Interaction, count: app_commands.Range[int, 1, 50] = 20):
+    spans = tracer.slowest(count)
+    if not spans:
+        await interaction.response.send_message("no spans recorded yet", ephemeral=True)
+        return
+    text = "\n".join(repr(span) for span in spans)
+    await interaction.response.send_message(f"```\n{text[:1900]}\n```", ephemeral=True)
+
+
+#admin only: sample the event loop for a while and send back a collapsed-stack profile
+profile_lock = asyncio.Lock() # one profile at a time
+
+@bot.tree.command(name='profile', description='sample the event loop and return a flamegraph-ready profile (admin only)')
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def profile_loop(interaction: discord.Interaction, seconds: app_commands.Range[int, 1, 60] = 10):
+    if profile_lock.locked():
+        await interaction.response.send_message("a profile is already running", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    async with profile_lock:
+        # we're on the loop thread right now, that's the one to sample
+        profiler = SamplingProfiler(thread_id=threading.get_ident())
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+
+    samples = sum(profiler.stacks.values())
+    data = io.BytesIO(profiler.collapsed().encode())
+    await interaction.followup.send(
+        f"{samples} samples over {seconds}s, open with speedscope or flamegraph.pl",
+        file=discord.File(data, filename=f"solspear-profile-{int(discord.utils.utcnow().timestamp())}.collapsed"),
+        ephemeral=True
+    )
+
+
+#per-channel digest mode, busy wallets get one summary per window instead of an alert per transaction
+@bot.tree.command(name='digest', description='batch alerts for busy wallets in this channel into one summary')
+@app_commands.describe(
+    enabled='turn digest mode on or off for this channel',
+    window='seconds per digest',
+    threshold='alerts per window before batching starts',
+    large_sol='transactions moving at least this much SOL always alert straight away (0 = never)'
+)
+async def digest_mode(
+    interaction: discord.Interaction,
+    enabled: bool,
+    window: app_commands.Range[int, 10, DIGEST_MAX_WINDOW] = DIGEST_WINDOW_SECONDS,
+    threshold: app_commands.Range[int, 1, 1000] = DIGEST_THRESHOLD,
+    large_sol: app_commands.Range[float, 0, 1_000_000] = DIGEST_LARGE_SOL
+):
+    try:
+        # only wallet channels, and only their owner (or someone who can manage channels)
+        owner = await db.db.tracked_wallets.find_one({"channel_id": str(interaction.channel_id)}, projection={"user_id": 1})
+        if not owner:
+            await interaction.response.send_message("run this in one of your wallet channels", ephemeral=True)
+            return
+        can_manage = getattr(interaction.user, 'guild_permissions', None) and interaction.user.guild_permissions.manage_channels
+        if owner["user_id"] != str(interaction.user.id) and not can_manage:
+            await interaction.response.send_message("only the wallet's owner can change this", ephemeral=True)
+            return
+
+        await digest_settings.set(interaction.channel_id, enabled, window, threshold, large_sol)
+        if enabled:
+            message = (f"digest mode on: once a wallet sends more than {threshold} alerts in {window}s, "
+                       f"the rest are summed up in one message per {window}s")
+            if large_sol:
+                message += f", moves of {large_sol:g} SOL or more still alert straight away"
+        else:
+            message = "digest mode off, every transaction gets its own alert again"
+        await interaction.response.send_message(message, ephemeral=True)
+
+    except Exception as e:
+        print(f"error updating digest settings: {e}")
+        await interaction.response.send_message(
+            "oops something went wrong, please try again later",
+            ephemeral=True
+        )
+
+
 # add this after your other event handlers
 
 @bot.event
@@ -373,8 +792,8 @@ async def on_guild_channel_delete(channel):
     try:
         # check if this was a wallet tracking channel
         if channel.name.startswith('wallet-'):
-            # find and delete the wallet from database
-            result = await db.db.tracked_wallets.delete_one({"channel_id": str(channel.id)})
+            # find and delete the wallet(s) from database, bulk imports can share one channel
+            result = await db.db.tracked_wallets.delete_many({"channel_id": str(channel.id)})
             if result.deleted_count > 0:
                 print(f"removed wallet tracking for deleted channel: {channel.name}")
             
@@ -382,6 +801,7 @@ async def on_guild_channel_delete(channel):
         print(f"error cleaning up deleted channel: {e}")
 
 
-#run bot with token
-TOKEN = os.getenv('DISCORD_TOKEN')
-bot.run(TOKEN)
+#run bot with token (guarded, decode pool workers import this module when they start)
+if __name__ == "__main__":
+    TOKEN = os.getenv('DISCORD_TOKEN')
+    bot.run(TOKEN)
@@ -0,0 +1,61 @@
+import asyncio
+import hashlib
+import json
+import os
+from database.db import db
+
+# seconds between guild syncs, discord only allows a handful of command syncs per minute
+GUILD_SYNC_INTERVAL = float(os.getenv('GUILD_SYNC_INTERVAL', 5))
+
+
+class CommandSyncer:
+    """only syncs slash commands for scopes (global or a guild) whose command tree actually changed"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.guild_task = None # background guild sync task, only one at a time
+
+    def fingerprint(self, guild=None):
+        """hash the payload discord would receive for this scope"""
+        payload = []
+        for cmd in self.bot.tree.get_commands(guild=guild):
+            try:
+                payload.append(cmd.to_dict(self.bot.tree)) # discord.py 2.4+
+            except TypeError:
+                payload.append(cmd.to_dict())
+        payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _key(self, guild=None):
+        return f"command_sync:{guild.id if guild else 'global'}"
+
+    async def sync_if_changed(self, guild=None):
+        """sync one scope if its hash differs from the stored one, returns True if it synced"""
+        digest = self.fingerprint(guild)
+        stored = await db.db.bot_state.find_one({"_id": self._key(guild)})
+        if stored and stored.get("hash") == digest:
+            return False
+
+        await self.bot.tree.sync(guild=guild)
+        await db.db.bot_state.update_one(
+            {"_id": self._key(guild)},
+            {"$set": {"hash": digest}},
+            upsert=True
+        )
+        return True
+
+    def sync_guilds_in_background(self, guilds):
+        """kick off rate limited guild syncs without holding up on_ready"""
+        if self.guild_task and not self.guild_task.done():
+            return # reconnects fire on_ready again, one pass is enough
+        self.guild_task = asyncio.create_task(self._sync_guilds(list(guilds)))
+
+    async def _sync_guilds(self, guilds):
+        for guild in guilds:
+            try:
+                if await self.sync_if_changed(guild):
+                    print(f'synced commands for guild: {guild.name}')
+                    await asyncio.sleep(GUILD_SYNC_INTERVAL) # only wait after a real api call
+            except Exception as e:
+                print(f'failed to sync commands for guild {guild.name}: {e}')
@@ -1,56 +1,502 @@
 # import libraries needed
 from motor.motor_asyncio import AsyncIOMotorClient  # mongodb async driver
-import os 
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+import asyncio
+import os
 from dotenv import load_dotenv # loading .env file
+from datetime import datetime, timezone, timedelta
 
 # load .env
 load_dotenv()
 
+MONGODB_DB = os.getenv('MONGODB_DB', 'solspear') # database name, point replays/load tests at a scratch one
+
+# connection pool settings
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 5)) # keep a few sockets warm
+MONGO_TIMEOUT_MS = int(os.getenv('MONGO_TIMEOUT_MS', 5000)) # server selection + connect timeout
+
+# bump this whenever create_collections changes so the next boot re-runs index setup
+SCHEMA_VERSION = 10
+
+# how transactions are stored: "document" = one doc per signature, "bucketed" = one doc per wallet per time bucket
+TX_STORAGE_MODE = os.getenv('TX_STORAGE_MODE', 'document')
+TX_BUCKET_SECONDS = int(os.getenv('TX_BUCKET_SECONDS', 3600)) # one bucket per wallet per hour
+TX_BUCKET_MAX_SIZE = int(os.getenv('TX_BUCKET_MAX_SIZE', 500)) # overflow into a new bucket doc past this many txs
+TX_TTL_SECONDS = int(os.getenv('TX_TTL_SECONDS', 0)) # how long stored transactions live (by block time), 0 = forever
+
+# fields a /history page reads, summaries only
+HISTORY_FIELDS = {"signature": 1, "slot": 1, "block_time": 1, "tx_type": 1, "err": 1, "flows": 1}
+HISTORY_BUCKET_BATCH = 4 # buckets per round trip when paging history, a page rarely needs more than a couple
+
+
+async def page_from_buckets(buckets, after=None, newer=False, limit=10):
+    """one get_history page out of buckets sorted by first_slot (newer) or last_slot (older)
+
+    stops reading once the next bucket's slot range can't reach into the page, so only the
+    buckets around the cursor are unwound
+    """
+    edge = "first_slot" if newer else "last_slot"
+    rank = lambda tx: (tx["slot"], tx["signature"])
+    rows = []
+    async for bucket in buckets:
+        if len(rows) >= limit:
+            bound = rows[limit - 1]["slot"]
+            if (bucket[edge] > bound) if newer else (bucket[edge] < bound):
+                break
+        for tx in bucket.get("transactions") or []:
+            if tx.get("skipped"):
+                continue # poll cursor markers, not activity
+            if after is None or ((rank(tx) > tuple(after)) if newer else (rank(tx) < tuple(after))):
+                rows.append(tx)
+        rows.sort(key=rank, reverse=not newer)
+        del rows[limit:]
+    return rows
+
+
 # create db class
 class Database:
     def __init__(self):
         self.client = None # our connection to the database
         self.db = None # our db
+        self.tx_storage_mode = TX_STORAGE_MODE
 
     # connect to db method
     async def connect(self):
         """connect to mongodb"""
         try:
-            self.client = AsyncIOMotorClient(os.getenv('MONGODB_URI')) # connect using .env
-            self.db = self.client.solspear # get reference to 'solspear' db
+            self.client = AsyncIOMotorClient(
+                os.getenv('MONGODB_URI'), # connect using .env
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+                connectTimeoutMS=MONGO_TIMEOUT_MS
+            )
+            self.db = self.client[MONGODB_DB] # get reference to our db ('solspear' unless overridden)
+
+            # ping and read the schema version in one go, so a dead server fails fast
+            _, schema = await asyncio.gather(
+                self.client.admin.command("ping"),
+                self.db.schema_meta.find_one({"_id": "schema"})
+            )
             print('connected to mongodb')
 
-            # set up collections (like tables in sql hehe)
+            # set up collections (like tables in sql hehe), skipped if the schema hasn't changed
+            if schema and schema.get("version") == SCHEMA_VERSION and schema.get("ttl_seconds") == TX_TTL_SECONDS:
+                print(f'schema up to date (v{SCHEMA_VERSION}), skipping index setup')
+                return
             await self.create_collections()
+            await self.db.schema_meta.update_one(
+                {"_id": "schema"},
+                {"$set": {
+                    "version": SCHEMA_VERSION,
+                    "ttl_seconds": TX_TTL_SECONDS,
+                    "updated_at": datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
         except Exception as e:
             print(f"error connecting to mongodb: {e}")
             raise e
 
     async def create_collections(self):
-        """create necessary collections with validators"""
+        """create necessary collections and indexes, all at the same time"""
+        existing = set(await self.db.list_collection_names()) # only ask once
+        await asyncio.gather(
+            self._setup_users(existing),
+            self._setup_tracked_wallets(existing),
+            self._setup_transactions(existing),
+            self._setup_transaction_buckets(existing),
+            self._setup_outbox(existing),
+            self._setup_workers(existing),
+            self._setup_backfill_jobs(existing)
+        )
+
+    async def _ensure_collection(self, name, existing):
+        """create a collection if it isn't there yet"""
+        if name not in existing:
+            try:
+                await self.db.create_collection(name)
+            except CollectionInvalid:
+                pass # someone else made it first
+
+    async def _setup_users(self, existing):
         # user collection - stores discord user info
-        if "users" not in await self.db.list_collection_names():
-            await self.db.create_collection("users")
-            # create index on discord_id for faster lookups
-            await self.db.users.create_index("discord_id", unique=True) # unique=true to ensure only 1 discord id per user
+        await self._ensure_collection("users", existing)
+        # create index on discord_id for faster lookups
+        await self.db.users.create_index("discord_id", unique=True) # unique=true to ensure only 1 discord id per user
 
+    async def _setup_tracked_wallets(self, existing):
         # tracked wallets collection - stores wallet address being monitored
-        if "tracked_wallets" not in await self.db.list_collection_names():
-            await self.db.create_collection("tracked_wallets")
-            # create compound index for user_id and wallet_address
-            await self.db.tracked_wallets.create_index([
-                ("user_id", 1), # 1 = ascending order
-                ("wallet_address", 1)
-            ], unique=True)
+        await self._ensure_collection("tracked_wallets", existing)
+        # create compound index for user_id and wallet_address
+        await self.db.tracked_wallets.create_index([
+            ("user_id", 1), # 1 = ascending order
+            ("wallet_address", 1)
+        ], unique=True)
 
+    async def _setup_transactions(self, existing):
         # transaction history collection - stores transaction history for a wallet
-        if "transactions" not in await self.db.list_collection_names():
-            await self.db.create_collection("transactions")
-            # create index for faster transaction lookups
-            await self.db.transactions.create_index([
+        await self._ensure_collection("transactions", existing)
+        await asyncio.gather(
+            # index matches the latest-signature lookup in check_transactions, and with _id as the
+            # tiebreak it's the keyset /history pages along
+            self.db.transactions.create_index([
                 ("wallet_address", 1),
-                ("timestamp", -1) # -1 = descending order
-            ])
+                ("slot", -1), # -1 = descending order
+                ("_id", -1)
+            ]),
+            self._create_ttl_index(self.db.transactions, "timestamp"),
+            self._create_unique_signature_index()
+        )
+        # the old ones: (wallet_address, slot) is a prefix of the above, nothing sorts on timestamp any more
+        await self._drop_index(self.db.transactions, "wallet_address_1_slot_-1")
+        await self._drop_index(self.db.transactions, "wallet_address_1_timestamp_-1")
+
+    async def _setup_transaction_buckets(self, existing):
+        # bucketed transaction history - one doc per wallet per time bucket with an embedded array
+        await self._ensure_collection("transaction_buckets", existing)
+        await self._number_bucket_parts()
+        await asyncio.gather(
+            # one doc per (wallet, bucket, part), so two inserters can't both open the same part
+            self.db.transaction_buckets.create_index([
+                ("wallet_address", 1),
+                ("bucket_start", 1),
+                ("part", 1)
+            ], unique=True),
+            self.db.transaction_buckets.create_index([
+                ("wallet_address", 1),
+                ("last_slot", -1)
+            ]),
+            self.db.transaction_buckets.create_index([
+                ("wallet_address", 1),
+                ("first_slot", 1) # with last_slot, lets history skip buckets outside the page
+            ]),
+            self._create_ttl_index(self.db.transaction_buckets, "bucket_start"),
+            self._create_unique_bucket_signature_index(),
+            # buckets from before first_slot was tracked
+            self.db.transaction_buckets.update_many(
+                {"first_slot": {"$exists": False}},
+                [{"$set": {"first_slot": {"$min": "$transactions.slot"}}}]
+            )
+        )
+        # (wallet_address, bucket_start) is a prefix of the unique index now
+        await self._drop_index(self.db.transaction_buckets, "wallet_address_1_bucket_start_1_count_1")
+
+    async def _number_bucket_parts(self):
+        """give buckets from before the part field theirs (overflow docs in the order they were made)"""
+        unnumbered = self.db.transaction_buckets.aggregate([
+            {"$match": {"part": {"$exists": False}}},
+            {"$sort": {"_id": 1}},
+            {"$group": {"_id": {"w": "$wallet_address", "b": "$bucket_start"}, "ids": {"$push": "$_id"}}}
+        ], allowDiskUse=True)
+        async for group in unnumbered:
+            for part, bucket_id in enumerate(group["ids"]):
+                await self.db.transaction_buckets.update_one({"_id": bucket_id}, {"$set": {"part": part}})
+
+    async def _setup_outbox(self, existing):
+        # notification outbox - alerts waiting to be delivered to discord
+        await self._ensure_collection("outbox", existing)
+        await asyncio.gather(
+            self.db.outbox.create_index([
+                ("status", 1),
+                ("claimed_until", 1),
+                ("created_at", 1)
+            ]),
+            self.db.outbox.create_index("claimed_by"),
+            # held digest notifications, found by when their window closes
+            self.db.outbox.create_index([
+                ("status", 1),
+                ("flush_at", 1)
+            ]),
+            # delivered/failed notifications are only kept for a day
+            self.db.outbox.create_index("delivered_at", expireAfterSeconds=24 * 3600)
+        )
+
+    async def _setup_workers(self, existing):
+        # ingestion worker leases - expired ones get cleaned up by mongo
+        await self._ensure_collection("workers", existing)
+        await self.db.workers.create_index("expires_at", expireAfterSeconds=0)
+
+    async def _setup_backfill_jobs(self, existing):
+        # one history backfill job per wallet address, claimed like outbox entries
+        await self._ensure_collection("backfill_jobs", existing)
+        await self.db.backfill_jobs.create_index([
+            ("status", 1),
+            ("claimed_until", 1)
+        ])
+
+    async def _create_ttl_index(self, collection, field):
+        """create (or update) a ttl index so old transactions expire on their own"""
+        name = f"{field}_ttl"
+        if TX_TTL_SECONDS <= 0:
+            # keep forever - a ttl index from an earlier setting would still be deleting history
+            await self._drop_index(collection, name)
+            return
+        try:
+            await collection.create_index(field, name=name, expireAfterSeconds=TX_TTL_SECONDS)
+        except Exception:
+            # index already exists with a different ttl, change it in place
+            await self.db.command({
+                "collMod": collection.name,
+                "index": {"name": name, "expireAfterSeconds": TX_TTL_SECONDS}
+            })
+
+    async def _create_unique_signature_index(self):
+        """one row per (wallet, signature), so two workers polling the same wallet during a
+        rebalance can't both store it - duplicates from before the index are removed first"""
+        keys = [("wallet_address", 1), ("signature", 1)]
+        try:
+            await self.db.transactions.create_index(keys, unique=True)
+            return
+        except DuplicateKeyError:
+            pass
+        duplicates = self.db.transactions.aggregate([
+            {"$group": {"_id": {"w": "$wallet_address", "s": "$signature"}, "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        removed = 0
+        async for group in duplicates:
+            result = await self.db.transactions.delete_many({"_id": {"$in": group["ids"][1:]}})
+            removed += result.deleted_count
+        print(f"removed {removed} duplicate transactions")
+        await self.db.transactions.create_index(keys, unique=True)
+
+    async def _create_unique_bucket_signature_index(self):
+        """same for buckets: a signature can only be in one of the wallet's bucket docs - duplicates from
+        before the index are pulled out of the arrays first (the first copy stays)"""
+        keys = [("wallet_address", 1), ("transactions.signature", 1)]
+        try:
+            await self.db.transaction_buckets.create_index(keys, unique=True)
+            return
+        except DuplicateKeyError:
+            pass
+        duplicates = self.db.transaction_buckets.aggregate([
+            {"$unwind": "$transactions"},
+            {"$group": {
+                "_id": {"w": "$wallet_address", "s": "$transactions.signature"},
+                "buckets": {"$push": "$_id"},
+                "n": {"$sum": 1}
+            }},
+            {"$match": {"n": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        extra = {} # bucket _id -> {signature: copies to take out of it}
+        async for group in duplicates:
+            for bucket_id in group["buckets"][1:]:
+                copies = extra.setdefault(bucket_id, {})
+                copies[group["_id"]["s"]] = copies.get(group["_id"]["s"], 0) + 1
+
+        removed = 0
+        for bucket_id, copies in extra.items():
+            bucket = await self.db.transaction_buckets.find_one({"_id": bucket_id})
+            kept = []
+            for tx in bucket["transactions"]:
+                if copies.get(tx.get("signature")):
+                    copies[tx["signature"]] -= 1
+                    removed += 1
+                else:
+                    kept.append(tx)
+            if not kept:
+                await self.db.transaction_buckets.delete_one({"_id": bucket_id})
+                continue
+            await self.db.transaction_buckets.update_one({"_id": bucket_id}, {"$set": {
+                "transactions": kept,
+                "count": len(kept),
+                "first_slot": min(tx["slot"] for tx in kept),
+                "last_slot": max(tx["slot"] for tx in kept)
+            }})
+        print(f"removed {removed} duplicate bucketed transactions")
+        # still failing means something is writing duplicates right now, don't carry on without the index
+        await self.db.transaction_buckets.create_index(keys, unique=True)
+
+    async def _drop_index(self, collection, name):
+        """drop an index, fine if it's already gone (or never made)"""
+        try:
+            await collection.drop_index(name)
+        except OperationFailure as e:
+            if e.code != 27: # IndexNotFound
+                raise
+
+    def _bucket_start(self, when):
+        """round a datetime down to the start of its bucket"""
+        epoch = int(when.timestamp())
+        return datetime.fromtimestamp(epoch - epoch % TX_BUCKET_SECONDS, tz=timezone.utc)
+
+    async def insert_transaction(self, tx_data):
+        """store a transaction using the configured storage mode, False if it was already stored"""
+        # block time when we have it, so retention and bucketing follow the transaction's age - a backfilled
+        # tx from months ago mustn't live another full ttl or land in this hour's bucket
+        if "timestamp" not in tx_data:
+            block_time = tx_data.get("block_time")
+            tx_data["timestamp"] = (
+                datetime.fromtimestamp(block_time, tz=timezone.utc) if block_time else datetime.now(timezone.utc)
+            )
+
+        try:
+            if self.tx_storage_mode != "bucketed":
+                await self.db.transactions.insert_one(tx_data)
+                return True
+            await self._insert_into_bucket(tx_data)
+            return True
+        except DuplicateKeyError:
+            return False # someone else (another worker, a rescan, the backfill) got there first
+
+    async def _insert_into_bucket(self, tx_data):
+        entry = {k: v for k, v in tx_data.items() if k != "wallet_address"}
+        bucket_start = self._bucket_start(tx_data["timestamp"])
+        key = {"wallet_address": tx_data["wallet_address"], "bucket_start": bucket_start}
+        while True:
+            # the part that still has room, if there is one
+            result = await self.db.transaction_buckets.update_one(
+                {
+                    **key,
+                    "count": {"$lt": TX_BUCKET_MAX_SIZE},
+                    # already in this bucket -> no match -> the new part below hits the unique signature index
+                    "transactions.signature": {"$ne": tx_data["signature"]}
+                },
+                {
+                    "$push": {"transactions": entry},
+                    "$inc": {"count": 1},
+                    "$max": {"last_slot": tx_data["slot"]},
+                    "$min": {"first_slot": tx_data["slot"]}
+                }
+            )
+            if result.matched_count:
+                return
+
+            # full or not there yet: open the next part. inserters racing for it meet on the unique
+            # (wallet, bucket, part) index and the losers go round again
+            last = await self.db.transaction_buckets.find_one(key, projection={"part": 1}, sort=[("part", -1)])
+            try:
+                await self.db.transaction_buckets.insert_one({
+                    **key,
+                    "part": last["part"] + 1 if last else 0,
+                    "bucket_end": bucket_start + timedelta(seconds=TX_BUCKET_SECONDS),
+                    "transactions": [entry],
+                    "count": 1,
+                    "first_slot": tx_data["slot"],
+                    "last_slot": tx_data["slot"]
+                })
+                return
+            except DuplicateKeyError as e:
+                if "part" not in (e.details or {}).get("keyPattern", {}):
+                    raise # the signature is already stored
+
+    async def get_last_transaction(self, wallet_address):
+        """get the most recent stored transaction for a wallet (highest slot), or None"""
+        if self.tx_storage_mode != "bucketed":
+            return await self.db.transactions.find_one(
+                {"wallet_address": wallet_address},
+                sort=[("slot", -1)]
+            )
+
+        bucket = await self.db.transaction_buckets.find_one(
+            {"wallet_address": wallet_address},
+            projection={"transactions.signature": 1, "transactions.slot": 1},
+            sort=[("last_slot", -1)]
+        )
+        if not bucket or not bucket.get("transactions"):
+            return None
+        last = max(bucket["transactions"], key=lambda tx: tx["slot"])
+        return {"wallet_address": wallet_address, **last}
+
+    async def get_history(self, wallet_address, after=None, newer=False, limit=10):
+        """one page of stored transactions for a wallet, always returned newest first
+
+        keyset paginated on (slot, tiebreak): after is the (slot, tiebreak) of the row the page continues
+        from, older rows by default or newer ones with newer=True. the tiebreak is _id for documents
+        and the signature for buckets, which are walked by their first/last slot and unwound in python
+        """
+        order = 1 if newer else -1
+        op = "$gt" if newer else "$lt"
+        tie = "_id" if self.tx_storage_mode != "bucketed" else "signature"
+        keyset = {}
+        if after:
+            slot, key = after
+            keyset = {"$or": [{"slot": {op: slot}}, {"slot": slot, tie: {op: key}}]}
+
+        if self.tx_storage_mode != "bucketed":
+            rows = await self.db.transactions.find(
+                {"wallet_address": wallet_address, "skipped": {"$ne": True}, **keyset},
+                projection=HISTORY_FIELDS,
+                sort=[("slot", order), ("_id", order)],
+                limit=limit
+            ).to_list(length=None)
+        else:
+            # only buckets that reach past the cursor, in the order the page is read
+            in_range = {}
+            if after:
+                in_range = {"last_slot": {"$gte": after[0]}} if newer else {"first_slot": {"$lte": after[0]}}
+            buckets = self.db.transaction_buckets.find(
+                {"wallet_address": wallet_address, **in_range},
+                projection={
+                    "first_slot": 1, "last_slot": 1, "transactions.skipped": 1,
+                    **{f"transactions.{f}": 1 for f in HISTORY_FIELDS}
+                },
+                sort=[("first_slot", 1)] if newer else [("last_slot", -1)],
+                batch_size=HISTORY_BUCKET_BATCH
+            )
+            rows = await page_from_buckets(buckets, after, newer, limit)
+        for row in rows:
+            row["cursor"] = (row["slot"], row.get(tie))
+        return rows[::-1] if newer else rows
+
+    async def get_last_transactions(self, wallet_addresses):
+        """latest stored transaction for many wallets at once, as {wallet_address: tx}"""
+        if not wallet_addresses:
+            return {}
+        if self.tx_storage_mode == "bucketed":
+            found = await asyncio.gather(*(self.get_last_transaction(a) for a in wallet_addresses))
+            return {tx["wallet_address"]: tx for tx in found if tx}
+
+        pipeline = [
+            {"$match": {"wallet_address": {"$in": list(wallet_addresses)}}},
+            {"$sort": {"wallet_address": 1, "slot": -1}}, # walks the (wallet_address, slot) index
+            {"$group": {
+                "_id": "$wallet_address",
+                "signature": {"$first": "$signature"},
+                "slot": {"$first": "$slot"}
+            }}
+        ]
+        cursors = {}
+        async for row in self.db.transactions.aggregate(pipeline):
+            cursors[row["_id"]] = {"wallet_address": row["_id"], "signature": row["signature"], "slot": row["slot"]}
+        return cursors
+
+    async def existing_signatures(self, wallet_address, signatures):
+        """which of these signatures are already stored for the wallet"""
+        if not signatures:
+            return set()
+        if self.tx_storage_mode != "bucketed":
+            cursor = self.db.transactions.find(
+                {"wallet_address": wallet_address, "signature": {"$in": signatures}},
+                projection={"signature": 1, "_id": 0}
+            )
+            return {doc["signature"] async for doc in cursor}
+
+        wanted = set(signatures)
+        cursor = self.db.transaction_buckets.find(
+            {"wallet_address": wallet_address, "transactions.signature": {"$in": signatures}},
+            projection={"transactions.signature": 1}
+        )
+        return {tx["signature"] async for bucket in cursor for tx in bucket["transactions"] if tx["signature"] in wanted}
+
+    async def mark_processed(self, wallet_address, signatures):
+        """flag stored transactions as notified"""
+        if not signatures:
+            return
+        if self.tx_storage_mode != "bucketed":
+            await self.db.transactions.update_many(
+                {"wallet_address": wallet_address, "signature": {"$in": signatures}},
+                {"$set": {"processed": True}}
+            )
+            return
+
+        await self.db.transaction_buckets.update_many(
+            {"wallet_address": wallet_address, "transactions.signature": {"$in": signatures}},
+            {"$set": {"transactions.$[tx].processed": True}},
+            array_filters=[{"tx.signature": {"$in": signatures}}]
+        )
 
     async def close(self):
         """close the connection to mongodb"""
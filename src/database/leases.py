@@ -0,0 +1,92 @@
+# mongo-backed leader lease - only the holder runs ingestion, standbys take over when heartbeats stop
+import asyncio
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database.db import db
+
+LEASE_SECONDS = float(os.getenv('LEADER_LEASE_SECONDS', 6)) # standby takes over this long after the last heartbeat
+LEASE_RENEW_SECONDS = float(os.getenv('LEADER_RENEW_SECONDS', 2))
+LEASE_SAFETY_SECONDS = 1 # stop acting as leader a bit before the lease actually runs out (clock drift)
+
+
+class LeaderLease:
+    """best-effort leader election, not fencing: is_leader is only checked locally before writes,
+    so a leader that stalls past its lease can still finish a write after a standby took over.
+    that's tolerable because ingestion writes are idempotent - outbox ids and the unique
+    (wallet, signature) index turn a stale leader's late writes into duplicates that get dropped"""
+
+    def __init__(self, name, holder_id):
+        self.name = name # which lease, e.g. "ingestion"
+        self.holder_id = holder_id # who we are
+        self.token = None # lease generation, goes up by one on every change of leader
+        self._valid_until = 0 # local monotonic deadline for acting as leader
+        self._task = None
+        self.on_change = None # optional callback(is_leader), called when we win or lose the lease
+
+    @property
+    def is_leader(self):
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    async def try_acquire(self):
+        """renew the lease if we hold it, otherwise grab it if it's expired, returns is_leader"""
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=LEASE_SECONDS)
+        was_leader = self.is_leader
+
+        lease = None
+        if self.token is not None:
+            # renew, but only if nobody has taken over (same holder and generation)
+            lease = await db.db.leases.find_one_and_update(
+                {"_id": self.name, "holder": self.holder_id, "token": self.token},
+                {"$set": {"expires_at": expires_at}},
+                return_document=ReturnDocument.AFTER
+            )
+        if lease is None:
+            try:
+                lease = await db.db.leases.find_one_and_update(
+                    {"_id": self.name, "expires_at": {"$lt": now}},
+                    {"$set": {"holder": self.holder_id, "expires_at": expires_at, "acquired_at": now}, "$inc": {"token": 1}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                lease = None # someone else holds a live lease
+
+        if lease:
+            self.token = lease["token"]
+            # count from when we asked, not when mongo answered
+            self._valid_until = started + LEASE_SECONDS - LEASE_SAFETY_SECONDS
+        else:
+            self.token = None
+
+        if self.is_leader != was_leader:
+            print(f"{self.name} lease {'acquired' if self.is_leader else 'lost'} by {self.holder_id} (token {self.token})")
+            if self.on_change:
+                await self.on_change(self.is_leader)
+        return self.is_leader
+
+    async def _run(self):
+        while True:
+            try:
+                await self.try_acquire()
+            except Exception as e:
+                print(f"error renewing {self.name} lease: {e}")
+            await asyncio.sleep(LEASE_RENEW_SECONDS)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def release(self):
+        """give the lease up on shutdown so a standby doesn't have to wait for it to expire"""
+        if self._task:
+            self._task.cancel()
+        if self.token is not None:
+            await db.db.leases.update_one(
+                {"_id": self.name, "holder": self.holder_id, "token": self.token},
+                {"$set": {"expires_at": datetime.fromtimestamp(0, tz=timezone.utc)}}
+            )
+            self.token = None
@@ -0,0 +1,160 @@
+# durable notification outbox - alerts are written here first and a worker delivers them
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from database.db import db
+
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50)) # notifications claimed per worker pass
+OUTBOX_CLAIM_SECONDS = int(os.getenv('OUTBOX_CLAIM_SECONDS', 60)) # claim expires after this, then someone else can retry
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5)) # give up (status "failed") after this many tries
+
+
+class NotificationOutbox:
+    """at-least-once delivery: enqueue -> claim -> send -> ack"""
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex # identifies this process's claims
+
+    @property
+    def collection(self):
+        return db.db.outbox
+
+    async def enqueue(self, channel_id, content, wallet_address=None, signature=None, extra=None):
+        """add a notification, returns False if it was already queued (same signature + channel)"""
+        now = datetime.now(timezone.utc)
+        doc = {
+            "channel_id": str(channel_id),
+            "content": content,
+            "wallet_address": wallet_address,
+            "signature": signature,
+            "status": "pending",
+            "attempts": 0,
+            "claimed_until": now, # claimable straight away
+            "created_at": now,
+            **(extra or {})
+        }
+        if signature:
+            doc["_id"] = f"{signature}:{channel_id}" # replaying the same tx can't queue it twice
+        try:
+            await self.collection.insert_one(doc)
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def enqueue_alert(self, wallet, tx_data, tx_type, path=None, endpoint=None):
+        """queue the discord alert for a detected transaction, path/endpoint say how we found it"""
+        return await self.enqueue(
+            wallet['channel_id'],
+            f"🔔 New {tx_type} detected!\n"
+            f"Signature: `{tx_data['signature']}`\n"
+            f"Status: {'✅ Success' if not tx_data['err'] else '❌ Failed'}\n"
+            f"View transaction: https://solscan.io/tx/{tx_data['signature']}",
+            wallet_address=wallet['wallet_address'],
+            signature=tx_data['signature'],
+            extra={
+                "slot": tx_data.get("slot"),
+                "block_time": tx_data.get("block_time"),
+                "detected_at": tx_data.get("detected_at"),
+                "path": path,
+                "endpoint": endpoint,
+                # what digests summarise
+                "tx_type": tx_type,
+                "err": tx_data.get("err", False),
+                "flows": tx_data.get("flows") or {}
+            }
+        )
+
+    async def claim_batch(self, limit=OUTBOX_BATCH_SIZE):
+        """claim up to `limit` pending notifications whose previous claim (if any) has expired"""
+        now = datetime.now(timezone.utc)
+        return await self._claim({"status": "pending", "claimed_until": {"$lte": now}}, now, limit)
+
+    async def claim_due_digests(self, limit=OUTBOX_BATCH_SIZE * 4):
+        """claim held digest notifications whose window has closed"""
+        now = datetime.now(timezone.utc)
+        return await self._claim(
+            {"status": "digest", "flush_at": {"$lte": now}, "claimed_until": {"$lte": now}}, now, limit
+        )
+
+    async def _claim(self, claimable, now, limit):
+        ids = [d["_id"] async for d in self.collection.find(
+            claimable, projection={"_id": 1}, sort=[("created_at", 1)], limit=limit
+        )]
+        if not ids:
+            return []
+
+        # the filter is re-checked so two workers can't both win the same doc
+        claim_token = f"{self.worker_id}:{uuid.uuid4().hex}"
+        await self.collection.update_many(
+            {"_id": {"$in": ids}, **claimable},
+            {
+                "$set": {
+                    "claimed_by": claim_token,
+                    "claimed_until": now + timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+                },
+                "$inc": {"attempts": 1}
+            }
+        )
+        return await self.collection.find(
+            {"claimed_by": claim_token}, sort=[("created_at", 1)]
+        ).to_list(length=None)
+
+    async def hold_for_digest(self, notifications, digest_key, flush_at):
+        """park claimed notifications until flush_at, they go out together as one digest"""
+        if not notifications:
+            return
+        await self.collection.update_many(
+            {"_id": {"$in": [n["_id"] for n in notifications]}},
+            {
+                "$set": {
+                    "status": "digest",
+                    "digest_key": digest_key,
+                    "flush_at": flush_at,
+                    "claimed_until": datetime.now(timezone.utc)
+                },
+                "$inc": {"attempts": -1} # holding isn't a delivery attempt
+            }
+        )
+
+    async def ack(self, notifications):
+        """mark notifications delivered in one round trip"""
+        if not notifications:
+            return
+        now = datetime.now(timezone.utc)
+        await self.collection.update_many(
+            {"_id": {"$in": [n["_id"] for n in notifications]}},
+            {"$set": {"status": "delivered", "delivered_at": now}}
+        )
+
+    async def release(self, notifications, error=None):
+        """hand failed notifications back for a retry, or mark them failed once out of attempts"""
+        if not notifications:
+            return
+        now = datetime.now(timezone.utc)
+        ops = []
+        for n in notifications:
+            backoff = timedelta(seconds=min(2 ** n.get("attempts", 1), OUTBOX_CLAIM_SECONDS))
+            # a digest that failed to send stays a digest, it retries as one message
+            retry_status = "digest" if n.get("status") == "digest" else "pending"
+            status = "failed" if n.get("attempts", 1) >= OUTBOX_MAX_ATTEMPTS else retry_status
+            ops.append(UpdateOne(
+                {"_id": n["_id"]},
+                {"$set": {
+                    "status": status,
+                    "claimed_until": now + backoff,
+                    "last_error": str(error) if error else None,
+                    # failed ones expire with the delivered ones
+                    **({"delivered_at": now} if status == "failed" else {})
+                }}
+            ))
+        await self.collection.bulk_write(ops, ordered=False)
+
+    async def pending_count(self):
+        """how many notifications are still waiting to go out (held digests included)"""
+        return await self.collection.count_documents({"status": {"$in": ["pending", "digest"]}})
+
+
+# create single instance of our outbox
+outbox = NotificationOutbox()
@@ -0,0 +1,122 @@
+# transaction decoding - pure functions over the raw json, optionally run in a process pool so big
+# payloads stay off the event loop (keep this module light, pool workers import it)
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', 0)) # processes for decoding, 0 = decode inline on the loop
+DECODE_BATCH_SIZE = int(os.getenv('DECODE_BATCH_SIZE', 16)) # transactions per submission to a worker
+DECODE_MIN_BATCH = 2 # smaller batches aren't worth the pickling, decode them inline
+
+
+def account_keys(result):
+    """every account key of a getTransaction result (json encoding), address-table ones included"""
+    keys = list(result["transaction"]["message"]["accountKeys"])
+    loaded = (result.get("meta") or {}).get("loadedAddresses") or {}
+    return keys + (loaded.get("writable") or []) + (loaded.get("readonly") or [])
+
+
+def classify_transaction(meta, keys, address):
+    """tx type for a fetched transaction, None if it doesn't involve the wallet or is just dust"""
+    if not meta:
+        return "Transaction"
+
+    # check if our wallet is involved
+    if address not in keys:
+        return None
+
+    # Skip if it's a tiny system program transfer
+    inner = meta.get("innerInstructions") or []
+    pre, post = meta.get("preBalances") or [], meta.get("postBalances") or []
+    if not inner and pre and post and abs(pre[0] - post[0]) < 10000: # Less than 0.00001 SOL
+        return None
+
+    # Determine if it's a swap/transfer from the inner instructions
+    return "Swap/Transfer" if inner else "Transaction"
+
+
+def token_flows(meta, keys, address):
+    """net balance change of the wallet per token ("SOL" or mint), only tokens that moved"""
+    if not meta:
+        return {}
+    flows = {}
+    if address in keys:
+        index = keys.index(address)
+        pre, post = meta.get("preBalances") or [], meta.get("postBalances") or []
+        if index < len(pre) and index < len(post) and post[index] != pre[index]:
+            flows["SOL"] = (post[index] - pre[index]) / 1e9
+    # token accounts owned by the wallet
+    for sign, balances in ((-1, meta.get("preTokenBalances")), (1, meta.get("postTokenBalances"))):
+        for balance in balances or []:
+            if balance.get("owner") != address:
+                continue
+            amount = (balance.get("uiTokenAmount") or {}).get("uiAmount") or 0
+            flows[balance["mint"]] = flows.get(balance["mint"], 0) + sign * amount
+    return {token: round(amount, 9) for token, amount in flows.items() if amount}
+
+
+def decode_transaction(raw, address):
+    """raw getTransaction response text -> (tx_type, skip_reason, flows)
+
+    tx_type None with no reason = decoded fine but not interesting (not our wallet / dust)
+    """
+    result = json.loads(raw).get("result")
+    if not result:
+        return None, "No transaction details", None
+    if not result.get("transaction"):
+        return None, "No transaction data", None
+    meta = result.get("meta")
+    keys = account_keys(result)
+    tx_type = classify_transaction(meta, keys, address)
+    if tx_type is None:
+        return None, None, None
+    return tx_type, None, token_flows(meta, keys, address)
+
+
+def decode_batch(items):
+    """[(raw, address)] -> [(tx_type, skip_reason, flows)], one bad payload doesn't sink the batch"""
+    results = []
+    for raw, address in items:
+        try:
+            results.append(decode_transaction(raw, address))
+        except Exception as e:
+            results.append((None, f"decode failed: {e}", None))
+    return results
+
+
+class DecodePool:
+    def __init__(self, workers=DECODE_WORKERS, batch_size=DECODE_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.executor = None
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _get_executor(self):
+        if self.executor is None:
+            # spawn, not fork - forking a process with motor/discord threads running can deadlock the child
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    async def decode(self, items):
+        """decode [(raw, address)] in the pool (inline if it's off or the batch is tiny), results in order"""
+        if not self.enabled or len(items) < DECODE_MIN_BATCH:
+            return decode_batch(items)
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        chunks = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        results = await asyncio.gather(*(loop.run_in_executor(executor, decode_batch, chunk) for chunk in chunks))
+        return [result for chunk in results for result in chunk]
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+# create single shared decode pool
+decode_pool = DecodePool()
@@ -0,0 +1,167 @@
+# digest mode - once a wallet gets busy, its alerts are held and go out as one embed per window
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone, timedelta
+import discord
+from database.db import db
+
+DIGEST_WINDOW_SECONDS = int(os.getenv('DIGEST_WINDOW_SECONDS', 60)) # default window for /digest
+DIGEST_THRESHOLD = int(os.getenv('DIGEST_THRESHOLD', 5)) # default alerts per window before we start batching
+DIGEST_TOP = int(os.getenv('DIGEST_TOP', 5)) # transactions listed in each digest
+DIGEST_LARGE_SOL = float(os.getenv('DIGEST_LARGE_SOL', 10)) # SOL moved that always alerts straight away, 0 = never
+DIGEST_MAX_WINDOW = 3600 # longest window /digest accepts
+SETTINGS_CACHE_SECONDS = 30 # how long a channel's digest settings are cached
+
+
+class DigestSettings:
+    """per-channel digest settings, stored in channel_settings and cached for a bit"""
+
+    def __init__(self):
+        self.cache = {} # channel_id -> (expires, settings or None)
+
+    @property
+    def collection(self):
+        return db.db.channel_settings
+
+    async def get(self, channel_id):
+        """the channel's digest settings, None if digest mode is off"""
+        channel_id = str(channel_id)
+        cached = self.cache.get(channel_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        doc = await self.collection.find_one({"_id": channel_id}, projection={"digest": 1})
+        settings = (doc or {}).get("digest")
+        if settings and not settings.get("enabled"):
+            settings = None
+        self.cache[channel_id] = (time.monotonic() + SETTINGS_CACHE_SECONDS, settings)
+        return settings
+
+    async def set(self, channel_id, enabled, window=DIGEST_WINDOW_SECONDS, threshold=DIGEST_THRESHOLD,
+                  large_sol=DIGEST_LARGE_SOL):
+        channel_id = str(channel_id)
+        settings = {"enabled": enabled, "window": window, "threshold": threshold, "large_sol": large_sol}
+        await self.collection.update_one(
+            {"_id": channel_id},
+            {"$set": {"digest": settings, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        self.cache.pop(channel_id, None)
+        return settings
+
+
+class Digester:
+    """decides per notification whether it goes out now or is held for the wallet's digest
+
+    burst counts live in memory, so with several delivering replicas each one counts its own share,
+    held notifications themselves are in the outbox and survive restarts
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.recent = {} # (channel_id, wallet) -> deque of monotonic times of recent alerts
+        self.open = {} # digest_key -> flush_at of the digest currently collecting
+
+    async def route(self, notification):
+        """None = send it now, otherwise (digest_key, flush_at) to hold it under"""
+        if not notification.get("wallet_address"):
+            return None
+        settings = await self.settings.get(notification["channel_id"])
+        if not settings:
+            return None
+        # big moves are what people watch a whale for, they never wait for a digest (and don't count
+        # towards the burst either)
+        large_sol = settings.get("large_sol", DIGEST_LARGE_SOL)
+        if large_sol and abs((notification.get("flows") or {}).get("SOL", 0)) >= large_sol:
+            return None
+
+        key = (notification["channel_id"], notification["wallet_address"])
+        now = time.monotonic()
+        window = settings.get("window", DIGEST_WINDOW_SECONDS)
+        recent = self.recent.setdefault(key, deque())
+        recent.append(now)
+        while recent and recent[0] < now - window:
+            recent.popleft()
+        if len(recent) <= settings.get("threshold", DIGEST_THRESHOLD):
+            return None
+
+        # over the threshold: join the open digest, or start one that closes a window from now
+        digest_key = ":".join(key)
+        flush_at = self.open.get(digest_key)
+        if flush_at is None or flush_at <= datetime.now(timezone.utc):
+            flush_at = datetime.now(timezone.utc) + timedelta(seconds=window)
+            self.open[digest_key] = flush_at
+        return digest_key, flush_at
+
+    def forget_idle(self):
+        """drop burst state for wallets that have gone quiet"""
+        now = time.monotonic()
+        longest = max(DIGEST_WINDOW_SECONDS, DIGEST_MAX_WINDOW)
+        for key in [k for k, times in self.recent.items() if not times or times[-1] < now - longest]:
+            del self.recent[key]
+        utcnow = datetime.now(timezone.utc)
+        for digest_key in [k for k, flush_at in self.open.items() if flush_at <= utcnow]:
+            del self.open[digest_key]
+
+
+def _utc(value):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value # mongo hands back naive utc
+
+
+def _short(token):
+    return token if token == "SOL" or len(token) <= 12 else f"{token[:4]}…{token[-4:]}"
+
+
+def _amount(value):
+    return f"{value:+,.4f}".rstrip("0").rstrip(".")
+
+
+def build_digest_embed(wallet_address, notifications, top=DIGEST_TOP):
+    """one embed for a batch of held alerts: counts, net flow per token and the biggest transactions"""
+    started = min(n["created_at"] for n in notifications)
+    minutes = max(1, round((datetime.now(timezone.utc) - _utc(started)).total_seconds() / 60))
+    embed = discord.Embed(
+        title=f"📦 {len(notifications)} transactions in the last {minutes} min",
+        description=f"`{wallet_address}`",
+        colour=discord.Colour.blurple(),
+        timestamp=datetime.now(timezone.utc)
+    )
+
+    counts = {}
+    failed = 0
+    flows = {}
+    for n in notifications:
+        tx_type = n.get("tx_type") or "Transaction"
+        counts[tx_type] = counts.get(tx_type, 0) + 1
+        failed += 1 if n.get("err") else 0
+        for token, amount in (n.get("flows") or {}).items():
+            flows[token] = flows.get(token, 0) + amount
+    activity = [f"{tx_type}: {count}" for tx_type, count in sorted(counts.items(), key=lambda c: -c[1])]
+    if failed:
+        activity.append(f"❌ failed: {failed}")
+    embed.add_field(name="Activity", value="\n".join(activity), inline=True)
+
+    # SOL first, then tokens by size of the move
+    moved = sorted(((t, a) for t, a in flows.items() if round(a, 9)), key=lambda f: (f[0] != "SOL", -abs(f[1])))
+    if moved:
+        lines = [f"{_short(token)}: {_amount(amount)}" for token, amount in moved[:10]]
+        if len(moved) > 10:
+            lines.append(f"…and {len(moved) - 10} more tokens")
+        embed.add_field(name="Net flows", value="\n".join(lines), inline=True)
+
+    signed = [n for n in notifications if n.get("signature")]
+    biggest = sorted(signed, key=lambda n: -abs((n.get("flows") or {}).get("SOL", 0)))[:top]
+    lines = []
+    for n in biggest:
+        sol = (n.get("flows") or {}).get("SOL")
+        amount = f" {_amount(sol)} SOL" if sol else ""
+        status = " ❌" if n.get("err") else ""
+        lines.append(f"[`{n['signature'][:8]}…`](https://solscan.io/tx/{n['signature']}) {n.get('tx_type') or 'Transaction'}{amount}{status}")
+    if lines:
+        embed.add_field(name="Top transactions", value="\n".join(lines)[:1024], inline=False)
+    return embed
+
+
+# shared settings store + router for the delivery loop
+digest_settings = DigestSettings()
+digester = Digester(digest_settings)
@@ -0,0 +1,221 @@
+# local event stream - the alerts the delivery loop sends to discord, also streamed over http as
+# server-sent events (/events) or ndjson (/events.ndjson) for dashboards and other consumers
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from aiohttp import web
+from metrics import metrics
+from shutdown import save_snapshot, load_snapshot
+
+EVENT_STREAM_HOST = os.getenv('EVENT_STREAM_HOST', '127.0.0.1')
+EVENT_STREAM_PORT = int(os.getenv('EVENT_STREAM_PORT', 0)) # 0 = don't serve
+EVENT_STREAM_BUFFER = int(os.getenv('EVENT_STREAM_BUFFER', 256)) # events queued per client before it counts as slow
+EVENT_STREAM_HISTORY = int(os.getenv('EVENT_STREAM_HISTORY', 10000)) # recent events kept for resuming from a cursor
+EVENT_STREAM_SLOW = os.getenv('EVENT_STREAM_SLOW', 'drop') # slow clients: "drop" events (they get a gap) or "disconnect"
+HEARTBEAT_SECONDS = 15 # keeps proxies from closing idle streams
+RECENT_KEYS = 50000 # (wallet, signature) pairs remembered so retries/extra channels aren't streamed twice
+
+STREAM_CLIENTS = metrics.gauge("solspear_event_stream_clients", "connected event stream clients")
+STREAM_EVENTS = metrics.counter("solspear_event_stream_events_total", "events published to the stream")
+STREAM_DROPPED = metrics.counter(
+    "solspear_event_stream_dropped_total", "events a slow client missed, or clients cut off", ("action",)
+)
+
+
+def _split(value):
+    return {v.strip() for v in value.split(',') if v.strip()} if value else None
+
+
+class _Client:
+    def __init__(self, wallets=None, mints=None, types=None, buffer=EVENT_STREAM_BUFFER):
+        self.wallets = wallets
+        self.mints = mints
+        self.types = types
+        self.queue = asyncio.Queue(maxsize=buffer)
+        self.gap = False # dropped something since the last event it got
+        self.closed = False
+
+    def close(self):
+        """cut the client off, the handler wakes up on the None and ends the response"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    def wants(self, event):
+        if self.wallets and event["wallet"] not in self.wallets:
+            return False
+        if self.types and event["type"] not in self.types:
+            return False
+        if self.mints and not self.mints & set(event.get("flows") or {}):
+            return False
+        return True
+
+
+class EventStream:
+    def __init__(self):
+        # cursors keep going up across restarts as long as we average under 1000 events/ms
+        self.seq = int(time.time() * 1000)
+        self.history = deque(maxlen=EVENT_STREAM_HISTORY)
+        self.clients = set()
+        self._seen = set()
+        self._seen_order = deque()
+        self._runner = None
+
+    def _first_time(self, key):
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        self._seen_order.append(key)
+        if len(self._seen_order) > RECENT_KEYS:
+            self._seen.discard(self._seen_order.popleft())
+        return True
+
+    def publish_notification(self, notification):
+        """stream an outbox notification as a wallet event (once per wallet + signature)"""
+        if not notification.get("signature") or not notification.get("wallet_address"):
+            return
+        if not self._first_time((notification["wallet_address"], notification["signature"])):
+            return
+        detected_at = notification.get("detected_at")
+        self.publish({
+            "type": notification.get("tx_type") or "Transaction",
+            "wallet": notification["wallet_address"],
+            "signature": notification["signature"],
+            "slot": notification.get("slot"),
+            "block_time": notification.get("block_time"),
+            "detected_at": detected_at.isoformat() if hasattr(detected_at, "isoformat") else detected_at,
+            "err": notification.get("err", False),
+            "flows": notification.get("flows") or {},
+            "path": notification.get("path")
+        })
+
+    def publish(self, event):
+        self.seq += 1
+        event = {"seq": self.seq, **event}
+        self.history.append(event)
+        STREAM_EVENTS.inc()
+        for client in list(self.clients):
+            if client.closed or not client.wants(event):
+                continue
+            try:
+                client.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                if EVENT_STREAM_SLOW == "disconnect":
+                    client.close()
+                    STREAM_DROPPED.inc(action="disconnect")
+                else:
+                    client.gap = True
+                    STREAM_DROPPED.inc(action="drop")
+
+    def backlog(self, client, cursor):
+        """events after cursor from history for a resuming client, and whether some are gone already"""
+        events = [e for e in self.history if e["seq"] > cursor and client.wants(e)]
+        missed = cursor < self.seq and (not self.history or self.history[0]["seq"] > cursor + 1)
+        return events, missed
+
+    async def _handle(self, request):
+        ndjson = request.path.endswith(".ndjson") or request.query.get("format") == "ndjson"
+        client = _Client(
+            _split(request.query.get("wallet")), _split(request.query.get("mint")), _split(request.query.get("type"))
+        )
+        cursor = request.query.get("cursor") or request.headers.get("Last-Event-ID")
+        try:
+            cursor = int(cursor) if cursor else None
+        except ValueError:
+            return web.Response(status=400, text="cursor should be the seq of the last event you got\n")
+
+        response = web.StreamResponse(headers={
+            "Content-Type": "application/x-ndjson" if ndjson else "text/event-stream",
+            "Cache-Control": "no-cache"
+        })
+        await response.prepare(request)
+
+        async def send(kind, data):
+            if ndjson:
+                line = json.dumps({"event": kind, **data}, default=str) + "\n"
+            else:
+                seq = f"id: {data['seq']}\n" if "seq" in data else ""
+                line = f"{seq}event: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+            await response.write(line.encode())
+
+        # register before replaying so nothing published in between is missed, duplicates are skipped by seq
+        self.clients.add(client)
+        STREAM_CLIENTS.set(len(self.clients))
+        last = cursor or 0
+        try:
+            if cursor is not None:
+                events, missed = self.backlog(client, cursor)
+                if missed:
+                    await send("gap", {"reason": "cursor is older than the replay history", "cursor": cursor})
+                for event in events:
+                    await send("transaction", event)
+                    last = event["seq"]
+            while not client.closed:
+                try:
+                    event = await asyncio.wait_for(client.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if ndjson:
+                        await response.write(b"\n")
+                    else:
+                        await response.write(b": ping\n\n")
+                    continue
+                if event is None:
+                    break # too slow, disconnected
+                if event["seq"] <= last:
+                    continue
+                await send("transaction", event)
+                last = event["seq"]
+                if client.gap and client.queue.empty():
+                    # everything queued before the drop is out, reconnect from this cursor to fill the gap
+                    client.gap = False
+                    await send("gap", {"reason": "client too slow, events dropped", "cursor": last})
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass # client went away
+        finally:
+            self.clients.discard(client)
+            STREAM_CLIENTS.set(len(self.clients))
+        return response
+
+    def save(self):
+        """snapshot recent events so clients can still resume from their cursor after a restart"""
+        save_snapshot("event_stream", {"seq": self.seq, "history": list(self.history)})
+
+    def restore(self):
+        data, _ = load_snapshot("event_stream")
+        if not data:
+            return
+        self.history.extend(data.get("history") or [])
+        self.seq = max(self.seq, data.get("seq") or 0)
+        for event in self.history:
+            self._first_time((event["wallet"], event["signature"]))
+        logging.info(f"restored {len(self.history)} stream events from the last run")
+
+    async def serve(self, host=EVENT_STREAM_HOST, port=EVENT_STREAM_PORT):
+        """start the stream endpoints on the running loop (no-op if port is 0 or already serving)"""
+        if not port or self._runner:
+            return
+        app = web.Application()
+        app.router.add_get("/events", self._handle)
+        app.router.add_get("/events.ndjson", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, host, port).start()
+            logging.info(f"event stream on http://{host}:{port}/events")
+        except OSError as e:
+            logging.error(f"couldn't start event stream on {host}:{port}: {e}")
+
+    async def stop(self):
+        for client in list(self.clients):
+            client.close() # end open streams now rather than waiting on the server's shutdown timeout
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# create single shared stream
+event_stream = EventStream()
@@ -0,0 +1,113 @@
+# fair-share ordering for the poll loop - tenants (guilds, or users tracking outside a guild) take
+# turns instead of whoever tracks the most wallets filling the front of every tick
+import heapq
+import os
+import time
+from metrics import metrics
+
+TENANT_QUOTA = int(os.getenv('TENANT_QUOTA', 0)) # addresses a tenant gets polled per tick, 0 = no cap
+USER_QUOTA = int(os.getenv('USER_QUOTA', 0)) # same per user within a guild, 0 = no cap
+POLL_TICK_BUDGET = float(os.getenv('POLL_TICK_BUDGET', 0)) # seconds a tick may run before the rest waits, 0 = no limit
+TENANT_WEIGHTS = dict( # e.g. "guild:123=2,user:456=0.5", everyone else has weight 1
+    (name.strip(), float(weight)) for name, weight in
+    (pair.split('=') for pair in os.getenv('TENANT_WEIGHTS', '').split(',') if '=' in pair)
+)
+
+TENANT_POLL_LAG = metrics.gauge(
+    "solspear_tenant_poll_lag_seconds", "seconds since the tenant's least recently polled wallet was polled", ("tenant",)
+)
+TENANT_DEFERRED = metrics.gauge(
+    "solspear_tenant_deferred_wallets", "wallets left for the next tick by quota or tick budget", ("tenant",)
+)
+TENANT_POLLS = metrics.counter("solspear_tenant_polls_total", "addresses polled, charged to a tenant", ("tenant",))
+
+
+def tenant_of(wallet):
+    """the tenant a tracking doc belongs to: its guild, or the user when we don't know the guild"""
+    if wallet.get("guild_id"):
+        return f"guild:{wallet['guild_id']}"
+    return f"user:{wallet.get('user_id')}"
+
+
+class FairScheduler:
+    """weighted fair queuing between tenants, round robin between users of a tenant,
+    least recently polled first within a user - so deferred wallets lead the next tick"""
+
+    def __init__(self, quota=TENANT_QUOTA, user_quota=USER_QUOTA, weights=None, budget=POLL_TICK_BUDGET):
+        self.quota = quota
+        self.user_quota = user_quota
+        self.weights = TENANT_WEIGHTS if weights is None else weights
+        self.budget = budget
+        self.last_polled = {} # address -> monotonic time it was last polled
+        self.tenants = {} # tenant -> addresses it tracks, from the last plan
+        self.charged_to = {} # address -> tenant whose turn it was polled on, for this tick
+        self.tick_started = 0.0
+
+    def _queue(self, docs_by_user):
+        """one tenant's addresses: users interleaved, each user's oldest-polled first, user quota applied"""
+        per_user = [
+            sorted(addresses, key=lambda a: (self.last_polled.get(a, 0.0), a))[:self.user_quota or None]
+            for addresses in docs_by_user.values()
+        ]
+        queue = []
+        for i in range(max((len(a) for a in per_user), default=0)):
+            queue.extend(addresses[i] for addresses in per_user if i < len(addresses))
+        return queue
+
+    def plan(self, grouped):
+        """order {address: docs} for one tick -> [(address, docs)], quotas already applied"""
+        self.tick_started = time.monotonic()
+        by_tenant = {}
+        for address, docs in grouped.items():
+            for doc in docs:
+                by_tenant.setdefault(tenant_of(doc), {}).setdefault(str(doc.get("user_id")), set()).add(address)
+        self.tenants = {tenant: set().union(*users.values()) for tenant, users in by_tenant.items()}
+        queues = {tenant: self._queue(users) for tenant, users in by_tenant.items()}
+
+        # every tenant's virtual clock starts at 0 and advances 1/weight per address it's charged,
+        # the lowest clock goes next - so with equal weights tenants simply take turns
+        heap = [(0.0, tenant) for tenant in queues]
+        heapq.heapify(heap)
+        positions = dict.fromkeys(queues, 0)
+        charged = dict.fromkeys(queues, 0)
+        self.charged_to = {}
+        order = []
+        while heap:
+            clock, tenant = heapq.heappop(heap)
+            queue = queues[tenant]
+            # an address someone else already got polled is covered for this tenant too, free of charge
+            while positions[tenant] < len(queue) and queue[positions[tenant]] in self.charged_to:
+                positions[tenant] += 1
+            if positions[tenant] >= len(queue):
+                continue
+            address = queue[positions[tenant]]
+            positions[tenant] += 1
+            self.charged_to[address] = tenant
+            order.append((address, grouped[address]))
+            charged[tenant] += 1
+            if self.quota and charged[tenant] >= self.quota:
+                continue # quota used up, the rest of this tenant waits for the next tick
+            heapq.heappush(heap, (clock + 1 / self.weights.get(tenant, 1.0), tenant))
+        return order
+
+    def over_budget(self):
+        return bool(self.budget) and time.monotonic() - self.tick_started > self.budget
+
+    def polled(self, address):
+        self.last_polled[address] = time.monotonic()
+        TENANT_POLLS.inc(tenant=self.charged_to.get(address, "-"))
+
+    def report(self):
+        """refresh the per-tenant lag / deferred gauges after a tick"""
+        now = time.monotonic()
+        TENANT_POLL_LAG.values.clear() # tenants that stopped tracking drop out
+        TENANT_DEFERRED.values.clear()
+        for tenant, addresses in self.tenants.items():
+            # never-polled wallets count from the start of this tick
+            oldest = min(self.last_polled.get(a, self.tick_started) for a in addresses)
+            TENANT_POLL_LAG.set(now - oldest, tenant=tenant)
+            TENANT_DEFERRED.set(sum(1 for a in addresses if self.last_polled.get(a, 0.0) < self.tick_started), tenant=tenant)
+        # forget wallets nobody tracks any more
+        tracked = set().union(*self.tenants.values()) if self.tenants else set()
+        for address in [a for a in self.last_polled if a not in tracked]:
+            del self.last_polled[address]
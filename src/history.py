@@ -0,0 +1,91 @@
+# /history pages - stored transaction summaries for a wallet, paged with buttons along the
+# (wallet_address, slot) index instead of skip()
+import discord
+from database.db import db
+
+HISTORY_PAGE_SIZE = 10 # transactions per page
+HISTORY_TIMEOUT = 300 # seconds the buttons keep working
+
+
+def _flow_text(flows):
+    """SOL plus the biggest token move, enough for one line"""
+    if not flows:
+        return ""
+    parts = []
+    if flows.get("SOL"):
+        parts.append(f"{flows['SOL']:+,.4f} SOL")
+    tokens = sorted(((t, a) for t, a in flows.items() if t != "SOL"), key=lambda f: -abs(f[1]))
+    if tokens:
+        mint, amount = tokens[0]
+        parts.append(f"{amount:+,.4g} {mint[:4]}…{mint[-4:]}")
+        if len(tokens) > 1:
+            parts.append(f"+{len(tokens) - 1} more")
+    return " · ".join(parts)
+
+
+def render_history_embed(wallet_address, rows, page):
+    embed = discord.Embed(
+        title=f"history for {wallet_address[:4]}…{wallet_address[-4:]}",
+        colour=discord.Colour.blurple()
+    )
+    if not rows:
+        embed.description = "no stored transactions here"
+        return embed
+    lines = []
+    for row in rows:
+        when = f"<t:{row['block_time']}:R>" if row.get("block_time") else f"slot {row['slot']}"
+        status = " ❌" if row.get("err") else ""
+        flows = _flow_text(row.get("flows"))
+        lines.append(
+            f"{when} · {row.get('tx_type') or 'Transaction'}{status}"
+            f"{' · ' + flows if flows else ''} · [`{row['signature'][:8]}…`](https://solscan.io/tx/{row['signature']})"
+        )
+    embed.description = "\n".join(lines)
+    embed.set_footer(text=f"page {page} · slots {rows[-1]['slot']}-{rows[0]['slot']}")
+    return embed
+
+
+class HistoryView(discord.ui.View):
+    """newer/older buttons, each page is one indexed query continuing from the edge of the last"""
+
+    def __init__(self, wallet_address, user_id, page_size=HISTORY_PAGE_SIZE):
+        super().__init__(timeout=HISTORY_TIMEOUT)
+        self.wallet_address = wallet_address
+        self.user_id = user_id
+        self.page_size = page_size
+        self.rows = []
+        self.page = 1
+        self.has_newer = False
+        self.has_older = False
+
+    async def load(self, after=None, newer=False, step=0):
+        """fetch one page (plus one row to see if there's another) and update the buttons"""
+        rows = await db.get_history(self.wallet_address, after=after, newer=newer, limit=self.page_size + 1)
+        more = len(rows) > self.page_size
+        if more:
+            rows = rows[1:] if newer else rows[:-1] # the extra row is on the far side
+        if rows:
+            self.rows = rows
+            self.page = max(1, self.page + step)
+            self.has_older = more if not newer else True
+            self.has_newer = more if newer else after is not None
+        elif newer:
+            self.has_newer = False # nothing left that way (expired or never there), stay put
+        else:
+            self.has_older = False
+        self.older.disabled = not self.has_older
+        self.newer.disabled = not self.has_newer
+        return render_history_embed(self.wallet_address, self.rows, self.page)
+
+    async def interaction_check(self, interaction):
+        return interaction.user.id == self.user_id
+
+    @discord.ui.button(label="◀ newer", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        embed = await self.load(after=self.rows[0]["cursor"], newer=True, step=-1)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="older ▶", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        embed = await self.load(after=self.rows[-1]["cursor"], step=1)
+        await interaction.response.edit_message(embed=embed, view=self)
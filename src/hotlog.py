@@ -0,0 +1,75 @@
+# logging for hot paths - level checked before anything is formatted, sampled, plus a ring of recent raw frames
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', 100)) # keep 1 in n hot-path records
+FRAME_RING_SIZE = int(os.getenv('FRAME_RING_SIZE', 256)) # raw frames kept for dumps
+FRAME_DUMP_DIR = os.getenv('FRAME_DUMP_DIR', 'frame_dumps')
+
+
+class HotLogger:
+    """sampled structured records, nothing is built unless the level is on and the sample hits
+
+    usage: `if hot.enabled(): hot.log("ws.frame", slot=slot)` - the check is the cheap part, keep
+    anything expensive (decoding, len() on big payloads) inside the if
+    """
+
+    def __init__(self, name, level=logging.DEBUG, sample_every=LOG_SAMPLE_EVERY):
+        self.logger = logging.getLogger(name)
+        self.level = level
+        self.sample_every = max(1, sample_every)
+        self._counter = itertools.count()
+
+    def enabled(self):
+        # isEnabledFor caches per level, so this is a dict lookup when logging is off
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        return next(self._counter) % self.sample_every == 0
+
+    def log(self, event, **fields):
+        # lazy %-args, the json only gets built if a handler actually formats the record
+        self.logger.log(self.level, "%s %s", event, _Fields(fields), extra={"event": event, "fields": fields})
+
+
+class _Fields:
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, default=str, separators=(",", ":"))
+
+
+class FrameRing:
+    """last n raw frames as received, dumped to disk when something goes wrong"""
+
+    def __init__(self, size=FRAME_RING_SIZE, dump_dir=FRAME_DUMP_DIR):
+        self.frames = deque(maxlen=size)
+        self.dump_dir = dump_dir
+
+    def append(self, raw, received_at=None):
+        # store the raw text, no decoding on the hot path
+        self.frames.append((received_at or time.time(), raw))
+
+    def dump(self, reason=""):
+        """write the ring out as ndjson, returns the path (None if there was nothing to dump)"""
+        if not self.frames:
+            return None
+        os.makedirs(self.dump_dir, exist_ok=True)
+        path = os.path.join(self.dump_dir, f"frames-{int(time.time() * 1000)}.ndjson")
+        try:
+            with open(path, "w") as f:
+                for received_at, raw in list(self.frames):
+                    if isinstance(raw, bytes):
+                        raw = raw.decode("utf-8", "replace")
+                    f.write(json.dumps({"t": received_at, "frame": raw}) + "\n")
+        except OSError as e:
+            logging.error(f"couldn't dump frame ring to {path}: {e}")
+            return None
+        logging.error(f"dumped {len(self.frames)} recent frames to {path} ({reason})")
+        return path
@@ -0,0 +1,65 @@
+# end-to-end alert latency: on-chain block time -> detected by us -> delivered to discord
+from collections import deque
+from datetime import datetime, timezone
+from metrics import metrics
+
+WINDOW = 1000 # samples kept per (path, endpoint, stage)
+
+ALERT_LATENCY = metrics.histogram(
+    "solspear_alert_latency_seconds", "seconds from block time to detection/delivery",
+    ("path", "stage"), buckets=(0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60, 120, 300)
+)
+
+
+def to_epoch(value):
+    """block times are unix seconds, our own timestamps are datetimes, make them comparable"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc) # mongo hands back naive utc
+        return value.timestamp()
+    return float(value)
+
+
+class LatencyTracker:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.samples = {} # (path, endpoint, stage) -> deque of seconds
+
+    def record(self, path, stage, seconds, endpoint=None):
+        if seconds is None or seconds < 0:
+            return # clock skew or missing block time, not worth recording
+        key = (path, endpoint or "-", stage)
+        if key not in self.samples:
+            self.samples[key] = deque(maxlen=self.window)
+        self.samples[key].append(seconds)
+        ALERT_LATENCY.observe(seconds, path=path, stage=stage)
+
+    def record_event(self, event, delivered_at=None, deliver_stage="deliver"):
+        """record detect (and delivery, if given) latency for an event dict with block_time/detected_at/path"""
+        block_time = to_epoch(event.get("block_time"))
+        if block_time is None:
+            return
+        path = event.get("path", "poll")
+        endpoint = event.get("endpoint")
+        detected_at = to_epoch(event.get("detected_at"))
+        if detected_at is not None:
+            self.record(path, "detect", detected_at - block_time, endpoint)
+        if delivered_at is not None:
+            self.record(path, deliver_stage, to_epoch(delivered_at) - block_time, endpoint)
+
+    def summary(self):
+        """[(path, endpoint, stage, count, p50, p95, p99)] sorted by path/endpoint/stage"""
+        rows = []
+        for (path, endpoint, stage), values in sorted(self.samples.items()):
+            if not values:
+                continue
+            ordered = sorted(values)
+            pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+            rows.append((path, endpoint, stage, len(ordered), pick(0.5), pick(0.95), pick(0.99)))
+        return rows
+
+
+# create single shared tracker
+latency_tracker = LatencyTracker()
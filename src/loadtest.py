@@ -0,0 +1,176 @@
+# load test - sweep watchlist sizes against mock_node.py and print throughput/latency per ingestion path
+#
+#   python src/loadtest.py --wallets 100,1000,5000,10000 --paths ws,blockscan --duration 20
+#   python src/loadtest.py --wallets 1000,10000 --paths poll --latency 0.02 --rate-limit 0.02   # needs MONGODB_URI
+import argparse
+import asyncio
+import time
+from replay import drive_poll, poll_stage_means # first: sets the scratch db / rate limit defaults
+import websockets
+from base58 import b58decode
+from mock_node import MockNode, add_traffic_args
+from rpc_pool import RpcPool, PooledClient
+from metadata_router import metadata_router, Provider
+from metrics import POLL_STAGE_SECONDS, RPC_RATE_LIMITED
+from latency import latency_tracker
+from tracing import tracer
+
+POLL_INTERVAL = 10 # same as the bot's check_transactions loop
+
+
+def synthetic_metadata(delay=0.0):
+    """metadata provider for the mock mints, so swaps resolve without touching the internet"""
+    async def fetch(session, mint):
+        if delay:
+            await asyncio.sleep(delay)
+        return {"symbol": mint[:4].upper(), "name": f"mock {mint[:6]}", "decimals": 6}
+    return Provider("mock", fetch)
+
+
+def span_percentile(name, pct):
+    values = sorted(s.duration for s in tracer.finished if s.name == name)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct))] * 1000
+
+
+def span_count(name):
+    return sum(1 for s in tracer.finished if s.name == name)
+
+
+async def run_ws(node, pool, duration):
+    """one WalletMonitor on the node's firehose, reconnecting whenever the node drops us"""
+    from v2_bot import WalletMonitor # imported late, it sets up logging on import
+    monitor = WalletMonitor()
+    monitor.rpc_pool = pool
+    monitor.ws_endpoint = node.ws_url
+    reconnects = 0
+    started = time.perf_counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            async with websockets.connect(node.ws_url, max_size=None) as websocket:
+                await monitor.subscribe_to_wallet(websocket)
+                await asyncio.wait_for(monitor.handle_messages(websocket), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            break
+        except websockets.exceptions.ConnectionClosed:
+            reconnects += 1
+    elapsed = time.perf_counter() - started
+    detect = sorted(v for (path, _, stage), values in latency_tracker.samples.items()
+                    if path == "websocket" and stage == "detect" for v in values)
+    return {
+        "frames/s": span_count("handle_messages.frame") / elapsed,
+        "frame p95 ms": span_percentile("handle_messages.frame", 0.95),
+        "detect p95 s": detect[int(len(detect) * 0.95)] if detect else None,
+        "backlog": monitor.frame_queue.qsize(), # frames read but not handled yet when time ran out
+        "reconnects": reconnects,
+    }
+
+
+async def run_blockscan(node, pool, duration):
+    """follow the node's blocks with every mock wallet tracked, report whether we keep up"""
+    from block_scanner import BlockScanner
+    scanner = BlockScanner(on_match=None, pool=pool)
+    docs = {address: [{"wallet_address": address, "channel_id": 0}] for address in node.wallets}
+    scanner.tracked_b58 = docs
+    scanner.tracked_raw = {b58decode(address): wallets for address, wallets in docs.items()}
+    next_slot = node.slot - 20
+    blocks = matches = 0
+    started = time.perf_counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        if next_slot > node.slot:
+            await asyncio.sleep(0.05)
+            continue
+        with tracer.span("blockscan.get_block"):
+            block = await scanner.get_block(next_slot)
+        with tracer.span("blockscan.match"):
+            matches += sum(1 for _ in scanner.match_block(next_slot, block or {}))
+        blocks += 1
+        next_slot += 1
+    return {
+        "blocks/s": blocks / (time.perf_counter() - started),
+        "matches": matches,
+        "match p95 ms": span_percentile("blockscan.match", 0.95),
+        "lag slots": node.slot - next_slot + 1,
+    }
+
+
+async def run_poll(node, pool, duration):
+    """the check_transactions poll loop over every mock wallet, ticking every POLL_INTERVAL"""
+    wallets = [{"wallet_address": address, "user_id": 0, "channel_id": 0} for address in node.wallets]
+    ticks = max(2, int(duration // POLL_INTERVAL)) # the first tick only sets cursors
+    POLL_STAGE_SECONDS.values.clear()
+    result = await drive_poll(PooledClient(pool), wallets, [i * POLL_INTERVAL for i in range(ticks)], speed=1)
+    return {
+        "wallets/s": span_count("poll_address") / result["elapsed"],
+        "tick p50 s": span_percentile("check_transactions", 0.5) / 1000,
+        "tick max s": span_percentile("check_transactions", 1.0) / 1000,
+        "poll p95 ms": span_percentile("poll_address", 0.95),
+        "rpc mean ms": poll_stage_means().get("rpc", 0) * 1000,
+    }
+
+
+async def sweep(args):
+    runners = {"ws": run_ws, "blockscan": run_blockscan, "poll": run_poll}
+    results = []
+    for count in args.wallets:
+        node = MockNode(count, args.tx_per_wallet_min, args.latency, args.rate_limit, args.disconnect_every)
+        await node.start()
+        pool = RpcPool([node.http_url], [node.ws_url])
+        metadata_router.providers = [synthetic_metadata(args.metadata_latency)]
+        print(f"\n== {count} wallets, {node.tx_rate:.1f} tx/s")
+        try:
+            for path in args.paths:
+                tracer.clear(keep=1_000_000)
+                latency_tracker.samples.clear()
+                throttled = sum(RPC_RATE_LIMITED.values.values())
+                stats = await runners[path](node, pool, args.duration)
+                stats["429s"] = sum(RPC_RATE_LIMITED.values.values()) - throttled
+                results.append((count, path, stats))
+                print(f"   {path:<10}" + "  ".join(f"{k}={_fmt(v)}" for k, v in stats.items()))
+        finally:
+            await pool.close()
+            await node.stop()
+    await metadata_router.close()
+    if "poll" in args.paths:
+        from database.db import db
+        await db.close()
+
+    # the curves: one row per wallet count per path
+    print("\n== summary")
+    for path in args.paths:
+        rows = [(count, stats) for count, p, stats in results if p == path]
+        if not rows:
+            continue
+        keys = list(rows[0][1])
+        print(f"\n{path}")
+        print(f"   {'wallets':>8}" + "".join(f"{k:>15}" for k in keys))
+        for count, stats in rows:
+            print(f"   {count:>8}" + "".join(f"{_fmt(stats[k]):>15}" for k in keys))
+
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return f"{value:,}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sweep wallet counts against a local mock solana node")
+    parser.add_argument("--wallets", default="100,1000,5000,10000", help="comma separated wallet counts")
+    parser.add_argument("--paths", default="ws,blockscan", help="any of ws,blockscan,poll (poll needs mongodb)")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per path per wallet count")
+    parser.add_argument("--metadata-latency", type=float, default=0.0, help="seconds each metadata lookup takes")
+    add_traffic_args(parser)
+    args = parser.parse_args()
+    args.wallets = [int(w) for w in args.wallets.split(",") if w.strip()]
+    args.paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    asyncio.run(sweep(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# token metadata provider router - per-provider timeouts, circuit breakers and latency/success ranking
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional, Dict
+import aiohttp
+from rpc_pool import rpc_pool
+from tracing import tracer
+from recorder import recorder
+
+DEXSCREENER_API = "https://api.dexscreener.com/latest/dex/tokens"
+JUPITER_API = "https://token.jup.ag/all"
+SOLSCAN_API = "https://public-api.solscan.io/token/meta"
+
+METADATA_TIMEOUT = float(os.getenv('METADATA_TIMEOUT', 3)) # seconds a provider gets before we move on
+METADATA_RACE = os.getenv('METADATA_RACE', 'false').lower() == 'true' # race the top two providers
+BREAKER_FAILURES = 5 # consecutive failures before a provider is skipped
+BREAKER_RESET_SECONDS = 30 # how long it's skipped before one trial request is let through
+JUPITER_REFRESH_SECONDS = 3600 # jupiter only serves its whole token list, re-downloaded this often
+JUPITER_LIST_TIMEOUT = 60 # that list is big, so its download doesn't get the per-lookup timeout
+JUPITER_RETRY_SECONDS = 60 # wait after a failed download
+
+
+class CircuitBreaker:
+    """closed -> open after n failures in a row -> half open after a cool-down -> closed on success"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    @property
+    def available(self):
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def allow(self):
+        """claim permission for one request"""
+        if not self.available:
+            return False
+        if self.state == "half_open":
+            self.trial_in_flight = True # only one trial request at a time
+        return True
+
+    def on_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def on_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class Provider:
+    def __init__(self, name, fetch, timeout=METADATA_TIMEOUT, ready=None):
+        self.name = name
+        self.fetch = fetch # async fetch(session, mint) -> dict or None (None = doesn't know this token)
+        self.ready = ready or (lambda session: True) # False = leave it out of the ranking for now
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=50)
+        self.results = deque(maxlen=50) # True = answered (even "not found"), False = error/timeout
+
+    @property
+    def score(self):
+        """success rate over average latency, unknown providers start optimistic"""
+        success = self.results.count(True) / len(self.results) if self.results else 1.0
+        latency = sum(self.latencies) / len(self.latencies) if self.latencies else 0.1
+        return success / max(latency, 0.001)
+
+    async def call(self, session, mint):
+        if not self.breaker.allow():
+            raise RuntimeError(f"{self.name} circuit open")
+        started = time.monotonic()
+        try:
+            with tracer.span(f"metadata.{self.name}", mint=mint[:8]):
+                result = await asyncio.wait_for(self.fetch(session, mint), self.timeout)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                self.breaker.trial_in_flight = False # lost a race, says nothing about health
+                raise
+            self.results.append(False)
+            self.breaker.on_failure()
+            logging.warning(f"metadata provider {self.name} failed for {mint}: {e!r}")
+            raise
+        self.latencies.append(time.monotonic() - started)
+        self.results.append(True)
+        self.breaker.on_success()
+        if recorder.enabled:
+            recorder.http(self.name, mint, result)
+        return result
+
+
+async def fetch_dexscreener(session, mint):
+    async with session.get(f"{DEXSCREENER_API}/{mint}") as response:
+        if response.status != 200:
+            raise RuntimeError(f"dexscreener returned {response.status}")
+        data = await response.json()
+    if not data.get("pairs"):
+        return None
+    token_info = data["pairs"][0]
+    base_token = token_info.get("baseToken", {})
+    quote_token = token_info.get("quoteToken", {})
+    token_data = base_token if (base_token.get("address") or "").lower() == mint.lower() else quote_token
+    return {
+        "symbol": token_data.get("symbol", "Unknown"),
+        "name": token_data.get("name", "Unknown Token"),
+        "decimals": int(token_data.get("decimals", 9)),
+    }
+
+
+class JupiterTokenList:
+    """jupiter's token list, downloaded in the background once per refresh interval and looked up in memory"""
+
+    def __init__(self):
+        self.tokens = None # mint -> metadata, None until the first download lands
+        self.next_refresh = 0
+        self._task = None
+
+    def ready(self, session):
+        """start a download if one is due, True once there's a list to look mints up in"""
+        due = time.monotonic() >= self.next_refresh and (self._task is None or self._task.done())
+        if due and session is not None:
+            self._task = asyncio.create_task(self._download(session))
+        return self.tokens is not None
+
+    async def _download(self, session):
+        try:
+            timeout = aiohttp.ClientTimeout(total=JUPITER_LIST_TIMEOUT)
+            with tracer.span("metadata.jupiter_list"):
+                async with session.get(JUPITER_API, timeout=timeout) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f"jupiter returned {response.status}")
+                    tokens = await response.json()
+            self.tokens = {
+                token["address"]: {
+                    "symbol": token.get("symbol", "Unknown"),
+                    "name": token.get("name", "Unknown Token"),
+                    "decimals": token.get("decimals", 9),
+                }
+                for token in tokens if token.get("address")
+            }
+            self.next_refresh = time.monotonic() + JUPITER_REFRESH_SECONDS
+            logging.info(f"loaded {len(self.tokens)} tokens from jupiter")
+        except Exception as e:
+            self.next_refresh = time.monotonic() + JUPITER_RETRY_SECONDS
+            logging.warning(f"couldn't download the jupiter token list: {e!r}")
+
+    async def fetch(self, session, mint):
+        return (self.tokens or {}).get(mint)
+
+
+async def fetch_solscan(session, mint):
+    headers = {"accept": "application/json"}
+    async with session.get(f"{SOLSCAN_API}/{mint}", headers=headers) as response:
+        if response.status != 200:
+            raise RuntimeError(f"solscan returned {response.status}")
+        data = await response.json()
+    if not data.get("success", False):
+        return None
+    return {
+        "symbol": data.get("symbol", "Unknown"),
+        "name": data.get("name", "Unknown Token"),
+        "decimals": data.get("decimals", 9),
+    }
+
+
+async def fetch_onchain(session, mint):
+    result = await rpc_pool.request("getAccountInfo", [mint, {"encoding": "jsonParsed"}])
+    value = (result or {}).get("value")
+    if not value or "parsed" not in (value.get("data") or {}):
+        return None
+    info = value["data"]["parsed"]["info"]
+    return {
+        "symbol": info.get("symbol", "Unknown"),
+        "name": info.get("name", "Unknown Token"),
+        "decimals": info.get("decimals", 9),
+    }
+
+
+class MetadataRouter:
+    def __init__(self, providers=None, race=METADATA_RACE):
+        # list order is the tie-breaker until we have stats
+        self.providers = providers or [
+            Provider("dexscreener", fetch_dexscreener),
+            Provider("jupiter", jupiter_tokens.fetch, ready=jupiter_tokens.ready),
+            Provider("solscan", fetch_solscan),
+            Provider("onchain", fetch_onchain),
+        ]
+        self.race = race
+        self.session = None
+
+    async def _get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    def ranked(self, session=None):
+        """providers whose breaker lets them through (and that are ready), best first"""
+        order = {p.name: i for i, p in enumerate(self.providers)}
+        available = [p for p in self.providers if p.breaker.available and p.ready(session)]
+        return sorted(available, key=lambda p: (-p.score, order[p.name]))
+
+    async def _try(self, provider, session, mint):
+        try:
+            return await provider.call(session, mint)
+        except Exception:
+            return None
+
+    async def _race(self, providers, session, mint):
+        """run providers at once, first non-empty answer wins and the rest are cancelled"""
+        tasks = [asyncio.create_task(self._try(p, session, mint)) for p in providers]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result:
+                    return result
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @tracer.traced("metadata.resolve")
+    async def resolve(self, mint: str) -> Optional[Dict]:
+        """get metadata for a mint from the best available provider, None if nobody knows it"""
+        session = await self._get_session()
+        providers = self.ranked(session)
+        if self.race and len(providers) >= 2:
+            result = await self._race(providers[:2], session, mint)
+            if result:
+                return result
+            providers = providers[2:]
+        for provider in providers:
+            result = await self._try(provider, session, mint)
+            if result:
+                return result
+        return None
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+
+# create single shared token list + router
+jupiter_tokens = JupiterTokenList()
+metadata_router = MetadataRouter()
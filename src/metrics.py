@@ -0,0 +1,177 @@
+# tiny metrics registry exported in prometheus text format from a local http endpoint
+import bisect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from aiohttp import web
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108)) # bot.py's port, the other processes count up from it, 0 = don't serve
+# so every process on a host gets its own port: bot.py +0, v2_bot.py +2, worker.py +3 + WORKER_INDEX
+# (+1 is left for the event stream)
+V2_BOT_PORT_OFFSET = 2
+WORKER_PORT_OFFSET = 3
+
+
+def metrics_port(offset=0):
+    """this process's metrics port, 0 if metrics are off"""
+    return METRICS_PORT + offset if METRICS_PORT else 0
+
+# seconds, tuned for things between a cache hit and a slow rpc call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    pairs = ",".join(f'{n}="{escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+        state["counts"][bisect.bisect_left(self.buckets, value)] += 1
+        state["sum"] += value
+        state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("le",)
+        for key, state in sorted(self.values.items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state["counts"]):
+                running += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, key + (le,))} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {state['sum']}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self._runner = None
+
+    def _register(self, cls, name, help_text, labelnames=(), **kwargs):
+        # same name twice hands back the existing metric, so modules can declare what they use
+        if name not in self.metrics:
+            self.metrics[name] = cls(name, help_text, labelnames, **kwargs)
+        return self.metrics[name]
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, request):
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def serve(self, host=METRICS_HOST, port=METRICS_PORT):
+        """start the /metrics endpoint on the running loop (no-op if port is 0 or already serving)"""
+        if not port or self._runner:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, host, port).start()
+        except OSError as e:
+            # don't run on without metrics, a port clash means another process is answering for us
+            await self.stop()
+            raise RuntimeError(
+                f"couldn't start metrics endpoint on {host}:{port} ({e}), give every process on this host its "
+                f"own port (WORKER_INDEX for workers, or METRICS_PORT) or set METRICS_PORT=0"
+            ) from e
+        logging.info(f"metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# create single shared registry
+metrics = MetricsRegistry()
+
+# metrics shared by more than one module
+POLL_TICK_SECONDS = metrics.histogram("solspear_poll_tick_seconds", "duration of one check_transactions tick")
+POLL_STAGE_SECONDS = metrics.histogram(
+    "solspear_poll_stage_seconds", "time spent per stage of the poll pipeline", ("stage",)
+)
+RPC_REQUESTS = metrics.counter(
+    "solspear_rpc_requests_total", "rpc requests by method, endpoint and outcome", ("method", "endpoint", "status")
+)
+RPC_RATE_LIMITED = metrics.counter("solspear_rpc_429_total", "rpc responses that were 429s", ("method", "endpoint"))
@@ -0,0 +1,430 @@
+# local stand-in solana node with synthetic traffic, for load tests (see loadtest.py)
+#
+#   python src/mock_node.py --wallets 10000 --tx-per-wallet-min 1 --latency 0.02 --rate-limit 0.05
+#
+# serves getSignaturesForAddress, getTransaction, getMultipleAccounts, getBlock, getSlot, getBlockTime
+# over http and logsSubscribe / accountSubscribe over a websocket on the same port
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import random
+import time
+from collections import deque
+from aiohttp import web, WSMsgType
+from base58 import b58encode, b58decode
+
+HOST = '127.0.0.1'
+SLOT_SECONDS = 0.4
+KEEP_SLOTS = 1500 # blocks kept for getBlock, older ones answer "slot not available"
+KEEP_PER_WALLET = 200 # signatures kept per wallet
+WS_BACKLOG = 10000 # notifications buffered per connection before we start dropping them
+
+SYSTEM_PROGRAM = "11111111111111111111111111111111"
+JUPITER_PROGRAM = "JUP6LkbZbjS1jKKwapdHNy74zcZ3tLUZoi5QNyVTaV4"
+RAYDIUM_PROGRAM = "675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8"
+WSOL_MINT = "So11111111111111111111111111111111111111112"
+
+
+def _compact_u16(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+class MockTx:
+    __slots__ = ("signature", "slot", "block_time", "keys", "swap", "logs", "raw", "pre", "post", "blockhash")
+
+    def __init__(self, rng, slot, block_time, wallet, counterparty, mints):
+        sig = rng.randbytes(64)
+        self.signature = b58encode(sig).decode()
+        self.slot = slot
+        self.block_time = block_time
+        self.swap = rng.random() < 0.6 # memecoin traffic is mostly swaps
+        program = JUPITER_PROGRAM if self.swap else SYSTEM_PROGRAM
+        self.keys = [wallet, counterparty, program]
+        self.pre = [rng.randint(10**8, 10**11), rng.randint(10**6, 10**9), 1]
+        moved = rng.randint(20_000, 10**8) # always above the poller's tiny-transfer cut off
+        self.post = [self.pre[0] - moved - 5000, self.pre[1] + moved, 1]
+        if self.swap:
+            token_in, token_out = rng.sample(mints, 2)
+            amount_in, amount_out = rng.randint(10**5, 10**10), rng.randint(10**5, 10**10)
+            if rng.random() < 0.5:
+                self.logs = [
+                    f"Program {JUPITER_PROGRAM} invoke [1]",
+                    "Program log: Instruction: Route",
+                    f"Program log: source token {token_in}",
+                    f"Program log: destination token {token_out}",
+                    f"Program log: amount_in: {amount_in}, amount_out: {amount_out}",
+                    f"Program {JUPITER_PROGRAM} success",
+                ]
+            else:
+                self.logs = [
+                    f"Program {RAYDIUM_PROGRAM} invoke [1]",
+                    f"Program log: source token account {token_in}",
+                    f"Program log: destination token account {token_out}",
+                    f"Program log: SwapEvent {{ amount_in: {amount_in}, amount_out: {amount_out} }}",
+                    f"Program {RAYDIUM_PROGRAM} success",
+                ]
+        else:
+            self.logs = [f"Program {SYSTEM_PROGRAM} invoke [1]", f"Program {SYSTEM_PROGRAM} success"]
+        blockhash = rng.randbytes(32)
+        self.blockhash = b58encode(blockhash).decode()
+        self.raw = self._serialize(sig, blockhash)
+
+    def _serialize(self, sig, blockhash):
+        """legacy wire format, enough for block_scanner's static key parsing"""
+        data = b"\x02\x00\x00\x00" + (self.pre[0] - self.post[0]).to_bytes(8, "little")
+        message = (
+            bytes([1, 0, 1]) # header: 1 signer, last key (the program) read only
+            + _compact_u16(len(self.keys)) + b"".join(b58decode(k) for k in self.keys)
+            + blockhash
+            + _compact_u16(1) + bytes([2]) + _compact_u16(2) + bytes([0, 1]) + _compact_u16(len(data)) + data
+        )
+        return _compact_u16(1) + sig + message
+
+    def meta(self):
+        inner = [{"index": 0, "instructions": [
+            {"programIdIndex": 2, "accounts": [0, 1], "data": "3Bxs4h24hBtQy9rw", "stackHeight": 2}
+        ]}] if self.swap else []
+        return {
+            "err": None, "status": {"Ok": None}, "fee": 5000,
+            "preBalances": self.pre, "postBalances": self.post,
+            "innerInstructions": inner, "logMessages": self.logs,
+            "preTokenBalances": [], "postTokenBalances": [], "rewards": [],
+            "loadedAddresses": {"writable": [], "readonly": []},
+            "computeUnitsConsumed": 4500,
+        }
+
+    def signature_info(self):
+        return {
+            "signature": self.signature, "slot": self.slot, "err": None, "memo": None,
+            "blockTime": self.block_time, "confirmationStatus": "confirmed",
+        }
+
+    def json(self):
+        """getTransaction result with encoding=json"""
+        return {
+            "slot": self.slot,
+            "blockTime": self.block_time,
+            "version": "legacy",
+            "meta": self.meta(),
+            "transaction": {
+                "signatures": [self.signature],
+                "message": {
+                    "header": {"numRequiredSignatures": 1, "numReadonlySignedAccounts": 0, "numReadonlyUnsignedAccounts": 1},
+                    "accountKeys": self.keys,
+                    "recentBlockhash": self.blockhash,
+                    "instructions": [{"programIdIndex": 2, "accounts": [0, 1], "data": "3Bxs4h24hBtQy9rw", "stackHeight": None}],
+                },
+            },
+        }
+
+
+class MockNode:
+    def __init__(self, wallets=1000, tx_per_wallet_min=1.0, latency=0.0, rate_limit=0.0,
+                 disconnect_every=0, mints=200, seed=1):
+        self.rng = random.Random(seed)
+        self.wallets = [b58encode(self.rng.randbytes(32)).decode() for _ in range(wallets)]
+        self.wallet_set = set(self.wallets)
+        self.mints = [WSOL_MINT] + [b58encode(self.rng.randbytes(32)).decode() for _ in range(mints)]
+        self.tx_rate = wallets * tx_per_wallet_min / 60 # transactions per second across all wallets
+        self.latency = latency # mean extra seconds per rpc answer, jittered +-50%
+        self.rate_limit = rate_limit # fraction of rpc requests answered with a 429
+        self.disconnect_every = disconnect_every # seconds before the node drops a websocket, 0 = never
+
+        self.slot = 1000
+        self.blocks = {} # slot -> (block_time, [MockTx])
+        self.by_wallet = {} # address -> deque of MockTx, oldest first
+        self.txs = {} # signature -> MockTx
+        self.subscribers = set() # per-connection notification queues
+        self.requests = 0
+        self.throttled = 0
+        self.produced = 0
+        self._runner = None
+        self._producer = None
+        self.http_url = None
+        self.ws_url = None
+
+    # chain
+
+    def produce_slot(self):
+        """advance one slot and generate its transactions"""
+        self.slot += 1
+        block_time = int(time.time())
+        count = self._poisson(self.tx_rate * SLOT_SECONDS)
+        txs = []
+        for _ in range(count):
+            wallet = self.rng.choice(self.wallets)
+            counterparty = b58encode(self.rng.randbytes(32)).decode()
+            tx = MockTx(self.rng, self.slot, block_time, wallet, counterparty, self.mints)
+            txs.append(tx)
+            self.txs[tx.signature] = tx
+            history = self.by_wallet.setdefault(wallet, deque())
+            history.append(tx)
+            if len(history) > KEEP_PER_WALLET:
+                self.txs.pop(history.popleft().signature, None)
+        self.blocks[self.slot] = (block_time, txs)
+        self.blocks.pop(self.slot - KEEP_SLOTS, None)
+        self.produced += count
+        for tx in txs:
+            self._notify(tx)
+
+    def _poisson(self, mean):
+        # knuth is fine for the per-slot means we use, fall back to normal for big ones
+        if mean > 30:
+            return max(0, int(self.rng.gauss(mean, mean ** 0.5)))
+        limit, k, p = 2.718281828459045 ** -mean, 0, 1.0
+        while True:
+            p *= self.rng.random()
+            if p < limit:
+                return k
+            k += 1
+
+    async def _produce(self):
+        next_slot = time.monotonic()
+        while True:
+            self.produce_slot()
+            next_slot += SLOT_SECONDS
+            await asyncio.sleep(max(0, next_slot - time.monotonic()))
+
+    # rpc
+
+    def _signatures(self, params):
+        address = params[0]
+        config = params[1] if len(params) > 1 and params[1] else {}
+        limit = min(int(config.get("limit") or 1000), 1000)
+        before, until = config.get("before"), config.get("until")
+        out = []
+        started = before is None
+        for tx in reversed(self.by_wallet.get(address, ())):
+            if not started:
+                started = tx.signature == before
+                continue
+            if tx.signature == until:
+                break
+            out.append(tx.signature_info())
+            if len(out) >= limit:
+                break
+        return out
+
+    def _transaction(self, params):
+        tx = self.txs.get(params[0])
+        return tx.json() if tx else None
+
+    def _block(self, params):
+        slot = params[0]
+        if slot not in self.blocks:
+            raise _RpcFault(-32007, f"Slot {slot} was skipped, or missing due to ledger jump to recent snapshot")
+        block_time, txs = self.blocks[slot]
+        return {
+            "blockHeight": slot, "blockTime": block_time, "parentSlot": slot - 1,
+            "blockhash": b58encode(slot.to_bytes(32, "little")).decode(),
+            "previousBlockhash": b58encode((slot - 1).to_bytes(32, "little")).decode(),
+            "transactions": [
+                {"transaction": [base64.b64encode(tx.raw).decode(), "base64"], "meta": tx.meta(), "version": "legacy"}
+                for tx in txs
+            ],
+        }
+
+    def _accounts(self, params):
+        value = []
+        for address in params[0]:
+            history = self.by_wallet.get(address)
+            if address not in self.wallet_set:
+                value.append(None)
+                continue
+            lamports = history[-1].post[0] if history else 10**9
+            value.append({"lamports": lamports, "owner": SYSTEM_PROGRAM, "data": ["", "base64"],
+                          "executable": False, "rentEpoch": 0, "space": 0})
+        return {"context": {"slot": self.slot}, "value": value}
+
+    def _block_time(self, params):
+        block = self.blocks.get(params[0])
+        if not block:
+            raise _RpcFault(-32004, f"Block not available for slot {params[0]}")
+        return block[0]
+
+    def call(self, method, params):
+        handlers = {
+            "getSignaturesForAddress": self._signatures,
+            "getTransaction": self._transaction,
+            "getBlock": self._block,
+            "getMultipleAccounts": self._accounts,
+            "getBlockTime": self._block_time,
+            "getSlot": lambda params: self.slot,
+        }
+        if method not in handlers:
+            raise _RpcFault(-32601, "Method not found")
+        return handlers[method](params)
+
+    async def _handle_rpc(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        if self.rate_limit and self.rng.random() < self.rate_limit:
+            self.throttled += 1
+            return web.Response(status=429, text="Too many requests", headers={"Retry-After": "1"})
+        payload = await request.json()
+        reply = {"jsonrpc": "2.0", "id": payload.get("id")}
+        try:
+            reply["result"] = self.call(payload["method"], payload.get("params") or [])
+        except _RpcFault as e:
+            reply["error"] = {"code": e.code, "message": e.message}
+        return web.json_response(reply)
+
+    # websocket
+
+    def _notify(self, tx):
+        for queue in self.subscribers:
+            queue.put_tx(tx)
+
+    async def _handle_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        subs = _Subscriptions(self)
+        self.subscribers.add(subs)
+        pusher = asyncio.create_task(self._push(ws, subs))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(msg.data)
+                sub_id = subs.add(payload.get("method"), payload.get("params") or [])
+                await ws.send_str(json.dumps({"jsonrpc": "2.0", "result": sub_id, "id": payload.get("id")}))
+        finally:
+            pusher.cancel()
+            self.subscribers.discard(subs)
+        return ws
+
+    async def _push(self, ws, subs):
+        connected = time.monotonic()
+        while True:
+            frame = await subs.queue.get()
+            await ws.send_str(frame)
+            if self.disconnect_every and time.monotonic() - connected > self.disconnect_every:
+                await ws.close(code=1011, message=b"mock disconnect")
+                return
+
+    # lifecycle
+
+    async def start(self, host=HOST, port=0):
+        app = web.Application()
+        app.router.add_post("/", self._handle_rpc)
+        app.router.add_get("/ws", self._handle_ws)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        port = self._runner.addresses[0][1] # port 0 = whatever's free
+        self.http_url = f"http://{host}:{port}/"
+        self.ws_url = f"ws://{host}:{port}/ws"
+        # a little history so the first polls and block fetches have something to chew on
+        for _ in range(20):
+            self.produce_slot()
+        self._producer = asyncio.create_task(self._produce())
+
+    async def stop(self):
+        if self._producer:
+            self._producer.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class _RpcFault(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class _Subscriptions:
+    """one websocket connection's subscriptions and outgoing notification queue
+
+    logsSubscribe for an address the node doesn't know (like v2_bot's hardcoded wallet) gets the
+    whole synthetic watchlist, so a single WalletMonitor sees 10k wallets' worth of traffic
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.queue = asyncio.Queue(maxsize=WS_BACKLOG)
+        self.logs = {} # sub id -> address filter (None = everything)
+        self.accounts = {} # sub id -> address
+        self.dropped = 0
+        self._next_id = 1
+
+    def add(self, method, params):
+        sub_id = self._next_id
+        self._next_id += 1
+        if method == "logsSubscribe":
+            mentions = (params[0] or {}).get("mentions") if params and isinstance(params[0], dict) else None
+            address = mentions[0] if mentions else None
+            self.logs[sub_id] = address if address in self.node.wallet_set else None
+        elif method == "accountSubscribe" and params:
+            self.accounts[sub_id] = params[0]
+        return sub_id
+
+    def _put(self, frame):
+        if self.queue.full():
+            self.dropped += 1 # slow consumer, a real node would cut us off eventually
+            return
+        self.queue.put_nowait(frame)
+
+    def put_tx(self, tx):
+        for sub_id, address in self.logs.items():
+            if address is None or address in tx.keys:
+                self._put(json.dumps({"jsonrpc": "2.0", "method": "logsNotification", "params": {
+                    "subscription": sub_id,
+                    "result": {"context": {"slot": tx.slot}, "value": {"signature": tx.signature, "err": None, "logs": tx.logs}},
+                }}))
+        for sub_id, address in self.accounts.items():
+            if address == tx.keys[0]:
+                self._put(json.dumps({"jsonrpc": "2.0", "method": "accountNotification", "params": {
+                    "subscription": sub_id,
+                    "result": {"context": {"slot": tx.slot}, "value": {
+                        "lamports": tx.post[0], "owner": SYSTEM_PROGRAM, "data": ["", "base64"],
+                        "executable": False, "rentEpoch": 0, "space": 0,
+                    }},
+                }}))
+
+
+async def serve_forever(args):
+    node = MockNode(args.wallets, args.tx_per_wallet_min, args.latency, args.rate_limit, args.disconnect_every)
+    await node.start(port=args.port)
+    print(f"mock node up: {node.http_url} / {node.ws_url} ({len(node.wallets)} wallets, {node.tx_rate:.1f} tx/s)")
+    print(f"e.g. SOLANA_RPC_URLS={node.http_url} SOLANA_WS_URLS={node.ws_url}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            logging.info(f"slot {node.slot}, {node.produced} txs, {node.requests} requests, {node.throttled} throttled")
+    finally:
+        await node.stop()
+
+
+def add_traffic_args(parser):
+    parser.add_argument("--tx-per-wallet-min", type=float, default=1.0, help="transactions per wallet per minute")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean extra seconds per rpc answer")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of rpc requests answered with 429")
+    parser.add_argument("--disconnect-every", type=float, default=0, help="drop websockets after this many seconds")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="local stand-in solana node with synthetic traffic")
+    parser.add_argument("--wallets", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8899)
+    add_traffic_args(parser)
+    try:
+        asyncio.run(serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
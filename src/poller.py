@@ -0,0 +1,174 @@
+# per-wallet polling ingestion, shared by the bot's poll loop and the standalone ingestion workers
+from solders.pubkey import Pubkey  # for converting wallet address strings to Pubkey objects
+from solders.signature import Signature  # for converting signature strings to Signature objects
+from datetime import datetime, timezone
+from database.db import db
+from database.outbox import outbox
+from metrics import POLL_STAGE_SECONDS
+from rpc_pool import last_endpoint
+from tracing import tracer
+from recorder import recorder
+from decode_pool import decode_pool
+from fair_share import FairScheduler
+
+
+def group_by_address(wallets):
+    """tracked_wallets docs grouped by address, several users can track the same wallet"""
+    grouped = {}
+    for wallet in wallets:
+        grouped.setdefault(wallet['wallet_address'], []).append(wallet)
+    return grouped
+
+
+class WalletPoller:
+    def __init__(self, solana, can_write=None):
+        self.solana = solana # async solana rpc client (rpc_pool.PooledClient)
+        # optional check run before every write, e.g. "do we still hold the leader lease"
+        self.can_write = can_write or (lambda: True)
+        self.cursors = {} # wallet address -> latest stored tx, saves a mongo read per wallet per tick
+        self.scheduler = FairScheduler() # which addresses go first (and which wait) each tick
+
+    async def warm(self, wallets):
+        """load the latest stored signature for every wallet in one go (used by standbys and on startup)"""
+        addresses = list(group_by_address(wallets))
+        self.cursors = await db.get_last_transactions(addresses)
+
+    async def poll(self, wallets):
+        """poll every unique address once (in fair-share order) and fan alerts out to everyone tracking it"""
+        if recorder.enabled:
+            recorder.tick()
+        for address, docs in self.scheduler.plan(group_by_address(wallets)):
+            if not self.can_write():
+                return # lost the lease mid-tick, leave the rest to the new leader
+            if self.scheduler.over_budget():
+                break # out of time, whatever's left goes first next tick
+            try:
+                with tracer.span("poll_address", wallet=address[:8]):
+                    await self.poll_address(address, docs)
+            except Exception as e:
+                print(f"error polling wallet {address}: {e}")
+            self.scheduler.polled(address)
+        self.scheduler.report()
+
+    async def _store(self, tx_data):
+        """save a transaction and move the wallet's cursor forward"""
+        await db.insert_transaction(tx_data)
+        cursor = self.cursors.get(tx_data["wallet_address"])
+        if not cursor or tx_data["slot"] >= cursor["slot"]:
+            self.cursors[tx_data["wallet_address"]] = tx_data
+
+    async def poll_address(self, address, wallets):
+        """check one address for new transactions, queue alerts for each of its tracking docs"""
+        wallet_pubkey = Pubkey.from_string(address)
+
+        # get last processed signature for this wallet
+        last_sig = self.cursors.get(address)
+        if not last_sig:
+            with POLL_STAGE_SECONDS.time(stage="mongo_read"):
+                last_sig = await db.get_last_transaction(address)
+
+        # For first time tracking, just get the latest transaction
+        if not last_sig:
+            with POLL_STAGE_SECONDS.time(stage="rpc"):
+                response = await self.solana.get_signatures_for_address(
+                    wallet_pubkey,
+                    limit=1  # only get most recent
+                )
+
+            if response and hasattr(response, 'value') and response.value:
+                tx = response.value[0]  # Most recent transaction
+                tx_data = {
+                    "wallet_address": address,
+                    "signature": str(tx.signature),
+                    "slot": tx.slot,
+                    "block_time": tx.block_time,
+                    "err": tx.err is not None,
+                    "processed": False
+                }
+                if self.can_write():
+                    await self._store(tx_data)
+            return
+
+        # For subsequent checks, get only new transactions
+        try:
+            with POLL_STAGE_SECONDS.time(stage="rpc"):
+                response = await self.solana.get_signatures_for_address(
+                    wallet_pubkey,
+                    until=Signature.from_string(last_sig['signature']),  # Use until instead of before
+                    limit=5  # reduced limit to minimize spam
+                )
+        except Exception as e:
+            print(f"Error getting signatures: {e}")
+            return
+
+        if not response or not hasattr(response, 'value') or not response.value:
+            return
+
+        # Process transactions (they're already in newest-first order)
+        # fetch first, then decode the whole batch in one go (in the decode pool when DECODE_WORKERS is set)
+        fetched = []
+        for tx in response.value:  # Remove reversed() since we want newest first
+            try:
+                # Get full transaction details with version support
+                with POLL_STAGE_SECONDS.time(stage="rpc"):
+                    raw = await self.solana.get_transaction_raw(
+                        tx.signature,
+                        max_supported_transaction_version=0,
+                        encoding="json"  # Changed from jsonParsed to json
+                    )
+                fetched.append((tx, raw, last_endpoint.get()))
+            except Exception as e:
+                print(f"Error processing transaction {tx.signature}: {str(e)}")
+                continue
+
+        # is our wallet involved, and is it more than dust
+        with POLL_STAGE_SECONDS.time(stage="decode"):
+            decoded = await decode_pool.decode([(raw, address) for _, raw, _ in fetched])
+
+        new_txs = []
+        for (tx, _, endpoint), (tx_type, skip_reason, flows) in zip(fetched, decoded):
+            if skip_reason:
+                print(f"Skipping transaction {tx.signature}: {skip_reason}")
+                continue
+            if tx_type is None:
+                # filtered out (dust, wallet not involved). stored as a marker anyway so the cursor moves past
+                # it, otherwise every tick asks for the same signatures again until a real one lands
+                new_txs.append({
+                    "wallet_address": address,
+                    "signature": str(tx.signature),
+                    "slot": tx.slot,
+                    "block_time": tx.block_time,
+                    "skipped": True, # never alerted, left out of /history
+                    "processed": True
+                })
+                continue
+
+            # prepare transaction data
+            tx_data = {
+                "wallet_address": address,
+                "signature": str(tx.signature),
+                "slot": tx.slot,
+                "block_time": tx.block_time, # unix seconds, for alert latency
+                "detected_at": datetime.now(timezone.utc),
+                "err": tx.err is not None,
+                "memo": None,
+                "tx_type": tx_type,
+                "flows": flows, # net change per token for the wallet, used by digests
+                "processed": False
+            }
+
+            # queue the notification for every private channel tracking this wallet, the delivery worker sends it
+            if not self.can_write():
+                return
+            try:
+                for wallet in wallets:
+                    await outbox.enqueue_alert(wallet, tx_data, tx_type, path="poll", endpoint=endpoint)
+            except Exception as e:
+                print(f"Error processing transaction {tx.signature}: {str(e)}")
+                continue
+            new_txs.append(tx_data)
+
+        # save transactions only once every notification is queued, so a crash in between
+        # just re-polls the batch and the outbox ignores the duplicates
+        for tx_data in new_txs:
+            await self._store(tx_data)
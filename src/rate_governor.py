@@ -0,0 +1,123 @@
+# shared rpc rate governor - token bucket per (endpoint, method), aimd on 429s, live traffic first
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+# priorities, lower goes first
+LIVE = 0 # tip polling / block following
+BACKFILL = 1 # catching up newly tracked wallets
+HISTORICAL = 2 # anything else that can wait
+
+RPC_RATE_LIMIT = float(os.getenv('RPC_RATE_LIMIT', 4)) # requests per second per method per endpoint to start at
+RPC_RATE_BURST = float(os.getenv('RPC_RATE_BURST', 10))
+# per-method overrides, e.g. "getTransaction=8,getBlock=2"
+RPC_RATE_LIMITS = dict(
+    (name.strip(), float(rate)) for name, rate in
+    (pair.split('=') for pair in os.getenv('RPC_RATE_LIMITS', '').split(',') if '=' in pair)
+)
+RPC_LIVE_RESERVE = float(os.getenv('RPC_LIVE_RESERVE', 0.25)) # share of each bucket's burst background work can't touch
+AIMD_INCREASE = 0.1 # requests/s added back per successful request
+AIMD_DECREASE = 0.5 # rate multiplied by this on every 429
+MIN_RATE = 0.2
+
+
+class TokenBucket:
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.max_rate = rate # where aimd climbs back to
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0 # set from retry-after
+        self.waiters = [] # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self._arrived = asyncio.Event() # new waiter, re-check who goes first
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """take a token only if one is free right now and nobody is queued (used for optional hedges, always live)"""
+        self._refill()
+        if self.waiters or self.tokens < 1 or time.monotonic() < self.paused_until:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self, priority=LIVE):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        else:
+            self._arrived.set()
+        await future
+
+    async def _dispatch(self):
+        """hand tokens out to waiters in priority order as they refill"""
+        while self.waiters:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill()
+            # background requests leave a reserve in the bucket so live traffic never waits behind them
+            needed = 1 if self.waiters[0][0] == LIVE else min(self.burst, 1 + self.burst * RPC_LIVE_RESERVE)
+            if self.tokens < needed:
+                # a live request turning up mid-wait may not need to wait as long
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), (needed - self.tokens) / self.rate)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done(): # caller gave up
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+
+    def on_success(self):
+        # additive increase
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + AIMD_INCREASE)
+
+    def on_throttled(self, retry_after=None):
+        # multiplicative decrease, and stop completely until retry-after if the server gave one
+        self._refill()
+        self.rate = max(MIN_RATE, self.rate * AIMD_DECREASE)
+        self.tokens = min(self.tokens, 0)
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        logging.warning(f"rate limited on {self.name}, backing off to {self.rate:.2f} req/s")
+
+
+class RateGovernor:
+    def __init__(self):
+        self.buckets = {}
+
+    def bucket(self, endpoint, method):
+        key = (endpoint, method)
+        if key not in self.buckets:
+            rate = RPC_RATE_LIMITS.get(method, RPC_RATE_LIMIT)
+            self.buckets[key] = TokenBucket(f"{method}@{endpoint}", rate, max(RPC_RATE_BURST, rate))
+        return self.buckets[key]
+
+
+def parse_retry_after(value):
+    """retry-after header in seconds (we don't bother with the http-date form)"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+# create single shared governor
+rate_governor = RateGovernor()
@@ -0,0 +1,80 @@
+# traffic recorder - captures ws frames, rpc responses and metadata lookups to ndjson for replay.py
+import atexit
+import json
+import logging
+import os
+import time
+
+RECORD_TO = os.getenv('RECORD_TO') # path of the ndjson capture, unset = recording off
+FLUSH_EVERY = 200 # records buffered before hitting the disk
+
+
+class Recorder:
+    """one json object per line: {"t": seconds since start, "kind": ws|rpc|http|tick, ...}"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.file = None
+        self.started = None
+        self.pending = 0
+        if path:
+            self.open(path)
+
+    @property
+    def enabled(self):
+        return self.file is not None
+
+    def open(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.started = time.monotonic()
+        atexit.register(self.close)
+        logging.info(f"recording traffic to {path}")
+
+    def _write(self, kind, **fields):
+        if self.file is None:
+            return
+        fields["t"] = round(time.monotonic() - self.started, 4)
+        fields["kind"] = kind
+        self.file.write(json.dumps(fields, separators=(",", ":"), default=str) + "\n")
+        self.pending += 1
+        if self.pending >= FLUSH_EVERY:
+            self.file.flush()
+            self.pending = 0
+
+    def ws(self, frame):
+        if isinstance(frame, bytes):
+            frame = frame.decode("utf-8", "replace")
+        self._write("ws", frame=frame)
+
+    def rpc(self, method, params, response):
+        # the raw response text, so replay hands the exact same bytes to from_json/json.loads
+        self._write("rpc", method=method, params=params, response=response)
+
+    def http(self, provider, key, result):
+        self._write("http", provider=provider, key=key, result=result)
+
+    def tick(self, name="poll"):
+        """marks one poll tick, replay runs the same number of ticks with the same spacing"""
+        self._write("tick", name=name)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def load(path):
+    """read a capture back, skipping lines cut off by a crash mid-write"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+# create single shared recorder (only active when RECORD_TO is set)
+recorder = Recorder(RECORD_TO)
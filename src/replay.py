@@ -0,0 +1,252 @@
+# replay a RECORD_TO capture through WalletMonitor and the poll loop against local stand-in servers
+#
+#   RECORD_TO=spike.ndjson python src/v2_bot.py        # (or bot.py / worker.py) to capture
+#   python src/replay.py spike.ndjson --speed 0        # 1 = real time, 10 = 10x, 0 = as fast as it goes
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict, deque
+
+# replays never touch the real database or get throttled by limits meant for public rpc nodes,
+# set these yourself to override (e.g. RPC_RATE_LIMIT=4 to include the governor in the numbers)
+os.environ.setdefault('MONGODB_DB', 'solspear_replay')
+os.environ.setdefault('RPC_RATE_LIMIT', '100000')
+os.environ.setdefault('RPC_RATE_BURST', '100000')
+
+from aiohttp import web
+import websockets
+from recorder import load
+from metrics import POLL_STAGE_SECONDS
+from tracing import tracer
+from rpc_pool import RpcPool, PooledClient
+from metadata_router import metadata_router, Provider
+
+HOST = '127.0.0.1'
+
+
+class ReplayNode:
+    """serves captured rpc responses over http and captured frames over a websocket"""
+
+    def __init__(self, records, speed=1.0):
+        self.speed = speed
+        self.frames = [(r["t"], r["frame"]) for r in records if r["kind"] == "ws"]
+        # exact (method, params) first, then (method, first param) so a replay that drifts a
+        # little (different cursor, different limit) still gets that wallet's/signature's answers
+        self.exact = defaultdict(deque)
+        self.loose = defaultdict(deque)
+        for r in records:
+            if r["kind"] != "rpc":
+                continue
+            self.exact[self._exact_key(r["method"], r["params"])].append(r["response"])
+            self.loose[self._loose_key(r["method"], r["params"])].append(r["response"])
+        self.served = 0
+        self.missed = 0
+        self.frames_sent = 0
+        self._runner = None
+        self.http_url = None
+        self.ws_url = None
+
+    @staticmethod
+    def _exact_key(method, params):
+        return method, json.dumps(params, sort_keys=True)
+
+    @staticmethod
+    def _loose_key(method, params):
+        return method, json.dumps(params[0] if params else None, sort_keys=True)
+
+    @staticmethod
+    def _next(queue):
+        # hand answers out in capture order, keep repeating the last one once we run out
+        return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def answer(self, method, params, request_id):
+        for queue in (self.exact.get(self._exact_key(method, params)), self.loose.get(self._loose_key(method, params))):
+            if queue:
+                self.served += 1
+                return self._next(queue)
+        self.missed += 1
+        # not in the capture: an empty answer, same as a node that has nothing for us
+        result = [] if method == "getSignaturesForAddress" else None
+        return json.dumps({"jsonrpc": "2.0", "result": result, "id": request_id})
+
+    async def _handle_rpc(self, request):
+        payload = await request.json()
+        text = self.answer(payload["method"], payload.get("params") or [], payload.get("id"))
+        return web.Response(text=text, content_type="application/json")
+
+    async def _handle_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        started = time.monotonic()
+        first = self.frames[0][0] if self.frames else 0
+        for t, frame in self.frames:
+            if self.speed:
+                delay = (t - first) / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await ws.send_str(frame)
+            self.frames_sent += 1
+        await ws.close()
+        return ws
+
+    async def start(self, host=HOST, port=0):
+        app = web.Application()
+        app.router.add_post("/", self._handle_rpc)
+        app.router.add_get("/ws", self._handle_ws)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        port = self._runner.addresses[0][1] # port 0 = whatever's free
+        self.http_url = f"http://{host}:{port}/"
+        self.ws_url = f"ws://{host}:{port}/ws"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+def replay_metadata(records):
+    """a single metadata provider that answers from the capture instead of the internet"""
+    answers = {}
+    for r in records:
+        if r["kind"] == "http" and r.get("result"):
+            answers[r["key"]] = r["result"]
+
+    async def fetch(session, mint):
+        return answers.get(mint)
+    return Provider("replay", fetch)
+
+
+async def drive_ws(ws_url, pool):
+    """run WalletMonitor.handle_messages against ws_url until the server hangs up"""
+    from v2_bot import WalletMonitor # imported late, it sets up logging on import
+    monitor = WalletMonitor()
+    monitor.rpc_pool = pool
+    monitor.ws_endpoint = ws_url
+    started = time.perf_counter()
+    async with websockets.connect(ws_url, max_size=None) as websocket:
+        await monitor.subscribe_to_wallet(websocket)
+        try:
+            await monitor.handle_messages(websocket)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+    # whatever the handler hadn't got to when the socket closed
+    backlog = monitor.frame_queue.qsize()
+    while not monitor.frame_queue.empty():
+        message, received_at = monitor.frame_queue.get_nowait()
+        with tracer.span("handle_messages.frame"):
+            await monitor._handle_frame(message, received_at)
+    return {
+        "elapsed": time.perf_counter() - started,
+        "backlog": backlog,
+    }
+
+
+async def drive_poll(client, wallets, tick_times, speed):
+    """run WalletPoller ticks (what check_transactions does) on the captured schedule
+
+    needs a mongodb (MONGODB_URI), writes go to the scratch MONGODB_DB
+    """
+    from database.db import db, MONGODB_DB
+    from poller import WalletPoller
+    if MONGODB_DB == 'solspear':
+        raise SystemExit("refusing to replay the poll loop into the live 'solspear' database, set MONGODB_DB")
+    if db.db is None:
+        await db.connect()
+    # fresh scratch state every run so replays of the same capture are comparable
+    for name in ("transactions", "transaction_buckets", "outbox"):
+        await db.db[name].delete_many({})
+
+    poller = WalletPoller(client)
+    started = time.perf_counter()
+    first = tick_times[0] if tick_times else 0
+    for t in tick_times or [0]:
+        if speed:
+            delay = (t - first) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        with tracer.span("check_transactions", wallets=len(wallets)):
+            await poller.poll(wallets)
+    return {"elapsed": time.perf_counter() - started, "ticks": len(tick_times or [0])}
+
+
+def stage_table():
+    """[(name, n, p50 ms, p95 ms, p99 ms)] per span name from the spans recorded so far"""
+    durations = defaultdict(list)
+    for span in tracer.finished:
+        durations[span.name].append(span.duration)
+    rows = []
+    for name, values in sorted(durations.items()):
+        values.sort()
+        pick = lambda pct: values[min(len(values) - 1, int(len(values) * pct))] * 1000
+        rows.append((name, len(values), pick(0.5), pick(0.95), pick(0.99)))
+    return rows
+
+
+def poll_stage_means():
+    """mean seconds per poll stage (mongo_read/rpc/decode/...) from the shared histogram"""
+    return {key[0]: state["sum"] / state["count"] for key, state in POLL_STAGE_SECONDS.values.items() if state["count"]}
+
+
+def print_report(title, events, elapsed, extra=None):
+    rate = events / elapsed if elapsed else 0
+    print(f"\n== {title}: {events} events in {elapsed:.2f}s = {rate:,.1f}/s")
+    for key, value in (extra or {}).items():
+        print(f"   {key}: {value}")
+    print(f"   {'stage':<32}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, n, p50, p95, p99 in stage_table():
+        print(f"   {name:<32}{n:>7}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}")
+    for stage, mean in sorted(poll_stage_means().items()):
+        print(f"   poll stage {stage:<21} mean {mean * 1000:.2f} ms")
+
+
+async def replay(path, speed, target):
+    records = load(path)
+    node = ReplayNode(records, speed)
+    await node.start()
+    pool = RpcPool([node.http_url], [node.ws_url])
+    metadata_router.providers = [replay_metadata(records)]
+    try:
+        if target in ("ws", "both") and node.frames:
+            tracer.clear(keep=1_000_000)
+            result = await drive_ws(node.ws_url, pool)
+            frames = sum(1 for s in tracer.finished if s.name == "handle_messages.frame")
+            print_report("websocket replay", frames, result["elapsed"], {
+                "frames in capture": len(node.frames), "backlog at close": result["backlog"]
+            })
+
+        addresses = list(dict.fromkeys(
+            r["params"][0] for r in records if r["kind"] == "rpc" and r["method"] == "getSignaturesForAddress"
+        ))
+        if target in ("poll", "both") and addresses:
+            tracer.clear(keep=1_000_000)
+            POLL_STAGE_SECONDS.values.clear()
+            wallets = [{"wallet_address": a, "user_id": 0, "channel_id": 0} for a in addresses]
+            tick_times = [r["t"] for r in records if r["kind"] == "tick"]
+            result = await drive_poll(PooledClient(pool), wallets, tick_times, speed)
+            polls = sum(1 for s in tracer.finished if s.name == "poll_address")
+            print_report("poll replay", polls, result["elapsed"], {
+                "ticks": result["ticks"], "wallets": len(wallets)
+            })
+        print(f"\nrpc answers served from capture: {node.served}, not in capture: {node.missed}")
+    finally:
+        from database.db import db
+        await db.close()
+        await pool.close()
+        await metadata_router.close()
+        await node.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay captured traffic and report throughput/latency")
+    parser.add_argument("capture", help="ndjson file written with RECORD_TO")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N times faster, 0 = max")
+    parser.add_argument("--target", choices=("ws", "poll", "both"), default="both")
+    args = parser.parse_args()
+    asyncio.run(replay(args.capture, args.speed, args.target))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# pool of solana rpc endpoints - health scoring, weighted routing, hedged reads and auto eject/readmit
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+import aiohttp
+from solders.rpc.responses import GetSignaturesForAddressResp, GetTransactionResp
+from rate_governor import rate_governor, parse_retry_after, LIVE
+from metrics import RPC_REQUESTS, RPC_RATE_LIMITED
+from recorder import recorder
+
+# comma separated, first one is just the default not a favourite
+SOLANA_RPC_URLS = os.getenv('SOLANA_RPC_URLS', os.getenv('SOLANA_RPC_URL', 'https://api.mainnet-beta.solana.com'))
+SOLANA_WS_URLS = os.getenv('SOLANA_WS_URLS', 'wss://api.mainnet-beta.solana.com')
+
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', 10)) # seconds before a single request is given up on
+HEDGE_MIN_DELAY = 0.05 # never hedge sooner than this
+HEDGE_MAX_DELAY = 2.0
+EJECT_ERROR_RATE = 0.5 # eject an endpoint once half its recent requests failed
+EJECT_MIN_SAMPLES = 10 # ...but only once we have this many samples
+EJECT_SECONDS = 30 # how long an ejected endpoint sits out before getting another go
+WINDOW = 100 # rolling window of samples per endpoint
+RATE_LIMIT_RETRIES = 3 # times a 429'd request is retried after backing off
+
+# url of the endpoint that answered the caller's most recent request (per task)
+last_endpoint = contextvars.ContextVar("last_endpoint", default=None)
+
+
+class RpcError(Exception):
+    """json-rpc level error (the request reached the node but it said no)"""
+
+    def __init__(self, error):
+        super().__init__(f"rpc error {error.get('code')}: {error.get('message')}")
+        self.code = error.get("code")
+        self.error = error
+
+
+class RateLimited(Exception):
+    """the endpoint answered 429"""
+
+    def __init__(self, url, retry_after=None):
+        super().__init__(f"rate limited by {url}")
+        self.retry_after = retry_after
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.latencies = deque(maxlen=WINDOW) # seconds, successful requests only
+        self.results = deque(maxlen=WINDOW) # True = ok, False = failed
+        self.ejected_until = 0
+
+    @property
+    def ejected(self):
+        return time.monotonic() < self.ejected_until
+
+    @property
+    def error_rate(self):
+        if not self.results:
+            return 0.0
+        return self.results.count(False) / len(self.results)
+
+    def percentile(self, pct, default=0.25):
+        if not self.latencies:
+            return default
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    @property
+    def score(self):
+        """higher is better: success rate over typical latency"""
+        return (1.0 - self.error_rate) / max(self.percentile(0.5), 0.001)
+
+    def record(self, ok, latency=None):
+        self.results.append(ok)
+        if ok and latency is not None:
+            self.latencies.append(latency)
+        if (
+            not ok
+            and len(self.results) >= EJECT_MIN_SAMPLES
+            and self.error_rate >= EJECT_ERROR_RATE
+        ):
+            logging.warning(f"ejecting rpc endpoint {self.url} (error rate {self.error_rate:.0%})")
+            self.ejected_until = time.monotonic() + EJECT_SECONDS
+            # readmit on probation with a clean slate, a couple of failures will eject it again
+            self.results.clear()
+
+    def __repr__(self):
+        return f"<Endpoint {self.url} score={self.score:.1f} err={self.error_rate:.0%} ejected={self.ejected}>"
+
+
+class RpcPool:
+    def __init__(self, http_urls=None, ws_urls=None):
+        http_urls = http_urls or [u.strip() for u in SOLANA_RPC_URLS.split(',') if u.strip()]
+        ws_urls = ws_urls or [u.strip() for u in SOLANA_WS_URLS.split(',') if u.strip()]
+        self.http = [Endpoint(u) for u in http_urls]
+        self.ws = [Endpoint(u) for u in ws_urls]
+        self.session = None
+        self._request_id = 0
+
+    def _pick(self, endpoints, exclude=()):
+        """weighted random pick, healthier endpoints get proportionally more traffic"""
+        candidates = [e for e in endpoints if not e.ejected and e not in exclude]
+        if not candidates:
+            # everything is ejected, better to try something than nothing
+            candidates = [e for e in endpoints if e not in exclude]
+        if not candidates:
+            return None
+        return random.choices(candidates, weights=[e.score for e in candidates])[0]
+
+    def ws_endpoint(self):
+        """best websocket url right now"""
+        return self._pick(self.ws)
+
+    async def _get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=RPC_TIMEOUT))
+        return self.session
+
+    async def _send(self, endpoint, payload, priority=LIVE, wait=True):
+        """one request to one endpoint, returns the raw response text and records health"""
+        bucket = rate_governor.bucket(endpoint.url, payload["method"])
+        if wait:
+            await bucket.acquire(priority)
+        elif not bucket.try_acquire():
+            raise RateLimited(endpoint.url) # no spare budget for an optional request
+
+        session = await self._get_session()
+        started = time.monotonic()
+        try:
+            async with session.post(endpoint.url, json=payload) as response:
+                text = await response.text()
+                if response.status == 429:
+                    # quota, not a sick node - slow down instead of counting it against the endpoint
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    bucket.on_throttled(retry_after)
+                    RPC_RATE_LIMITED.inc(method=payload["method"], endpoint=endpoint.url)
+                    RPC_REQUESTS.inc(method=payload["method"], endpoint=endpoint.url, status="429")
+                    raise RateLimited(endpoint.url, retry_after)
+                if response.status != 200:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history,
+                        status=response.status, message=text[:200], headers=response.headers
+                    )
+        except RateLimited:
+            raise
+        except Exception:
+            endpoint.record(False)
+            RPC_REQUESTS.inc(method=payload["method"], endpoint=endpoint.url, status="error")
+            raise
+        endpoint.record(True, time.monotonic() - started)
+        RPC_REQUESTS.inc(method=payload["method"], endpoint=endpoint.url, status="ok")
+        bucket.on_success()
+        if recorder.enabled:
+            recorder.rpc(payload["method"], payload["params"], text)
+        return text
+
+    async def request_raw(self, method, params, hedge=True, priority=LIVE):
+        """send a json-rpc request, waiting out 429s instead of dropping the request"""
+        hedge = hedge and priority == LIVE # hedges spend spare budget, background work doesn't get any
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            try:
+                return await self._request_once(method, params, hedge, priority)
+            except RateLimited:
+                if attempt == RATE_LIMIT_RETRIES:
+                    raise
+                # the governor has already slowed the bucket down, the next acquire waits it out
+
+    async def _request_once(self, method, params, hedge, priority):
+        """one attempt, hedged to a second endpoint if the first is slower than its p95"""
+        self._request_id += 1
+        payload = {"jsonrpc": "2.0", "id": self._request_id, "method": method, "params": params}
+
+        primary = self._pick(self.http)
+        tasks = {asyncio.create_task(self._send(primary, payload, priority)): primary}
+        delay = min(max(primary.percentile(0.95), HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+        error = None
+        try:
+            while tasks:
+                timeout = delay if hedge and len(tasks) == 1 and len(self.http) > 1 else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # primary is slow, fire the same request at the next best endpoint
+                    backup = self._pick(self.http, exclude=tasks.values())
+                    if backup:
+                        # hedges only use spare budget, they never queue behind real traffic
+                        tasks[asyncio.create_task(self._send(backup, payload, priority, wait=False))] = backup
+                    hedge = False
+                    continue
+                for task in done:
+                    endpoint = tasks.pop(task)
+                    if task.exception() is None:
+                        last_endpoint.set(endpoint.url)
+                        return task.result()
+                    error = task.exception()
+                if not tasks and hedge and len(self.http) > 1:
+                    # primary failed fast, give one other endpoint a go
+                    backup = self._pick(self.http, exclude=[primary])
+                    if backup:
+                        tasks[asyncio.create_task(self._send(backup, payload, priority))] = backup
+                    hedge = False
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def request(self, method, params, hedge=True, priority=LIVE):
+        """send a json-rpc request and return the decoded `result`, raises RpcError on rpc errors"""
+        data = json.loads(await self.request_raw(method, params, hedge=hedge, priority=priority))
+        if "error" in data:
+            raise RpcError(data["error"])
+        return data.get("result")
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+
+class PooledClient:
+    """async stand-in for solana.rpc.api.Client's read calls we use, routed through an RpcPool
+
+    returns the same solders response types, so callers keep using .value etc.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool or RpcPool()
+
+    async def get_signatures_for_address(self, account, before=None, until=None, limit=None, priority=LIVE):
+        config = {}
+        if before is not None:
+            config["before"] = str(before)
+        if until is not None:
+            config["until"] = str(until)
+        if limit is not None:
+            config["limit"] = limit
+        raw = await self.pool.request_raw("getSignaturesForAddress", [str(account), config], priority=priority)
+        return GetSignaturesForAddressResp.from_json(raw)
+
+    async def get_transaction_raw(self, tx_sig, encoding="json", max_supported_transaction_version=None, priority=LIVE):
+        """undecoded response text, for callers that decode off the loop (decode_pool)"""
+        config = {"encoding": encoding}
+        if max_supported_transaction_version is not None:
+            config["maxSupportedTransactionVersion"] = max_supported_transaction_version
+        return await self.pool.request_raw("getTransaction", [str(tx_sig), config], priority=priority)
+
+    async def get_transaction(self, tx_sig, encoding="json", max_supported_transaction_version=None, priority=LIVE):
+        raw = await self.get_transaction_raw(tx_sig, encoding, max_supported_transaction_version, priority)
+        return GetTransactionResp.from_json(raw)
+
+    async def close(self):
+        await self.pool.close()
+
+
+# create single shared pool
+rpc_pool = RpcPool()
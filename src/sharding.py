@@ -0,0 +1,81 @@
+# consistent-hash sharding of tracked wallets across ingestion worker processes
+import asyncio
+import bisect
+import hashlib
+import os
+from datetime import datetime, timezone, timedelta
+from database.db import db
+
+WORKER_LEASE_SECONDS = int(os.getenv('WORKER_LEASE_SECONDS', 15)) # a worker is dead once its lease runs out
+WORKER_HEARTBEAT_SECONDS = int(os.getenv('WORKER_HEARTBEAT_SECONDS', 5))
+RING_VIRTUAL_NODES = 64 # points per worker on the ring, smooths out the split
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """maps keys to members so that a member joining/leaving only moves ~1/n of the keys"""
+
+    def __init__(self, members=(), vnodes=RING_VIRTUAL_NODES):
+        self.members = tuple(sorted(members))
+        points = sorted(
+            (_hash(f"{member}#{i}"), member)
+            for member in self.members for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [m for _, m in points]
+
+    def owner(self, key):
+        """which member owns this key, None if the ring is empty"""
+        if not self._hashes:
+            return None
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[i]
+
+
+class WorkerMembership:
+    """registers this worker with a heartbeat lease in mongo and keeps a ring of the live workers"""
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.ring = HashRing([worker_id])
+        self._heartbeat_task = None
+
+    async def heartbeat(self):
+        """renew our lease and rebuild the ring from every worker whose lease is still live"""
+        now = datetime.now(timezone.utc)
+        await db.db.workers.update_one(
+            {"_id": self.worker_id},
+            {
+                "$set": {"expires_at": now + timedelta(seconds=WORKER_LEASE_SECONDS), "heartbeat_at": now},
+                "$setOnInsert": {"started_at": now}
+            },
+            upsert=True
+        )
+        live = [w["_id"] async for w in db.db.workers.find({"expires_at": {"$gt": now}}, projection={"_id": 1})]
+        if tuple(sorted(live)) != self.ring.members:
+            print(f"rebalancing: {len(live)} live workers {sorted(live)}")
+            self.ring = HashRing(live)
+
+    def owns(self, address):
+        return self.ring.owner(address) == self.worker_id
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                print(f"error renewing worker lease: {e}")
+            await asyncio.sleep(WORKER_HEARTBEAT_SECONDS)
+
+    async def start(self):
+        await self.heartbeat()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        """drop out of the ring straight away so the others pick up our wallets"""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        await db.db.workers.delete_one({"_id": self.worker_id})
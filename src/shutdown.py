@@ -0,0 +1,70 @@
+# graceful shutdown helpers - a drain deadline, plus on-disk snapshots of hot in-memory state that are
+# written on the way down and read on start so a restart is warm
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots') # "" = no snapshots
+SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', 6 * 3600)) # seconds before a snapshot is too stale to use
+SHUTDOWN_DEADLINE = float(os.getenv('SHUTDOWN_DEADLINE', 20)) # seconds shutdown gets to drain before giving up
+
+
+def _path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.json")
+
+
+def save_snapshot(name, data):
+    """write data as json, atomically so a crash mid-write leaves the previous snapshot intact"""
+    if not SNAPSHOT_DIR:
+        return
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        tmp = _path(name) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"saved_at": time.time(), "data": data}, f, default=str)
+        os.replace(tmp, _path(name))
+        logging.info(f"saved {name} snapshot")
+    except Exception as e:
+        logging.error(f"couldn't save {name} snapshot: {e}")
+
+
+def load_snapshot(name, max_age=SNAPSHOT_MAX_AGE):
+    """(data, age in seconds) of a snapshot, (None, None) if there isn't a usable one"""
+    if not SNAPSHOT_DIR:
+        return None, None
+    try:
+        with open(_path(name), encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None, None
+    except Exception as e:
+        logging.error(f"couldn't read {name} snapshot: {e}")
+        return None, None
+    age = time.time() - snapshot.get("saved_at", 0)
+    if max_age and age > max_age:
+        logging.info(f"{name} snapshot is {age / 3600:.1f}h old, not using it")
+        return None, None
+    return snapshot.get("data"), age
+
+
+async def within(deadline, awaitable, what):
+    """await something but stop waiting at the (monotonic) deadline, shutdown carries on either way"""
+    try:
+        await asyncio.wait_for(awaitable, max(deadline - time.monotonic(), 0.01))
+    except asyncio.TimeoutError:
+        logging.warning(f"shutdown: ran out of time {what}")
+    except Exception as e:
+        logging.error(f"shutdown: error {what}: {e}")
+
+
+def on_stop_signal(callback):
+    """call callback on SIGTERM/SIGINT (from inside the running loop), where the platform allows it"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, callback)
+        except (NotImplementedError, RuntimeError):
+            pass # windows, or not the main thread
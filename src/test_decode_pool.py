@@ -0,0 +1,81 @@
+import json
+from decode_pool import classify_transaction, decode_transaction, decode_batch, token_flows
+
+WALLET = "Wa11et1111111111111111111111111111111111111"
+OTHER = "0ther11111111111111111111111111111111111111"
+SYSTEM = "11111111111111111111111111111111"
+MINT = "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v"
+
+
+def tx_json(keys, meta, loaded=None):
+    """raw getTransaction response text (json encoding)"""
+    if meta is not None and loaded:
+        meta = dict(meta, loadedAddresses=loaded)
+    return json.dumps({"jsonrpc": "2.0", "id": 1, "result": {
+        "slot": 1,
+        "blockTime": 1700000000,
+        "meta": meta,
+        "transaction": {"signatures": ["sig"], "message": {"accountKeys": keys, "instructions": []}}
+    }})
+
+
+def transfer_meta(lamports, inner=None):
+    return {
+        "err": None,
+        "preBalances": [5_000_000_000, 0, 1],
+        "postBalances": [5_000_000_000 - lamports - 5000, lamports, 1],
+        "innerInstructions": inner or [],
+        "preTokenBalances": [],
+        "postTokenBalances": []
+    }
+
+
+def test_dust_transfers_are_suppressed():
+    # 0.000005 SOL plus the fee, under the 10000 lamport cutoff
+    raw = tx_json([WALLET, OTHER, SYSTEM], transfer_meta(4000))
+    assert decode_transaction(raw, WALLET) == (None, None, None)
+
+
+def test_transfers_over_the_dust_cutoff_go_out():
+    raw = tx_json([WALLET, OTHER, SYSTEM], transfer_meta(1_000_000))
+    tx_type, reason, flows = decode_transaction(raw, WALLET)
+    assert (tx_type, reason) == ("Transaction", None)
+    assert flows == {"SOL": -0.001005}
+
+
+def test_transactions_not_touching_the_wallet_are_suppressed():
+    raw = tx_json([OTHER, SYSTEM], transfer_meta(1_000_000))
+    assert decode_transaction(raw, WALLET) == (None, None, None)
+
+
+def test_wallet_in_an_address_table_counts_as_involved():
+    raw = tx_json([OTHER, SYSTEM], transfer_meta(1_000_000), loaded={"writable": [WALLET], "readonly": []})
+    assert decode_transaction(raw, WALLET)[0] == "Transaction"
+
+
+def test_inner_instructions_make_it_a_swap_even_without_sol_moving():
+    meta = transfer_meta(0, inner=[{"index": 0, "instructions": []}])
+    assert classify_transaction(meta, [WALLET, OTHER, SYSTEM], WALLET) == "Swap/Transfer"
+
+
+def test_missing_meta_still_alerts():
+    assert classify_transaction(None, [OTHER], WALLET) == "Transaction"
+
+
+def test_token_flows_net_the_wallets_token_accounts():
+    meta = dict(transfer_meta(0), postBalances=[5_000_000_000, 0, 1], preTokenBalances=[
+        {"accountIndex": 1, "mint": MINT, "owner": WALLET, "uiTokenAmount": {"uiAmount": 10.0}},
+        {"accountIndex": 2, "mint": MINT, "owner": OTHER, "uiTokenAmount": {"uiAmount": 3.0}}
+    ], postTokenBalances=[
+        {"accountIndex": 1, "mint": MINT, "owner": WALLET, "uiTokenAmount": {"uiAmount": 2.5}},
+        {"accountIndex": 2, "mint": MINT, "owner": OTHER, "uiTokenAmount": {"uiAmount": 10.5}}
+    ])
+    assert token_flows(meta, [WALLET, OTHER, SYSTEM], WALLET) == {MINT: -7.5}
+
+
+def test_a_bad_payload_doesnt_sink_the_batch():
+    good = tx_json([WALLET, OTHER, SYSTEM], transfer_meta(1_000_000))
+    results = decode_batch([("not json", WALLET), (json.dumps({"result": None}), WALLET), (good, WALLET)])
+    assert results[0][0] is None and results[0][1].startswith("decode failed")
+    assert results[1] == (None, "No transaction details", None)
+    assert results[2][0] == "Transaction"
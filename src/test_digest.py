@@ -0,0 +1,45 @@
+import asyncio
+from digest import Digester
+
+
+class FakeSettings:
+    def __init__(self, settings):
+        self.settings = settings
+
+    async def get(self, channel_id):
+        return self.settings
+
+
+def alert(sol=0.0):
+    return {"channel_id": "1", "wallet_address": "Wa11et", "flows": {"SOL": sol} if sol else {}}
+
+
+def route_all(digester, notifications):
+    async def run():
+        return [await digester.route(n) for n in notifications]
+    return asyncio.run(run())
+
+
+def test_alerts_past_the_threshold_are_held():
+    digester = Digester(FakeSettings({"enabled": True, "window": 60, "threshold": 2, "large_sol": 10}))
+    routes = route_all(digester, [alert(), alert(), alert(), alert()])
+    assert routes[:2] == [None, None]
+    assert routes[2] is not None and routes[3] == routes[2] # same open digest
+
+
+def test_large_moves_skip_the_digest_and_dont_count_towards_it():
+    digester = Digester(FakeSettings({"enabled": True, "window": 60, "threshold": 2, "large_sol": 10}))
+    routes = route_all(digester, [alert(), alert(), alert(-25), alert(12), alert()])
+    assert routes[2] is None and routes[3] is None
+    assert routes[4] is not None # third small one in the window
+
+
+def test_large_sol_zero_batches_everything():
+    digester = Digester(FakeSettings({"enabled": True, "window": 60, "threshold": 1, "large_sol": 0}))
+    routes = route_all(digester, [alert(500), alert(500)])
+    assert routes[0] is None and routes[1] is not None
+
+
+def test_digest_off_sends_everything():
+    digester = Digester(FakeSettings(None))
+    assert route_all(digester, [alert()] * 10) == [None] * 10
@@ -0,0 +1,80 @@
+from fair_share import FairScheduler, TENANT_DEFERRED, tenant_of
+
+
+def wallets(guild, user, *addresses):
+    return {address: [{"wallet_address": address, "guild_id": guild, "user_id": user}] for address in addresses}
+
+
+def merge(*groups):
+    grouped = {}
+    for group in groups:
+        for address, docs in group.items():
+            grouped.setdefault(address, []).extend(docs)
+    return grouped
+
+
+def order(scheduler, grouped):
+    return [address for address, _ in scheduler.plan(grouped)]
+
+
+def test_tenant_is_the_guild_or_the_user_outside_one():
+    assert tenant_of({"guild_id": 1, "user_id": 2}) == "guild:1"
+    assert tenant_of({"guild_id": None, "user_id": 2}) == "user:2"
+
+
+def test_equal_weights_take_turns():
+    grouped = merge(wallets(1, 10, "a1", "a2", "a3", "a4"), wallets(2, 20, "b1"))
+    assert order(FairScheduler(quota=0, user_quota=0, weights={}), grouped) == ["a1", "b1", "a2", "a3", "a4"]
+
+
+def test_weights_set_the_share_of_the_tick():
+    grouped = merge(wallets(1, 10, *[f"a{i}" for i in range(10)]), wallets(2, 20, *[f"b{i}" for i in range(10)]))
+    planned = order(FairScheduler(quota=0, user_quota=0, weights={"guild:1": 3}), grouped)
+    first = planned[:8]
+    assert sum(a.startswith("a") for a in first) == 6
+    assert sum(a.startswith("b") for a in first) == 2
+
+
+def test_users_of_a_guild_are_interleaved():
+    grouped = merge(wallets(1, 10, "u1a", "u1b", "u1c"), wallets(1, 11, "u2a"))
+    assert order(FairScheduler(quota=0, user_quota=0, weights={}), grouped) == ["u1a", "u2a", "u1b", "u1c"]
+
+
+def test_tenant_quota_defers_the_rest():
+    grouped = merge(wallets(1, 10, "a1", "a2", "a3"), wallets(2, 20, "b1", "b2", "b3"))
+    planned = order(FairScheduler(quota=2, user_quota=0, weights={}), grouped)
+    assert planned == ["a1", "b1", "a2", "b2"]
+
+
+def test_user_quota_caps_each_user_inside_a_guild():
+    grouped = merge(wallets(1, 10, "u1a", "u1b", "u1c"), wallets(1, 11, "u2a", "u2b"))
+    planned = order(FairScheduler(quota=0, user_quota=1, weights={}), grouped)
+    assert sorted(planned) == ["u1a", "u2a"]
+
+
+def test_deferred_wallets_lead_the_next_tick():
+    grouped = wallets(1, 10, "a1", "a2", "a3")
+    scheduler = FairScheduler(quota=2, user_quota=0, weights={})
+    first = order(scheduler, grouped)
+    for address in first:
+        scheduler.polled(address)
+    assert first == ["a1", "a2"]
+    assert order(scheduler, grouped)[0] == "a3"
+
+
+def test_shared_wallet_is_polled_once_and_charged_to_the_first_tenant():
+    grouped = merge(wallets(1, 10, "shared", "a2"), wallets(2, 20, "shared", "b2"))
+    scheduler = FairScheduler(quota=0, user_quota=0, weights={})
+    planned = order(scheduler, grouped)
+    assert sorted(planned) == ["a2", "b2", "shared"]
+    assert scheduler.charged_to["shared"] == "guild:1"
+    assert len(dict(scheduler.plan(grouped))["shared"]) == 2 # every tracking doc still gets the alert
+
+
+def test_report_counts_wallets_left_for_the_next_tick():
+    grouped = wallets(1, 10, "a1", "a2", "a3")
+    scheduler = FairScheduler(quota=1, user_quota=0, weights={})
+    for address in order(scheduler, grouped):
+        scheduler.polled(address)
+    scheduler.report()
+    assert list(TENANT_DEFERRED.values.values()) == [2]
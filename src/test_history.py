@@ -0,0 +1,145 @@
+import asyncio
+import random
+from types import SimpleNamespace
+import history
+from database.db import Database
+
+WALLET = "Wa11et1111111111111111111111111111111111111"
+
+
+class FakeBuckets:
+    """just enough of transaction_buckets.find for get_history, counts the buckets it hands out"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.read = 0
+
+    def find(self, query, projection=None, sort=None, batch_size=None):
+        (field, direction), = sort
+        matched = [b for b in self.buckets if b["wallet_address"] == query["wallet_address"]]
+        for name, ops in query.items():
+            if name != "wallet_address":
+                matched = [b for b in matched if all(
+                    b[name] >= value if op == "$gte" else b[name] <= value for op, value in ops.items()
+                )]
+        matched.sort(key=lambda b: b[field], reverse=direction == -1)
+
+        async def cursor():
+            for bucket in matched:
+                self.read += 1
+                yield bucket
+        return cursor()
+
+
+def bucketed(transactions, size):
+    """bucket (slot, signature) pairs in arrival order, the way inserts fill them"""
+    buckets = []
+    for i in range(0, len(transactions), size):
+        chunk = [{"slot": slot, "signature": sig, "tx_type": "Transaction"} for slot, sig in transactions[i:i + size]]
+        buckets.append({
+            "wallet_address": WALLET,
+            "first_slot": min(tx["slot"] for tx in chunk),
+            "last_slot": max(tx["slot"] for tx in chunk),
+            "transactions": chunk
+        })
+    return buckets
+
+
+def bucket_db(buckets):
+    database = Database()
+    database.tx_storage_mode = "bucketed"
+    database.db = SimpleNamespace(transaction_buckets=FakeBuckets(buckets))
+    return database
+
+
+def sample(count=95, seed=7):
+    # shared slots so the signature tiebreak matters, and a shuffled tail like a late backfill
+    rng = random.Random(seed)
+    txs = [(1000 + i // 3, f"sig{i:03d}") for i in range(count)]
+    head, tail = txs[:60], txs[60:]
+    rng.shuffle(tail)
+    return head + tail
+
+
+def newest_first(txs):
+    return sorted(txs, key=lambda tx: (tx[0], tx[1]), reverse=True)
+
+
+def test_bucketed_pages_walk_every_transaction_once_in_order():
+    txs = sample()
+    database = bucket_db(bucketed(txs, 8))
+
+    async def walk(newer):
+        seen, after = [], None
+        while True:
+            rows = await database.get_history(WALLET, after=after, newer=newer, limit=7)
+            if not rows:
+                return seen
+            seen.extend(rows[::-1] if newer else rows)
+            after = (rows[0] if newer else rows[-1])["cursor"]
+
+    expected = [sig for _, sig in newest_first(txs)]
+    assert [row["signature"] for row in asyncio.run(walk(False))] == expected
+    assert [row["signature"] for row in asyncio.run(walk(True))] == expected[::-1]
+
+
+def test_bucketed_page_only_reads_buckets_near_the_cursor():
+    txs = [(1000 + i, f"sig{i:03d}") for i in range(400)]
+    database = bucket_db(bucketed(txs, 20))
+    collection = database.db.transaction_buckets
+    rows = asyncio.run(database.get_history(WALLET, after=(1200, "sig200"), limit=11))
+    assert [row["slot"] for row in rows] == list(range(1199, 1188, -1))
+    # the cursor's bucket, the one the page comes from and the next one, which shows we can stop
+    assert collection.read == 3
+
+
+def test_cursor_on_a_shared_slot_continues_with_the_tiebreak():
+    database = bucket_db(bucketed([(5, "a"), (5, "b"), (5, "c"), (4, "d")], 2))
+    rows = asyncio.run(database.get_history(WALLET, after=(5, "b"), limit=5))
+    assert [row["signature"] for row in rows] == ["a", "d"]
+    rows = asyncio.run(database.get_history(WALLET, after=(5, "b"), newer=True, limit=5))
+    assert [row["signature"] for row in rows] == ["c"]
+
+
+class FakeHistoryDb:
+    """get_history over a bucket_db, for driving the view's buttons"""
+
+    def __init__(self, txs, size=8):
+        self.database = bucket_db(bucketed(txs, size))
+
+    async def get_history(self, *args, **kwargs):
+        return await self.database.get_history(*args, **kwargs)
+
+
+def test_history_view_pages_and_buttons(monkeypatch):
+    txs = sample(25)
+    monkeypatch.setattr(history, "db", FakeHistoryDb(txs))
+    expected = [sig for _, sig in newest_first(txs)]
+
+    async def run():
+        view = history.HistoryView(WALLET, user_id=1, page_size=10)
+        pages = []
+        await view.load()
+        pages.append(([r["signature"] for r in view.rows], view.page, view.has_newer, view.has_older))
+        while view.has_older:
+            await view.load(after=view.rows[-1]["cursor"], step=1)
+            pages.append(([r["signature"] for r in view.rows], view.page, view.has_newer, view.has_older))
+        await view.load(after=view.rows[0]["cursor"], newer=True, step=-1)
+        back = ([r["signature"] for r in view.rows], view.page, view.has_newer, view.has_older)
+        return pages, back
+
+    pages, back = asyncio.run(run())
+    assert pages == [
+        (expected[:10], 1, False, True),
+        (expected[10:20], 2, True, True),
+        (expected[20:], 3, True, False)
+    ]
+    # a page of newer rows always comes back full, ending right above where we were
+    assert back == (expected[10:20], 2, True, True)
+
+
+def test_skipped_markers_are_left_out_of_pages():
+    buckets = bucketed([(7, "real1"), (6, "dust"), (5, "real2")], 3)
+    buckets[0]["transactions"][1]["skipped"] = True
+    rows = asyncio.run(bucket_db(buckets).get_history(WALLET, limit=5))
+    assert [row["signature"] for row in rows] == ["real1", "real2"]
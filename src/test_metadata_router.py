@@ -0,0 +1,85 @@
+import asyncio
+import time
+from metadata_router import CircuitBreaker, JupiterTokenList, MetadataRouter, Provider
+
+
+def test_breaker_opens_after_failures_in_a_row():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.on_failure()
+    breaker.on_success() # a success resets the count
+    for _ in range(2):
+        breaker.on_failure()
+    assert breaker.state == "closed"
+    breaker.on_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.on_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow() # trial already in flight
+    breaker.on_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_trial_opens_again():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0.05)
+    for _ in range(5):
+        breaker.on_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.on_failure() # one failure is enough while half open
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+class _Response:
+    status = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    async def json(self):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Session:
+    closed = False
+
+    def __init__(self, body):
+        self.body = body
+        self.gets = 0
+
+    def get(self, url, **kwargs):
+        self.gets += 1
+        return _Response(self.body)
+
+
+def test_jupiter_list_is_downloaded_once_and_looked_up_in_memory():
+    async def run():
+        tokens = JupiterTokenList()
+        session = _Session([{"address": "mint1", "symbol": "ONE", "name": "One", "decimals": 6}])
+        router = MetadataRouter(providers=[Provider("jupiter", tokens.fetch, ready=tokens.ready)])
+        router.session = session
+        assert router.ranked(session) == [] # not loaded yet, so not in the running
+        await tokens._task
+        results = [await router.resolve("mint1"), await router.resolve("mint2"), await router.resolve("mint1")]
+        return results, session.gets
+
+    results, gets = asyncio.run(run())
+    assert results == [{"symbol": "ONE", "name": "One", "decimals": 6}, None, {"symbol": "ONE", "name": "One", "decimals": 6}]
+    assert gets == 1
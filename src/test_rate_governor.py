@@ -0,0 +1,57 @@
+import asyncio
+import time
+from rate_governor import TokenBucket, LIVE, BACKFILL, HISTORICAL, MIN_RATE
+
+
+def test_try_acquire_spends_the_burst():
+    bucket = TokenBucket("test", rate=0.001, burst=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_live_goes_before_queued_background_work():
+    async def run():
+        bucket = TokenBucket("test", rate=200, burst=1)
+        bucket.tokens = 0
+        order = []
+
+        async def request(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        # queued in this order, all before the first token is free
+        await asyncio.gather(
+            request("historical", HISTORICAL),
+            request("backfill 1", BACKFILL),
+            request("backfill 2", BACKFILL),
+            request("live", LIVE)
+        )
+        return order
+
+    assert asyncio.run(run()) == ["live", "backfill 1", "backfill 2", "historical"]
+
+
+def test_throttling_halves_the_rate_and_success_climbs_back():
+    bucket = TokenBucket("test", rate=4, burst=4)
+    bucket.on_throttled()
+    assert bucket.rate == 2
+    assert bucket.tokens <= 0
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate == 4 # never above where it started
+    for _ in range(20):
+        bucket.on_throttled()
+    assert bucket.rate == MIN_RATE
+
+
+def test_retry_after_pauses_the_bucket():
+    async def run():
+        bucket = TokenBucket("test", rate=1000, burst=5)
+        bucket.on_throttled(retry_after=0.2)
+        assert not bucket.try_acquire()
+        started = time.monotonic()
+        await bucket.acquire(LIVE)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.19
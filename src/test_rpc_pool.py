@@ -0,0 +1,147 @@
+import asyncio
+import random
+import time
+import rpc_pool
+from rpc_pool import RpcPool, Endpoint, EJECT_MIN_SAMPLES
+from rate_governor import BACKFILL
+
+
+class FakePool(RpcPool):
+    """no network, each url answers after a set delay or fails"""
+
+    def __init__(self, behaviour):
+        super().__init__(http_urls=list(behaviour), ws_urls=["ws://fake"])
+        self.behaviour = behaviour # url -> (delay, ok)
+        self.sent = []
+
+    def endpoint(self, url):
+        return next(e for e in self.http if e.url == url)
+
+    async def _send(self, endpoint, payload, priority=None, wait=True):
+        self.sent.append(endpoint.url)
+        delay, ok = self.behaviour[endpoint.url]
+        started = time.monotonic()
+        await asyncio.sleep(delay)
+        if not ok:
+            endpoint.record(False)
+            raise ConnectionError(endpoint.url)
+        endpoint.record(True, time.monotonic() - started)
+        return endpoint.url
+
+
+def warm(endpoint, latency, samples=20):
+    for _ in range(samples):
+        endpoint.record(True, latency)
+
+
+def best_first(monkeypatch):
+    # the weighted pick always lands on the top score, so the test knows which endpoint is primary
+    monkeypatch.setattr(rpc_pool.random, "choices", lambda candidates, weights: [
+        max(zip(weights, candidates), key=lambda pair: pair[0])[1]
+    ])
+
+
+def test_score_prefers_fast_and_healthy():
+    fast, slow, flaky = Endpoint("fast"), Endpoint("slow"), Endpoint("flaky")
+    warm(fast, 0.05)
+    warm(slow, 0.5)
+    warm(flaky, 0.05)
+    for _ in range(5):
+        flaky.record(False)
+    assert fast.score > slow.score
+    assert fast.score > flaky.score
+    assert Endpoint("new").score > 0 # unknown endpoints still get some traffic
+
+
+def test_pick_sends_most_traffic_to_the_best_endpoint():
+    pool = FakePool({"fast": (0, True), "slow": (0, True)})
+    warm(pool.endpoint("fast"), 0.02)
+    warm(pool.endpoint("slow"), 0.2)
+    random.seed(1)
+    picks = [pool._pick(pool.http).url for _ in range(1000)]
+    assert picks.count("fast") > 800
+    assert picks.count("slow") > 0 # the slow one isn't starved, it can still recover
+
+
+def test_failures_eject_and_the_endpoint_is_readmitted():
+    pool = FakePool({"bad": (0, True), "good": (0, True)})
+    bad = pool.endpoint("bad")
+    for _ in range(EJECT_MIN_SAMPLES - 1):
+        bad.record(False)
+    assert not bad.ejected # not enough samples yet
+    bad.record(False)
+    assert bad.ejected
+    assert not bad.results # readmitted later with a clean slate
+    assert {pool._pick(pool.http).url for _ in range(50)} == {"good"}
+
+    bad.ejected_until = time.monotonic() - 1
+    assert not bad.ejected
+    random.seed(2)
+    assert "bad" in {pool._pick(pool.http).url for _ in range(200)}
+
+
+def test_everything_ejected_still_picks_something():
+    pool = FakePool({"a": (0, True), "b": (0, True)})
+    for endpoint in pool.http:
+        endpoint.ejected_until = time.monotonic() + 60
+    assert pool._pick(pool.http) is not None
+
+
+def test_hedges_to_a_second_endpoint_past_the_primary_p95(monkeypatch):
+    best_first(monkeypatch)
+
+    async def run():
+        pool = FakePool({"stalled": (1.0, True), "backup": (0, True)})
+        warm(pool.endpoint("stalled"), 0.05) # p95 of 50ms, looks like the best endpoint
+        warm(pool.endpoint("backup"), 0.2)
+        started = time.monotonic()
+        result = await pool.request_raw("getTransaction", [])
+        return pool, result, time.monotonic() - started
+
+    pool, result, elapsed = asyncio.run(run())
+    assert pool.sent == ["stalled", "backup"]
+    assert result == "backup"
+    assert elapsed < 0.5 # didn't wait the stalled endpoint out
+
+
+def test_no_hedge_when_the_primary_is_within_its_p95(monkeypatch):
+    best_first(monkeypatch)
+
+    async def run():
+        pool = FakePool({"primary": (0.01, True), "backup": (0, True)})
+        warm(pool.endpoint("primary"), 0.1)
+        warm(pool.endpoint("backup"), 0.5)
+        return pool, await pool.request_raw("getTransaction", [])
+
+    pool, result = asyncio.run(run())
+    assert result == "primary"
+    assert pool.sent == ["primary"]
+
+
+def test_background_requests_never_hedge(monkeypatch):
+    best_first(monkeypatch)
+
+    async def run():
+        pool = FakePool({"stalled": (0.3, True), "backup": (0, True)})
+        warm(pool.endpoint("stalled"), 0.05)
+        warm(pool.endpoint("backup"), 0.2)
+        return pool, await pool.request_raw("getTransaction", [], priority=BACKFILL)
+
+    pool, result = asyncio.run(run())
+    assert result == "stalled"
+    assert pool.sent == ["stalled"]
+
+
+def test_fast_failure_retries_on_another_endpoint(monkeypatch):
+    best_first(monkeypatch)
+
+    async def run():
+        pool = FakePool({"broken": (0, False), "ok": (0, True)})
+        warm(pool.endpoint("broken"), 0.05)
+        warm(pool.endpoint("ok"), 0.2)
+        return pool, await pool.request_raw("getTransaction", [])
+
+    pool, result = asyncio.run(run())
+    assert result == "ok"
+    assert pool.sent == ["broken", "ok"]
+    assert pool.endpoint("broken").results[-1] is False
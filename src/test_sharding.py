@@ -0,0 +1,41 @@
+from sharding import HashRing
+
+KEYS = [f"wallet{i}" for i in range(5000)]
+
+
+def owners(ring):
+    return {key: ring.owner(key) for key in KEYS}
+
+
+def test_empty_ring_owns_nothing():
+    assert HashRing().owner("wallet0") is None
+
+
+def test_member_order_doesnt_matter():
+    assert owners(HashRing(["a", "b", "c"])) == owners(HashRing(["c", "a", "b"]))
+
+
+def test_every_member_gets_a_share():
+    counts = {}
+    for owner in owners(HashRing(["a", "b", "c", "d"])).values():
+        counts[owner] = counts.get(owner, 0) + 1
+    assert set(counts) == {"a", "b", "c", "d"}
+    assert min(counts.values()) > len(KEYS) / 4 * 0.5
+
+
+def test_joining_member_only_takes_keys():
+    before = owners(HashRing(["a", "b", "c"]))
+    after = owners(HashRing(["a", "b", "c", "d"]))
+    moved = [key for key in KEYS if before[key] != after[key]]
+    # only keys that went to the new member moved, and about 1/4 of them
+    assert all(after[key] == "d" for key in moved)
+    assert len(KEYS) / 4 * 0.5 < len(moved) < len(KEYS) / 4 * 1.5
+
+
+def test_leaving_member_only_gives_up_its_own_keys():
+    before = owners(HashRing(["a", "b", "c", "d"]))
+    after = owners(HashRing(["a", "b", "c"]))
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert moved
+    assert all(before[key] == "d" for key in moved)
+    assert all(after[key] != "d" for key in KEYS)
@@ -0,0 +1,109 @@
+# lightweight async tracing (contextvars spans) and an on-demand sampling profiler
+import contextvars
+import functools
+import itertools
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+RECENT_SPANS = 5000 # finished spans kept for the slowest-spans view
+
+current_span = contextvars.ContextVar("current_span", default=None)
+_ids = itertools.count(1)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "duration", "attrs")
+
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.span_id = next(_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id # root span starts a trace
+        self.start = time.perf_counter()
+        self.duration = None
+        self.attrs = attrs
+
+    def __repr__(self):
+        attrs = " ".join(f"{k}={v}" for k, v in self.attrs.items())
+        return f"{self.duration * 1000:8.1f}ms  {self.name} trace={self.trace_id} {attrs}".rstrip()
+
+
+class Tracer:
+    def __init__(self, keep=RECENT_SPANS):
+        self.finished = deque(maxlen=keep) # ring buffer, oldest spans fall off
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """time a block as a child of whatever span is current in this task"""
+        span = Span(name, current_span.get(), attrs)
+        token = current_span.set(span)
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            current_span.reset(token)
+            self.finished.append(span)
+
+    def traced(self, name=None):
+        """decorator version of span() for coroutine functions"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def clear(self, keep=None):
+        """drop recorded spans, optionally resizing the ring (replay/load tests want every span)"""
+        self.finished = deque(maxlen=keep or self.finished.maxlen)
+
+    def slowest(self, n=20):
+        return sorted(self.finished, key=lambda s: s.duration, reverse=True)[:n]
+
+    def trace(self, trace_id):
+        """every recorded span from one trace, in start order"""
+        return sorted((s for s in self.finished if s.trace_id == trace_id), key=lambda s: s.start)
+
+
+class SamplingProfiler:
+    """samples one thread's python stack on a timer, output is collapsed stacks (flamegraph.pl / speedscope ready)"""
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+# create single shared tracer
+tracer = Tracer()
@@ -1,71 +1,92 @@
 import asyncio
 import json
+import os
 import websockets
 import logging
-from datetime import datetime
 import re
 from base58 import b58encode, b58decode
 import aiohttp
 from typing import Optional, Dict
-
-# set up logging
+import time
+from rpc_pool import rpc_pool
+from metadata_router import metadata_router
+from metrics import metrics, metrics_port, V2_BOT_PORT_OFFSET
+from latency import latency_tracker
+from rate_governor import HISTORICAL
+from tracing import tracer
+from hotlog import HotLogger, FrameRing
+from recorder import recorder
+from shutdown import SHUTDOWN_DEADLINE, save_snapshot, load_snapshot, within, on_stop_signal
+
+WS_QUEUE_SIZE = 1000 # frames read ahead of the handler, past this recv waits for it
+TOKEN_LIST_REFRESH = 3600 # a token list snapshot older than this is refreshed in the background
+LATENCY_PENDING = 1000 # swaps waiting for their block time, past this latency samples are skipped
+BLOCK_TIME_CACHE = 2048 # slots whose block time we remember
+
+WS_FRAMES = metrics.counter("solspear_ws_frames_total", "websocket frames received")
+WS_RECONNECTS = metrics.counter("solspear_ws_reconnects_total", "websocket reconnects")
+WS_QUEUE_DEPTH = metrics.gauge("solspear_ws_handler_queue_depth", "frames waiting for the handler")
+METADATA_CACHE = metrics.counter("solspear_token_metadata_cache_total", "token metadata cache lookups", ("result",))
+
+# set up logging (LOG_LEVEL=DEBUG turns on the sampled per-frame records)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
+frame_log = HotLogger("solspear.ws")
 
 
 async def get_token_metadata(token_address: str) -> Optional[Dict]:
-    """Get token metadata from DexScreener API"""
-    url = f"https://api.dexscreener.com/latest/dex/tokens/{token_address}"
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get("pairs") and len(data["pairs"]) > 0:
-                        token_info = data["pairs"][0]
-                        base_token = token_info.get("baseToken", {})
-                        quote_token = token_info.get("quoteToken", {})
-
-                        token_data = (
-                            base_token
-                            if base_token.get("address").lower()
-                            == token_address.lower()
-                            else quote_token
-                        )
-
-                        return {
-                            "address": token_address,
-                            "symbol": token_data.get("symbol", "Unknown"),
-                            "name": token_data.get("name", "Unknown Token"),
-                            "decimals": int(token_data.get("decimals", 9)),
-                        }
-                return None
-    except Exception as e:
-        logging.error(f"Error fetching token info: {e}")
+    """Get token metadata from the fastest healthy provider (DexScreener, Jupiter, Solscan, on-chain)"""
+    metadata = await metadata_router.resolve(token_address)
+    if not metadata:
         return None
+    return {"address": token_address, "name": "Unknown Token", **metadata}
 
 
 class WalletMonitor:
     def __init__(self):
-        self.ws_url = "wss://api.mainnet-beta.solana.com"
+        # websocket + http endpoints come from the shared pool (SOLANA_WS_URLS / SOLANA_RPC_URLS)
+        self.rpc_pool = rpc_pool
+        self.ws_endpoint = None # url we're currently connected to
         # only hardcoded value - our test wallet
         self.wallet = "Ei4NiwbXE1FdjpZbtBoHk83CoLSGBdspRNtGHb1vhcgo"
         # cache token metadata to avoid repeated RPC calls
         self.token_metadata_cache = {}
+        # frames waiting for the handler, bounded so a slow handler can't eat all our memory
+        self.frame_queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        # last raw frames, dumped to disk when handling one blows up
+        self.frame_ring = FrameRing()
         self.reconnect_delay = 5  # initial reconnect delay in seconds
         self.max_reconnect_delay = 60  # maximum reconnect delay
-        # Add Jupiter API endpoint
-        self.jupiter_api = "https://token.jup.ag/all"
-        # Add Solscan API endpoint
-        self.solscan_api = "https://public-api.solscan.io/token/meta"
+        self.websocket = None # current connection, shutdown closes it
+        # swaps waiting for a block time so their latency can be recorded, resolved off the handler's path
+        self.latency_pending = asyncio.Queue(maxsize=LATENCY_PENDING)
+        self.latency_task = None
+        self.block_times = {} # slot -> block time, oldest first
+        self.stopping = False # set by shutdown(), no more reconnects
 
     async def initialize(self):
-        """Initialize the wallet monitor by fetching token list"""
+        """Initialize the wallet monitor, from the last run's snapshot if there's a fresh one, else the token list"""
+        cache, age = load_snapshot("token_metadata")
+        if cache:
+            self.token_metadata_cache.update(cache)
+            logging.info(f"restored {len(cache)} token metadata entries from the last run")
+            if age > TOKEN_LIST_REFRESH:
+                asyncio.create_task(self.fetch_token_list()) # warm now, fresh in a bit
+            return
         await self.fetch_token_list()
 
+    async def shutdown(self, monitor_task, deadline):
+        """stop reading, let the handler finish the queued frames (until the deadline) and snapshot the caches"""
+        self.stopping = True
+        if self.websocket:
+            await within(deadline, self.websocket.close(), "closing the websocket")
+        await within(deadline, monitor_task, "handling queued frames")
+        if self.latency_task:
+            self.latency_task.cancel() # measurements only
+        save_snapshot("token_metadata", self.token_metadata_cache)
+
     async def fetch_token_list(self):
         """Fetch token list from Jupiter or Solana token list"""
         try:
@@ -121,7 +142,9 @@ class WalletMonitor:
         """Get token metadata using multiple sources"""
         # Check cache first
         if mint_address in self.token_metadata_cache:
+            METADATA_CACHE.inc(result="hit")
             return self.token_metadata_cache[mint_address]
+        METADATA_CACHE.inc(result="miss")
 
         # Handle wrapped SOL
         if mint_address == "So11111111111111111111111111111111111111112":
@@ -138,74 +161,10 @@ class WalletMonitor:
         return {"symbol": "Unknown", "decimals": 9}
 
     async def _try_multiple_sources(self, mint_address: str) -> Optional[Dict]:
-        """Try multiple sources to get token metadata"""
-        try:
-            # Try Jupiter API first
-            async with aiohttp.ClientSession() as session:
-                # Try Jupiter token list
-                async with session.get(f"{self.jupiter_api}") as response:
-                    if response.status == 200:
-                        tokens = await response.json()
-                        for token in tokens:
-                            if token.get("address") == mint_address:
-                                return {
-                                    "symbol": token.get("symbol", "Unknown"),
-                                    "decimals": token.get("decimals", 9),
-                                }
-
-                # If Jupiter fails, try Solscan
-                headers = {"accept": "application/json"}
-                async with session.get(
-                    f"{self.solscan_api}/{mint_address}", headers=headers
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get("success", False):
-                            return {
-                                "symbol": data.get("symbol", "Unknown"),
-                                "decimals": data.get("decimals", 9),
-                            }
-
-                # If both fail, try on-chain metadata as last resort
-                return await self._get_onchain_metadata(mint_address)
-
-        except Exception as e:
-            logging.error(f"Error fetching token metadata from APIs: {e}")
-            return None
-
-    async def _get_onchain_metadata(self, mint_address: str) -> Optional[Dict]:
-        """Get token metadata from on-chain data"""
-        try:
-            token_info_request = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "getAccountInfo",
-                "params": [mint_address, {"encoding": "jsonParsed"}],
-            }
-
-            async with websockets.connect(self.ws_url) as ws:
-                await ws.send(json.dumps(token_info_request))
-                response = await ws.recv()
-                data = json.loads(response)
-
-                if (
-                    "result" in data
-                    and data["result"]
-                    and "value" in data["result"]
-                    and "data" in data["result"]["value"]
-                    and "parsed" in data["result"]["value"]["data"]
-                ):
-
-                    token_data = data["result"]["value"]["data"]["parsed"]
-                    return {
-                        "symbol": token_data["info"].get("symbol", "Unknown"),
-                        "decimals": token_data["info"].get("decimals", 9),
-                    }
-
-        except Exception as e:
-            logging.error(f"Error fetching on-chain metadata: {e}")
-            return None
-
+        """Try multiple sources to get token metadata, ranked by latency and success rate"""
+        metadata = await metadata_router.resolve(mint_address)
+        if metadata:
+            return {"symbol": metadata["symbol"], "decimals": metadata["decimals"]}
         return None
 
     def extract_token_addresses(self, logs):
@@ -270,8 +229,8 @@ class WalletMonitor:
                     
                     if source_token and destination_token:
                         # Get metadata for both tokens
-                        token_in_meta = await get_token_metadata(source_token)
-                        token_out_meta = await get_token_metadata(destination_token)
+                        token_in_meta = await self.get_token_metadata(source_token)
+                        token_out_meta = await self.get_token_metadata(destination_token)
                         
                         if token_in_meta and token_out_meta:
                             amount_in, amount_out = self.parse_swap_amounts(swap_info)
@@ -288,15 +247,15 @@ class WalletMonitor:
 
             # Check for Jupiter swap
             if "JUP6LkbZbjS1jKKwapdHNy74zcZ3tLUZoi5QNyVTaV4" in str(logs):
-                logging.info("Found Jupiter swap")
+                logging.debug("Found Jupiter swap")
                 token_addresses = self.extract_token_addresses(logs)
                 
                 if len(token_addresses) >= 2:
-                    token_in_meta = await get_token_metadata(token_addresses[0])
-                    token_out_meta = await get_token_metadata(token_addresses[1])
+                    token_in_meta = await self.get_token_metadata(token_addresses[0])
+                    token_out_meta = await self.get_token_metadata(token_addresses[1])
                     
                     if token_in_meta and token_out_meta:
-                        logging.info(f"Jupiter - Token metadata - In: {token_in_meta}, Out: {token_out_meta}")
+                        logging.debug("Jupiter - Token metadata - In: %s, Out: %s", token_in_meta, token_out_meta)
                         
                         # Try to find amounts in logs
                         amount_in = 0
@@ -323,53 +282,140 @@ class WalletMonitor:
 
     async def handle_messages(self, websocket):
         """Process incoming websocket messages"""
+        # recv keeps reading (and answering pings) while the handler works through the queue
+        handler = asyncio.create_task(self._process_frames())
         try:
             while True:
                 try:
                     message = await websocket.recv()
-                    data = json.loads(message)
-                    
-                    # log raw data for debugging
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    logging.info(f"[{timestamp}] received update: {data}")
-                    
-                    if 'method' in data and data['method'] == 'logsNotification':
-                        logs = data.get('params', {}).get('result', {}).get('value', {}).get('logs', [])
-                        swap = await self.parse_swap_details(logs)
-                        if swap:
-                            print(f"swapped on {swap['dex']} {swap['amount_in']:.3f} {swap['token_in']} to {swap['amount_out']:.3f} {swap['token_out']}")
-                        
+                    WS_FRAMES.inc()
+                    received_at = time.time()
+                    self.frame_ring.append(message, received_at)
+                    if recorder.enabled:
+                        recorder.ws(message)
+                    # full queue = stop reading until the handler catches up, frames wait in the socket, none are lost
+                    await self.frame_queue.put((message, received_at))
+                    WS_QUEUE_DEPTH.set(self.frame_queue.qsize())
+
                 except websockets.exceptions.ConnectionClosed:
-                    logging.warning("WebSocket connection closed, attempting to reconnect...")
+                    if not self.stopping:
+                        logging.warning("WebSocket connection closed, attempting to reconnect...")
                     raise
-                except json.JSONDecodeError as e:
-                    logging.error(f"Error decoding message: {e}")
-                    continue
-                except Exception as e:
-                    logging.error(f"Error processing message: {e}")
-                    continue
 
         except Exception as e:
+            if self.stopping:
+                raise # we closed it
             logging.error(f"WebSocket error: {e}")
+            if not isinstance(e, websockets.exceptions.ConnectionClosed):
+                self.frame_ring.dump(f"websocket error: {e!r}")
             raise
+        finally:
+            try:
+                if self.stopping and not handler.done():
+                    # shutting down: the handler works through what's queued (shutdown() bounds how long)
+                    await self.frame_queue.join()
+            finally:
+                # also when shutdown's deadline cancels us mid-join, or the handler outlives the connection
+                handler.cancel()
+
+    async def _process_frames(self):
+        """Decode and handle queued websocket frames"""
+        while True:
+            message, received_at = await self.frame_queue.get()
+            WS_QUEUE_DEPTH.set(self.frame_queue.qsize())
+            try:
+                with tracer.span("handle_messages.frame"):
+                    await self._handle_frame(message, received_at)
+            finally:
+                # a frame cancelled halfway still counts as done, or join() waits on it forever
+                self.frame_queue.task_done()
+
+    async def _handle_frame(self, message, received_at):
+        """Decode and handle a single websocket frame"""
+        try:
+            data = json.loads(message)
+            
+            # sampled and only at debug, the raw frame itself is in the ring if we need it
+            if frame_log.enabled():
+                frame_log.log(
+                    "ws.frame", method=data.get('method'), bytes=len(message),
+                    slot=data.get('params', {}).get('result', {}).get('context', {}).get('slot'),
+                    lag_ms=round((time.time() - received_at) * 1000, 1)
+                )
+            
+            if 'method' in data and data['method'] == 'logsNotification':
+                logs = data.get('params', {}).get('result', {}).get('value', {}).get('logs', [])
+                swap = await self.parse_swap_details(logs)
+                if swap:
+                    print(f"swapped on {swap['dex']} {swap['amount_in']:.3f} {swap['token_in']} to {swap['amount_out']:.3f} {swap['token_out']}")
+                    slot = data.get('params', {}).get('result', {}).get('context', {}).get('slot')
+                    self.record_latency(slot, received_at, delivered_at=time.time())
+                
+        except json.JSONDecodeError as e:
+            logging.error(f"Error decoding message: {e}")
+            self.frame_ring.dump("undecodable frame")
+        except Exception as e:
+            logging.error(f"Error processing message: {e}")
+            self.frame_ring.dump(f"handler error: {e!r}")
+
+    def record_latency(self, slot, received_at, delivered_at):
+        """Queue a websocket event's block time -> detection -> output latency, never waits on the rpc"""
+        if slot is None:
+            return
+        try:
+            self.latency_pending.put_nowait((slot, received_at, delivered_at, self.ws_endpoint))
+        except asyncio.QueueFull:
+            return # block time lookups are behind, skip the sample rather than slow anything down
+        if self.latency_task is None or self.latency_task.done():
+            self.latency_task = asyncio.create_task(self._resolve_latency())
+
+    async def _resolve_latency(self):
+        """Look up block times for queued events (once per slot) and record their latency"""
+        while not self.latency_pending.empty():
+            slot, received_at, delivered_at, endpoint = self.latency_pending.get_nowait()
+            block_time = self.block_times.get(slot)
+            if block_time is None:
+                try:
+                    block_time = await self.rpc_pool.request("getBlockTime", [slot], hedge=False, priority=HISTORICAL)
+                except Exception as e:
+                    logging.debug(f"no block time for slot {slot}: {e}")
+                    continue
+                self.block_times[slot] = block_time
+                if len(self.block_times) > BLOCK_TIME_CACHE:
+                    del self.block_times[next(iter(self.block_times))]
+            latency_tracker.record_event(
+                {"block_time": block_time, "detected_at": received_at, "path": "websocket", "endpoint": endpoint},
+                delivered_at=delivered_at
+            )
 
     async def monitor_wallet(self):
         """Main monitoring loop with reconnection logic"""
         current_delay = self.reconnect_delay
         
-        while True:
+        while not self.stopping:
+            # pick the healthiest websocket endpoint each time we (re)connect
+            endpoint = self.rpc_pool.ws_endpoint()
             try:
+                started = time.monotonic()
                 async with websockets.connect(
-                    self.ws_url,
+                    endpoint.url,
                     ping_interval=30,  # send ping every 30 seconds
                     ping_timeout=10,   # wait 10 seconds for pong response
                     close_timeout=10   # wait 10 seconds for close frame
                 ) as websocket:
-                    print("Connected to Solana network")
+                    self.websocket = websocket
+                    endpoint.record(True, time.monotonic() - started)
+                    self.ws_endpoint = endpoint.url
+                    print(f"Connected to Solana network ({endpoint.url})")
+                    current_delay = self.reconnect_delay
                     await self.subscribe_to_wallet(websocket)
                     await self.handle_messages(websocket)
                     
             except Exception as e:
+                if self.stopping:
+                    return
+                endpoint.record(False)
+                WS_RECONNECTS.inc()
                 logging.error(f"Connection error: {e}")
                 print(f"Reconnecting in {current_delay} seconds...")
                 await asyncio.sleep(current_delay)
@@ -377,14 +423,29 @@ class WalletMonitor:
 
 
 async def main():
-    while True:  # Keep trying to run the monitor even if it fails
+    # SIGTERM/ctrl-c drain the monitor instead of killing it mid-frame
+    stop = asyncio.Event()
+    on_stop_signal(stop.set)
+    await metrics.serve(port=metrics_port(V2_BOT_PORT_OFFSET))
+    # one monitor for the whole run, restarting after a failure keeps its caches
+    monitor = WalletMonitor()
+    await monitor.initialize()
+    stopped = asyncio.create_task(stop.wait())
+    while not stop.is_set():  # Keep trying to run the monitor even if it fails
+        task = asyncio.create_task(monitor.monitor_wallet())
+        await asyncio.wait({task, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        if stop.is_set():
+            logging.info("shutting down wallet monitor...")
+            await monitor.shutdown(task, time.monotonic() + SHUTDOWN_DEADLINE)
+            break
         try:
-            monitor = WalletMonitor()
-            await monitor.initialize()
-            await monitor.monitor_wallet()
+            task.result()
         except Exception as e:
             logging.error(f"Fatal error in main loop: {e}")
-            await asyncio.sleep(5)  # Wait before restarting the entire monitor
+            await asyncio.sleep(5)  # Wait before restarting the monitor
+    await rpc_pool.close()
+    await metadata_router.close()
+    await metrics.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+# standalone ingestion worker - run N of these next to bot.py (with INGESTION_MODE=workers)
+# each one polls only the wallets its shard of the hash ring owns and queues alerts in the outbox
+import asyncio
+import os
+import socket
+import uuid
+from dotenv import load_dotenv
+from rpc_pool import rpc_pool, PooledClient  # solana rpc endpoint pool
+from database.db import db
+from poller import WalletPoller
+from sharding import WorkerMembership
+from metrics import metrics, metrics_port, POLL_TICK_SECONDS, WORKER_PORT_OFFSET
+from decode_pool import decode_pool
+from backfill import Backfiller
+from shutdown import on_stop_signal
+
+# load environment variables from .env file
+load_dotenv()
+
+POLL_INTERVAL = 10 # seconds between polls, same as the bot's loop
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', 0)) # 0, 1, 2... per worker on a host, picks its metrics port
+
+
+async def run_worker():
+    worker_id = os.getenv('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    await db.connect()
+    await metrics.serve(port=metrics_port(WORKER_PORT_OFFSET + WORKER_INDEX)) # before joining the ring, it fails on a port clash
+    membership = WorkerMembership(worker_id)
+    await membership.start()
+    poller = WalletPoller(PooledClient(rpc_pool))
+    # workers share the backfill jobs too, claims keep them from doubling up
+    backfill_task = asyncio.create_task(Backfiller(poller.solana).run())
+    print(f"ingestion worker {worker_id} started")
+    members = None # ring membership the cursor cache was loaded for
+    # on SIGTERM/SIGINT the current poll finishes (alerts queued, cursors stored) before we leave the ring
+    stop = asyncio.Event()
+    on_stop_signal(stop.set)
+
+    try:
+        while not stop.is_set():
+            try:
+                tracked_wallets = await db.db.tracked_wallets.find({}).to_list(length=None)
+                # ownership is by address so everyone tracking the same wallet lands on one worker
+                owned = [w for w in tracked_wallets if membership.owns(w['wallet_address'])]
+                if membership.ring.members != members:
+                    # shard changed, cached cursors for wallets we just got may be stale
+                    members = membership.ring.members
+                    await poller.warm(owned)
+                with POLL_TICK_SECONDS.time():
+                    await poller.poll(owned)
+            except Exception as e:
+                print(f"error in worker poll: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        backfill_task.cancel()
+        await membership.stop()
+        await rpc_pool.close()
+        decode_pool.close()
+        await db.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_worker())
+    except KeyboardInterrupt:
+        print("shutting down ingestion worker...")